@@ -0,0 +1,340 @@
+"""
+批量构建数据集：扫描目录下所有结构文件（.schem/.schematic/.litematic），用进程池并行执行 加载 → 解析 → 增强，
+每个任务先写入自己的分片数据集（shards/shard_NNNNN/），全部完成后按顺序合并到输出目录中的
+紧凑数据集（见 dataset_store.py），并生成 manifest.json。
+每个样本的相似度签名在工作进程中算出，合并后追加到 similarity.npy（见 similarity_index.py）。
+
+未改动的文件直接复用阶段缓存（见 stage_cache.py）中的变体，不再重新解析和增强。
+
+用法：python batch.py schem --output dataset --workers 8 --files-per-shard 16 [--append] [--dedup]
+      [--originals-only | --patch-size 10 --patch-stride 5 --min-occupancy 0.05] [--recompute-states]
+      [--cache-dir .schem_cache | --no-cache] [--profile trace.json --profile-top 5]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import profiling
+from dataset_store import DatasetStore, DatasetWriter, merge_stores
+from dedup_index import DEDUP_FILE, DedupIndex, canonical_digest, structure_digest
+from main import (apply_block_fixups, augment_grid, build_feature_lut, cache_salt, cache_variants, cached_variants,
+                  load_schematic_cached, validate_round_trip)
+from patches import DEFAULT_MIN_OCCUPANCY, iter_patches, patch_source
+from schematic_formats import schematic_extensions
+from similarity_index import SIGNATURE_DTYPE, SIMILARITY_FILE, SimilarityIndex, structure_signature
+from stage_cache import CACHE_DIR, DEFAULT_MAX_BYTES, StageCache
+
+MANIFEST_FILE = "manifest.json"
+SHARD_DIR = "shards"
+
+
+def find_schematics(root):
+    """递归查找 root 下所有支持格式的结构文件（.schem/.schematic/.litematic），返回排好序的路径列表。"""
+    extensions = schematic_extensions()
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        for file_name in filenames:
+            if file_name.lower().endswith(extensions):
+                paths.append(os.path.join(dirpath, file_name))
+    return sorted(paths)
+
+
+def build_shard(shard_id, paths, root, output_dir, validate=True, profile=False, profile_top=0, cache_dir=None,
+                originals_only=False, patches=None, recompute_states=False):
+    """
+    在工作进程中处理一组 .schem 文件，把所有变体写入同一个分片数据集。
+
+    单个文件出错时只记录错误，不影响同一分片中的其他文件。
+    validate 为 True 时对每个文件做往返检查（见 validate_round_trip），不一致的文件记为失败。
+    profile 为 True 时记录各阶段耗时，profile_top 为保存 cProfile 结果的最慢文件数（见 profiling.py）。
+    cache_dir 不为 None 时使用该目录中的阶段缓存；只有通过往返检查的变体会写入缓存。
+    originals_only 为 True 时只写入 'original' 变体（旋转/镜像留给训练时的 dataset_loader 生成）。
+    patches 为 (边长, 步长, 最低占比) 时把每个文件切成立方体窗口写入（见 patches.py），不做增强，
+    每个窗口的来源记为 文件名@x,y,z，按窗口内容去重。
+    recompute_states 为 True 时对每个变体（或窗口）按相邻方块重算楼梯 shape 和栅栏/玻璃板连接（见 block_states.py）。
+    返回分片的元数据（样本列表、相似度签名、失败列表、方块数、缓存命中的文件数、耗时和追踪数据），
+    不返回数组本身，避免在进程间传输大量数据。
+    """
+    start = time.perf_counter()
+    shard_path = os.path.join(output_dir, SHARD_DIR, f"shard_{shard_id:05d}")
+    samples = []
+    signatures = []
+    failures = []
+    digests = {}
+    voxels = 0
+    cached = 0
+    profiler = profiling.Profiler(profile_top) if profile else None
+    cache = StageCache(cache_dir, salt=cache_salt(recompute_states)) if cache_dir else None
+
+    with profiling.activate(profiler), DatasetWriter(shard_path, append=False) as writer:
+        for path in paths:
+            source = os.path.relpath(path, root)
+            try:
+                # 流程中的提示信息在批量模式下没有意义，直接丢弃
+                with contextlib.redirect_stdout(io.StringIO()), profiling.file(source) as info:
+                    key = None if cache is None else cache.key(path)
+                    variants = None if patches else cached_variants(cache, key)
+                    check = None
+                    if variants is not None:
+                        cached += 1
+                        info["voxels"] = int(np.prod(variants[0][1].shape[:3]))
+                    else:
+                        grid = load_schematic_cached(path, cache)
+                        info["voxels"] = len(grid)
+                        with profiling.stage("fixups", source) as stage:
+                            stage["voxels"] = len(grid)
+                            grid = apply_block_fixups(grid)
+                        lut = build_feature_lut(grid.palette)
+                        # 切窗口时不对整个建筑做增强，往返检查只检查 schem 部分
+                        variants = None if patches else augment_grid(grid, lut=lut, with_names=True,
+                                                                     recompute_states=recompute_states)
+                        if validate:
+                            with profiling.stage("validate", source) as stage:
+                                stage["voxels"] = len(grid)
+                                check = validate_round_trip(grid, variants[0][1] if variants else None, lut,
+                                                            recompute_states=recompute_states)
+                            if check["ok"] and variants:
+                                cache_variants(cache, key, variants)
+            except Exception as e:
+                failures.append({"source": source, "error": f"{type(e).__name__}: {e}"})
+                continue
+            if check is not None and not check["ok"]:
+                failures.append({"source": source, "error": f"往返检查不一致: {check['counts']}",
+                                 "mismatches": check["mismatches"]})
+                continue
+
+            with profiling.stage("write", source) as info:
+                if patches:
+                    size, stride, min_occupancy = patches
+                    entries = ((patch_source(source, origin), "original", patch)
+                               for origin, patch in iter_patches(grid, size, stride, min_occupancy, lut,
+                                                                 recompute_states=recompute_states))
+                else:
+                    digests[source] = canonical_digest(structure for _, structure in variants)
+                    if originals_only:
+                        variants = variants[:1]
+                    entries = ((source, transform, structure) for transform, structure in variants)
+                info["voxels"] = 0
+                for sample_source, transform, structure in entries:
+                    if patches:
+                        digests[sample_source] = structure_digest(structure)
+                    writer.add(structure, sample_source, transform)
+                    signatures.append(structure_signature(structure))
+                    samples.append({
+                        "source": sample_source,
+                        "transform": transform,
+                        "shape": list(structure.shape[:3]),
+                    })
+                    info["voxels"] += int(np.prod(structure.shape[:3]))
+            voxels += info["voxels"]
+
+    return {
+        "shard": shard_path,
+        "samples": samples,
+        "signatures": np.array(signatures, dtype=SIGNATURE_DTYPE),
+        "failures": failures,
+        "digests": digests,
+        "voxels": voxels,
+        "cached": cached,
+        "seconds": time.perf_counter() - start,
+        "profile": profiler.to_dict() if profiler is not None else None,
+    }
+
+
+def read_manifest(output_dir):
+    """读取 output_dir 中已有的 manifest，不存在时返回 None。"""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def merge_manifest(previous, manifest):
+    """
+    把本次运行的 manifest 合并到追加前已有的 manifest：样本、失败和重复文件接在已有记录之后，
+    文件数、分片数和缓存命中数累加；source_dir、workers、耗时和吞吐量为本次运行的值。
+    """
+    merged = dict(manifest)
+    for key in ("samples", "failures", "duplicates"):
+        merged[key] = previous.get(key, []) + manifest[key]
+    for key in ("files", "shards", "cached"):
+        merged[key] = previous.get(key, 0) + manifest[key]
+    return merged
+
+
+def write_manifest(output_dir, manifest):
+    """先写临时文件再替换，中途出错时不会留下不完整的 manifest。"""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def build_dataset(root, output_dir, workers=None, files_per_shard=16, append=False, dedup=False, validate=True,
+                  profile=None, profile_top=0, cache_dir=CACHE_DIR, cache_max_bytes=DEFAULT_MAX_BYTES,
+                  originals_only=False, patch_size=None, patch_stride=None, min_occupancy=DEFAULT_MIN_OCCUPANCY,
+                  recompute_states=False):
+    """
+    并行处理 root 下的所有 .schem 文件，合并为 output_dir 中的数据集并写入 manifest，返回本次运行的 manifest 字典。
+
+    manifest 中每个样本的 index 即它在数据集中的下标。追加时写入的 manifest 保留之前各次运行的样本、
+    失败和重复文件（见 merge_manifest）。
+
+    workers: 工作进程数，默认使用全部 CPU 核心；为 1 时在当前进程中顺序执行
+    files_per_shard: 每个分片（也是每个任务）包含的 .schem 文件数
+    append: 为 True 时追加到 output_dir 中已有的数据集，否则覆盖
+    dedup: 为 True 时跳过与数据集中已有结构（含旋转/镜像）重复的文件。
+           无论是否去重，写入的结构都会记录在 output_dir/dedup.bin 中，追加运行时继续生效
+    validate: 为 True 时对每个文件做往返检查，不一致的文件不写入数据集并记为失败
+    profile: Chrome trace JSON 的输出路径，设置后记录每个文件各阶段的墙钟时间、CPU 时间、峰值 RSS
+             和体素数；默认读取环境变量 SCHEM_PROFILE
+    profile_top: 对最慢的这么多个文件保存 cProfile 结果，默认读取环境变量 SCHEM_PROFILE_TOP
+    cache_dir: 阶段缓存目录，内容、流程版本、方块注册表、旧格式 ID 对照表和 recompute_states 都未变的文件直接复用缓存的变体；None 表示不使用缓存
+    cache_max_bytes: 缓存大小上限，运行结束后删除最久未使用的条目
+    originals_only: 为 True 时每个文件只写入 'original' 变体，训练时用 dataset_loader 随机旋转/镜像；
+                    去重仍然考虑全部变体
+    patch_size: 设置后把每个文件切成 patch_size³ 的立方体窗口写入，步长为 patch_stride（默认等于 patch_size），
+                非空气方块占比低于 min_occupancy 的窗口跳过；窗口不做增强，训练时由 dataset_loader 随机旋转/镜像
+    recompute_states: 为 True 时对每个变体（或窗口）按相邻方块重算楼梯 shape 和栅栏/玻璃板连接
+    """
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    previous = read_manifest(output_dir) if append else None
+    paths = find_schematics(root)
+    chunks = [paths[i:i + files_per_shard] for i in range(0, len(paths), files_per_shard)]
+    workers = workers or os.cpu_count() or 1
+    profile = profile or os.environ.get(profiling.PROFILE_ENV)
+    profile_top = profile_top or int(os.environ.get(profiling.PROFILE_TOP_ENV, "0"))
+    profiler = profiling.Profiler(profile_top) if profile else None
+    patches = (patch_size, patch_stride, min_occupancy) if patch_size else None
+    options = (validate, profiler is not None, profile_top, cache_dir, originals_only, patches, recompute_states)
+
+    results = []
+    if workers == 1:
+        for shard_id, chunk in enumerate(chunks):
+            results.append(build_shard(shard_id, chunk, root, output_dir, *options))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(build_shard, shard_id, chunk, root, output_dir, *options): chunk
+                       for shard_id, chunk in enumerate(chunks)}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    # 工作进程异常退出（如内存不足）或写分片失败时，把整组文件记为失败
+                    results.append({
+                        "shard": None, "samples": [], "signatures": np.zeros(0, dtype=SIGNATURE_DTYPE), "digests": {},
+                        "voxels": 0, "cached": 0, "seconds": 0.0, "profile": None,
+                        "failures": [{"source": os.path.relpath(path, root), "error": f"{type(e).__name__}: {e}"}
+                                     for path in futures[future]],
+                    })
+
+    # 按分片顺序合并，保证样本顺序与文件顺序一致，与进程完成的先后无关
+    results.sort(key=lambda result: result["shard"] or "")
+    merged = [result for result in results if result["shard"]]
+    duplicates = []
+    select = []
+    # 去重在主进程中按分片顺序进行，同一次运行中不同进程处理的重复文件也只保留第一个
+    with profiling.activate(profiler), DedupIndex(os.path.join(output_dir, DEDUP_FILE), reset=not append) as index:
+        for result in merged:
+            kept = {source for source, digest in result["digests"].items() if index.add(digest) or not dedup}
+            duplicates.extend(source for source in result["digests"] if source not in kept)
+            select.append([i for i, sample in enumerate(result["samples"]) if sample["source"] in kept])
+            result["samples"] = [result["samples"][i] for i in select[-1]]
+        with profiling.stage("merge") as info:
+            info["voxels"] = sum(result["voxels"] for result in merged)
+            starts = merge_stores([result["shard"] for result in merged], output_dir,
+                                  append=append, remove=True, select=select)
+    shutil.rmtree(os.path.join(output_dir, SHARD_DIR), ignore_errors=True)
+    samples = []
+    with SimilarityIndex(os.path.join(output_dir, SIMILARITY_FILE), reset=not append) as similarity:
+        if append and merged:
+            # 追加到没有签名文件的旧数据集时，先补算已有样本的签名
+            similarity.update(DatasetStore(output_dir), stop=starts[0])
+        for first, rows, result in zip(starts, select, merged):
+            signatures = result["signatures"][rows]
+            signatures["sample"] = np.arange(first, first + len(signatures))
+            similarity.add_signatures(signatures)
+            for offset, sample in enumerate(result["samples"]):
+                samples.append({"index": first + offset, **sample})
+
+    elapsed = time.perf_counter() - start
+    voxels = sum(result["voxels"] for result in results)
+    manifest = {
+        "source_dir": os.path.abspath(root),
+        "workers": workers,
+        "files": len(paths),
+        "shards": len(merged),
+        "samples": samples,
+        "failures": [failure for result in results for failure in result["failures"]],
+        "duplicates": duplicates,
+        "cached": sum(result["cached"] for result in results),
+        "seconds": elapsed,
+        "voxels_per_second": voxels / elapsed if elapsed > 0 else 0.0,
+    }
+    write_manifest(output_dir, merge_manifest(previous, manifest) if previous else manifest)
+    if cache_dir:
+        StageCache(cache_dir, cache_max_bytes).evict()
+
+    print(f"✅ 处理 {len(paths) - len(manifest['failures'])}/{len(paths)} 个文件，"
+          f"生成 {len(samples)} 个样本，写入 {output_dir}/，耗时 {elapsed:.2f} s")
+    if manifest["cached"]:
+        print(f"{manifest['cached']} 个文件未改动，直接使用缓存的变体")
+    if duplicates:
+        print(f"跳过 {len(duplicates)} 个与已有结构重复的{'窗口' if patch_size else '文件（含旋转/镜像）'}")
+    for failure in manifest["failures"]:
+        print(f"❌ {failure['source']}: {failure['error']}")
+    if profiler is not None:
+        for result in results:
+            if result["profile"] is not None:
+                profiler.merge(result["profile"])
+        profiler.save(profile)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量把结构文件（.schem/.schematic/.litematic）转换为增强后的训练数据")
+    parser.add_argument("schem_dir", help="包含结构文件的目录（递归查找）")
+    parser.add_argument("--output", default="dataset", help="输出目录，默认 dataset")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数，默认使用全部 CPU 核心")
+    parser.add_argument("--files-per-shard", type=int, default=16, help="每个分片包含的 .schem 文件数")
+    parser.add_argument("--append", action="store_true", help="追加到输出目录中已有的数据集，而不是覆盖")
+    parser.add_argument("--dedup", action="store_true", help="跳过与数据集中已有结构（含旋转/镜像）重复的文件")
+    parser.add_argument("--no-validate", action="store_true", help="不做往返检查")
+    parser.add_argument("--originals-only", action="store_true",
+                        help="只保存原始结构，旋转/镜像在训练时由 dataset_loader 生成")
+    parser.add_argument("--patch-size", type=int, default=None, help="把建筑切成这个边长的立方体窗口（如 10）")
+    parser.add_argument("--patch-stride", type=int, default=None, help="窗口步长，默认等于 --patch-size")
+    parser.add_argument("--min-occupancy", type=float, default=DEFAULT_MIN_OCCUPANCY,
+                        help="窗口中非空气方块的最低占比，低于该值的窗口跳过")
+    parser.add_argument("--recompute-states", action="store_true",
+                        help="按相邻方块重算每个变体（或窗口）中楼梯的 shape 和栅栏/玻璃板的连接方向")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help=f"阶段缓存目录，默认 {CACHE_DIR}")
+    parser.add_argument("--no-cache", action="store_true", help="不使用阶段缓存，所有文件都重新处理")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_BYTES / 2**20,
+                        help="阶段缓存大小上限（MiB），超过时删除最久未使用的条目")
+    parser.add_argument("--profile", default=None,
+                        help="记录各阶段耗时并写入这个 Chrome trace JSON 文件（也可用环境变量 SCHEM_PROFILE）")
+    parser.add_argument("--profile-top", type=int, default=0, help="对最慢的 N 个文件保存 cProfile 结果")
+    args = parser.parse_args(argv)
+    manifest = build_dataset(args.schem_dir, args.output, args.workers, args.files_per_shard,
+                             append=args.append, dedup=args.dedup, validate=not args.no_validate,
+                             profile=args.profile, profile_top=args.profile_top,
+                             cache_dir=None if args.no_cache else args.cache_dir,
+                             cache_max_bytes=int(args.cache_max_mb * 2**20), originals_only=args.originals_only,
+                             patch_size=args.patch_size, patch_stride=args.patch_stride,
+                             min_occupancy=args.min_occupancy, recompute_states=args.recompute_states)
+    return 1 if manifest["failures"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
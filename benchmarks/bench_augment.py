@@ -0,0 +1,59 @@
+"""
+D4 数据增强基准：对每个 .schem 计时 augment_grid（palette 级属性变换 + 下标网格旋转）
+和 augment_features（直接变换特征张量），并检查 WoodHouse_3 的结果与 npy/ 中的参考数据一致。
+
+用法：python benchmarks/bench_augment.py [schem 目录]
+"""
+import contextlib
+import io
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as pipeline
+
+
+def best_time(func, number):
+    """返回单次调用的最短平均耗时（秒）。"""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+def check_reference(schem_dir, npy_dir="npy"):
+    """WoodHouse_3 的前 4 个变体应与 npy/ 中的参考数据完全一致（旋转变体按修正后的 D4 属性表生成）。"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        grid = pipeline.apply_block_fixups(pipeline.load_schematic(os.path.join(schem_dir, "WoodHouse_3.schem")))
+        structures = pipeline.augment_grid(grid)
+    for i, structure in enumerate(structures[:4]):
+        reference = np.load(os.path.join(npy_dir, f"block_data_{i}.npy"))
+        assert np.array_equal(structure, reference), f"变体 {i} 与 {npy_dir}/block_data_{i}.npy 不一致"
+
+
+def bench_file(path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        grid = pipeline.apply_block_fixups(pipeline.load_schematic(path))
+        lut = pipeline.build_feature_lut(grid.palette)
+        features = pipeline.extract_features(grid, lut).transpose(2, 0, 1, 3)
+        number = 200 if len(grid) <= 10**4 else 1
+        t_grid = best_time(lambda: pipeline.augment_grid(grid, lut=lut), number)
+        t_features = best_time(lambda: pipeline.augment_features(features), number)
+
+    print(f"{os.path.basename(path):<20} {len(grid):>9} 方块  "
+          f"augment_grid {t_grid * 1e3:9.3f} ms  augment_features {t_features * 1e3:9.3f} ms  "
+          f"（8 个 D4 变换）")
+
+
+def main():
+    schem_dir = sys.argv[1] if len(sys.argv) > 1 else "schem"
+    check_reference(schem_dir)
+    for file_name in sorted(os.listdir(schem_dir)):
+        if file_name.endswith(".schem"):
+            bench_file(os.path.join(schem_dir, file_name))
+    print("✅ 增强结果与参考 npy 一致")
+
+
+if __name__ == "__main__":
+    main()
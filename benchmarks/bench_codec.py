@@ -0,0 +1,106 @@
+"""
+BlockData varint 编解码基准：对比原逐元素实现与 NumPy 向量化实现。
+
+用法：python benchmarks/bench_codec.py [schem 目录]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+from nbtlib import load
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import decode_block_data, encode_block_data
+
+
+def legacy_encode_block_data(decoded_data):
+    """原逐元素编码实现（只支持两字节 ID），作为正确性与速度基准。"""
+    encoded_data = []
+    for value in decoded_data:
+        if value <= 127:
+            encoded_data.append(value)
+        else:
+            negative_value = (value % 128) - 128
+            next_value = value // 128
+            if negative_value < -128 or negative_value > 127:
+                raise ValueError(f"编码值 {negative_value} 超出了 ByteArray 可接受范围")
+            if next_value < -128 or next_value > 127:
+                raise ValueError(f"增量值 {next_value} 超出了 ByteArray 可接受范围")
+            encoded_data.append(negative_value)
+            encoded_data.append(next_value)
+    return encoded_data
+
+
+def legacy_decode_block_data(block_data):
+    """原逐元素解码实现（只支持两字节 ID），作为正确性与速度基准。"""
+    decoded_data = []
+    i = 0
+    while i < len(block_data):
+        value = block_data[i]
+        if value == 127:
+            decoded_data.append(value)
+            i += 1
+        elif value < 0:
+            next_value = block_data[i + 1]
+            decoded_data.append((next_value + 1) * 128 + value)
+            i += 2
+        else:
+            decoded_data.append(value)
+            i += 1
+    return decoded_data
+
+
+def best_of(func, *args, repeat=3):
+    """返回多次运行中的最短耗时（秒）和最后一次的结果。"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_file(path):
+    block_data = load(path)['BlockData']
+    raw = [int(v) for v in block_data]
+
+    t_old_dec, old_decoded = best_of(legacy_decode_block_data, raw)
+    t_new_dec, new_decoded = best_of(decode_block_data, block_data)
+    assert np.array_equal(np.asarray(old_decoded), new_decoded), f"{path}: 解码结果不一致"
+
+    t_old_enc, old_encoded = best_of(legacy_encode_block_data, old_decoded)
+    t_new_enc, new_encoded = best_of(encode_block_data, new_decoded)
+    assert np.array_equal(np.asarray(old_encoded), new_encoded), f"{path}: 编码结果不一致"
+    assert np.array_equal(new_encoded, np.asarray(block_data)), f"{path}: 编码后与原始 BlockData 不一致"
+
+    name = os.path.basename(path)
+    print(f"{name:<20} {len(new_decoded):>9} 方块  "
+          f"解码 {t_old_dec * 1e3:9.2f} ms -> {t_new_dec * 1e3:7.2f} ms ({t_old_dec / t_new_dec:6.1f}x)  "
+          f"编码 {t_old_enc * 1e3:9.2f} ms -> {t_new_enc * 1e3:7.2f} ms ({t_old_enc / t_new_enc:6.1f}x)")
+
+
+def bench_large_palette(count=2_000_000, palette_size=70_000):
+    """合成超过 16384 项的 palette（需要三字节 varint），验证往返一致并计时。"""
+    rng = np.random.default_rng(0)
+    ids = rng.integers(0, palette_size, size=count, dtype=np.int64)
+    t_enc, encoded = best_of(encode_block_data, ids)
+    t_dec, decoded = best_of(decode_block_data, encoded)
+    assert np.array_equal(decoded, ids), "大 palette 往返不一致"
+    print(f"{'合成 palette=' + str(palette_size):<20} {count:>9} 方块  "
+          f"解码 {t_dec * 1e3:7.2f} ms  编码 {t_enc * 1e3:7.2f} ms（原实现不支持三字节 varint）")
+
+
+def main():
+    schem_dir = sys.argv[1] if len(sys.argv) > 1 else "schem"
+    for file_name in sorted(os.listdir(schem_dir)):
+        if file_name.endswith(".schem"):
+            bench_file(os.path.join(schem_dir, file_name))
+    bench_large_palette()
+    print("✅ 新旧实现在所有文件上结果一致")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+.schem 导出基准：对比原逐方块三重循环的 generate_schem 与向量化的 write_schem，
+检查 特征张量 → .schem → 特征张量 的往返结果一致，并测试批量导出速度。
+
+用法：python benchmarks/bench_export.py [schem 目录]
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from nbtlib import ByteArray, Compound, File, Int
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as pipeline
+
+
+def legacy_generate_schem(block_array, palette, width, height, length, filename):
+    """原实现：三重循环展开方块数组后编码，作为速度基准。"""
+    block_data = []
+    for y in range(height):
+        for z in range(length):
+            for x in range(width):
+                block_data.append(block_array[y, z, x])
+    schem_data = File(Compound({
+        'Palette': Compound({block: Int(id) for block, id in palette.items()}),
+        'PaletteMax': Int(len(palette)),
+        'BlockData': ByteArray(pipeline.encode_block_data(block_data)),
+        'Width': Int(width),
+        'Height': Int(height),
+        'Length': Int(length),
+        'Version': Int(1)
+    }))
+    with open(filename, 'wb') as f:
+        schem_data.write(f)
+
+
+def features_of(grid):
+    """返回 (X, Y, Z, 7) 的特征张量（与 npy 中的布局一致）。"""
+    return pipeline.extract_features(grid).transpose(2, 0, 1, 3)
+
+
+def bench_file(path, work_dir):
+    with contextlib.redirect_stdout(io.StringIO()):
+        grid = pipeline.load_schematic(path)
+        features = features_of(grid)
+    palette = {name: i for i, name in enumerate(grid.palette)}
+
+    start = time.perf_counter()
+    legacy_generate_schem(grid.blocks, palette, grid.width, grid.height, grid.length,
+                          os.path.join(work_dir, "legacy.schem"))
+    t_old = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pipeline.write_schem(grid, os.path.join(work_dir, "grid.schem"))
+    t_write = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = pipeline.decode_features(features)
+    pipeline.write_schem(decoded, os.path.join(work_dir, "new.schem"))
+    t_new = time.perf_counter() - start
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        restored = features_of(pipeline.load_schematic(os.path.join(work_dir, "new.schem")))
+    # 无法识别的方块（特征为 -1）导出为空气，其余位置必须完全一致
+    known = features[..., 0] != -1
+    assert np.array_equal(features[known], restored[known]), f"{path}: 往返后特征不一致"
+
+    name = os.path.basename(path)
+    print(f"{name:<20} {len(grid):>9} 方块  原 generate_schem（不压缩）{t_old * 1e3:9.1f} ms  "
+          f"write_schem（gzip）{t_write * 1e3:8.1f} ms  特征解码 + write_schem {t_new * 1e3:8.1f} ms")
+
+
+def bench_batch(work_dir, npy_dir="npy", count=200):
+    """把 npy 文件夹中的结构循环导出 count 次，报告每秒导出的结构数。"""
+    files = sorted(name for name in os.listdir(npy_dir) if name.endswith(".npy"))
+    if not files:
+        return
+    structures = [np.load(os.path.join(npy_dir, name)) for name in files]
+    structures = [structures[i % len(structures)] for i in range(count)]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        pipeline.export_structures(structures, os.path.join(work_dir, "batch"))
+    elapsed = time.perf_counter() - start
+    shape = "x".join(str(v) for v in structures[0].shape[:3])
+    print(f"批量导出 {count} 个 {shape} 结构：{elapsed:.2f} s，{count / elapsed:.0f} 个/秒")
+
+
+def main():
+    schem_dir = sys.argv[1] if len(sys.argv) > 1 else "schem"
+    with tempfile.TemporaryDirectory() as work_dir:
+        for file_name in sorted(os.listdir(schem_dir)):
+            if file_name.endswith(".schem"):
+                bench_file(os.path.join(schem_dir, file_name), work_dir)
+        bench_batch(work_dir)
+    print("✅ 导出后重新读取的特征与原特征一致")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+多格式加载基准：把 schem 目录中的每个 .schem 转换为 Sponge v3、Litematica（拆成两个区域，其中一个 Size 为负）
+和 MCEdit .schematic（按方块类别写入对应的旧版 ID 和 data），检查加载后的特征与原 .schem 一致，并记录加载耗时；
+另外对比 Litematica 位解包的逐项循环实现与 NumPy 实现。
+
+用法：python benchmarks/bench_formats.py [schem 目录]
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from nbtlib import ByteArray, Compound, File, Int, List, LongArray, Short, String
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as pipeline
+from schematic_formats import unpack_bits
+
+TYPES = pipeline.BLOCK_TYPE_MAP
+# 方块类别 -> 写入 .schematic 的旧版 ID
+LEGACY_IDS = {"log": 17, "planks": 5, "stairs": 53, "slab": 126, "fence": 85, "glass_pane": 102, "door": 64,
+              "grass_block": 2}
+# 特征中的 facing（north、east、south、west）-> 旧版楼梯 / 门下半格的 data
+STAIR_FACING = np.array([3, 0, 2, 1])
+DOOR_FACING = np.array([3, 0, 1, 2])
+
+
+def legacy_unpack_bits(words, bits, count):
+    """逐项循环解包（与 LitematicaBitArray.getAt 相同），作为正确性与速度基准。"""
+    words = [int(word) & (2**64 - 1) for word in words]
+    mask = (1 << bits) - 1
+    values = []
+    for i in range(count):
+        start = i * bits
+        word, offset = start >> 6, start & 63
+        value = words[word] >> offset
+        if offset + bits > 64:
+            value |= words[word + 1] << (64 - offset)
+        values.append(value & mask)
+    return values
+
+
+def pack_bits(values, bits):
+    """把值按 bits 位紧密排列成 long 数组（解包的逆运算，用 packbits 实现，与 unpack_bits 相互独立）。"""
+    stream = ((np.asarray(values, dtype=np.uint64)[:, None] >> np.arange(bits, dtype=np.uint64)) & 1).astype(np.uint8)
+    stream = np.append(stream.ravel(), np.zeros(-stream.size % 64, dtype=np.uint8))
+    return np.packbits(stream, bitorder="little").view("<u8").astype(np.int64)
+
+
+def block_entry(block_state):
+    """方块状态字符串 -> Litematica 调色板项。"""
+    name, _, properties = block_state.partition("[")
+    entry = {"Name": String(name)}
+    if properties:
+        entry["Properties"] = Compound({key: String(value) for key, value in
+                                        (prop.split("=", 1) for prop in properties.rstrip("]").split(","))})
+    return Compound(entry)
+
+
+def write_sponge_v3(grid, path):
+    """按 WorldEdit 的字段顺序写 Sponge v3：字段在 Schematic 中，Palette 和 Data 在 Schematic.Blocks 中。"""
+    File({"Schematic": Compound({
+        "Version": Int(3),
+        "DataVersion": Int(3953),
+        "Width": Short(grid.width),
+        "Height": Short(grid.height),
+        "Length": Short(grid.length),
+        "Blocks": Compound({
+            "Palette": Compound({block: Int(i) for i, block in enumerate(grid.palette)}),
+            "Data": ByteArray(pipeline.encode_block_data(grid.blocks.ravel())),
+            "BlockEntities": List[Compound]([]),
+        }),
+    })}).save(path, gzipped=True)
+
+
+def litematica_region(blocks, palette, position, size):
+    names, values = np.unique(blocks.ravel(), return_inverse=True)
+    bits = max(2, (len(names) - 1).bit_length())
+    return Compound({
+        "Position": Compound({axis: Int(v) for axis, v in zip("xyz", position)}),
+        "Size": Compound({axis: Int(v) for axis, v in zip("xyz", size)}),
+        "BlockStatePalette": List[Compound]([block_entry(palette[i]) for i in names]),
+        "BlockStates": LongArray(pack_bits(values, bits)),
+    })
+
+
+def write_litematica(grid, path):
+    """沿 x 拆成两个区域写 .litematic，第二个区域从最大角出发，Size 为负。"""
+    mid = grid.width // 2
+    height, length, width = grid.shape
+    File({
+        "Version": Int(6),
+        "Regions": Compound({
+            "west": litematica_region(grid.blocks[:, :, :mid], grid.palette, (0, 0, 0), (mid, height, length)),
+            "east": litematica_region(grid.blocks[:, :, mid:], grid.palette, (width - 1, height - 1, length - 1),
+                                      (mid - width, -height, -length)),
+        }),
+    }).save(path, gzipped=True)
+
+
+def write_mcedit(features, shape, path):
+    """按特征中的方块类别和属性写 .schematic（只有 LEGACY_IDS 中的类别，其余为空气）。"""
+    height, length, width = shape
+    types = features[..., 0]
+    attrs = features[..., 2:].astype(np.intp)
+    ids = np.zeros(shape, dtype=np.uint8)
+    data = np.zeros(shape, dtype=np.uint8)
+    for name, block_id in LEGACY_IDS.items():
+        ids[types == TYPES[name]] = block_id
+    log = types == TYPES["log"]
+    data[log] = np.array([4, 0, 8])[attrs[log, 0]]
+    stairs = types == TYPES["stairs"]
+    data[stairs] = STAIR_FACING[attrs[stairs, 0]] | attrs[stairs, 1] << 2
+    slab = types == TYPES["slab"]
+    data[slab] = attrs[slab, 0] << 3
+    lower = (types == TYPES["door"]) & (attrs[..., 1] == 0)
+    upper = (types == TYPES["door"]) & (attrs[..., 1] == 1)
+    data[lower] = DOOR_FACING[attrs[lower, 0]] | attrs[lower, 3] << 2
+    data[upper] = 8 | attrs[upper, 2] | attrs[upper, 4] << 1
+    File({"Schematic": Compound({
+        "Width": Short(width),
+        "Height": Short(height),
+        "Length": Short(length),
+        "Materials": String("Alpha"),
+        "Blocks": ByteArray(ids.ravel().view(np.int8)),
+        "Data": ByteArray(data.ravel().view(np.int8)),
+    })}).save(path, gzipped=True)
+    return lower, upper
+
+
+def check_mcedit(features, loaded, lower, upper):
+    """旧格式只保存方块类别和部分属性：逐类别比较能保存的通道。"""
+    types = features[..., 0]
+    expected = np.where(np.isin(types, [TYPES[name] for name in LEGACY_IDS]), types, TYPES["air"])
+    same = loaded[..., 0] == expected
+    checks = [(types == TYPES["log"], [2]), (types == TYPES["stairs"], [2, 3]), (types == TYPES["slab"], [2]),
+              (lower, [2, 3, 5]), (upper, [3, 4, 6])]
+    for mask, channels in checks:
+        same[mask] &= (loaded[mask][:, channels] == features[mask][:, channels]).all(axis=1)
+    return same.all()
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_file(path, work_dir):
+    t_schem, grid = timed(pipeline.load_schematic, path)
+    _, features = timed(pipeline.extract_features, grid)
+    name = os.path.splitext(os.path.basename(path))[0]
+
+    v3_path = os.path.join(work_dir, f"{name}_v3.schem")
+    write_sponge_v3(grid, v3_path)
+    t_v3, v3 = timed(pipeline.load_schematic, v3_path)
+    assert np.array_equal(v3.blocks, grid.blocks) and v3.palette == grid.palette, f"{name}: Sponge v3 加载结果不一致"
+
+    litematic_path = os.path.join(work_dir, f"{name}.litematic")
+    write_litematica(grid, litematic_path)
+    t_lite, lite = timed(pipeline.load_schematic, litematic_path)
+    assert np.array_equal(timed(pipeline.extract_features, lite)[1], features), f"{name}: Litematica 加载结果不一致"
+
+    mcedit_path = os.path.join(work_dir, f"{name}.schematic")
+    lower, upper = write_mcedit(features, grid.shape, mcedit_path)
+    t_mcedit, mcedit = timed(pipeline.load_schematic, mcedit_path)
+    assert check_mcedit(features, timed(pipeline.extract_features, mcedit)[1], lower, upper), f"{name}: .schematic 加载结果不一致"
+
+    print(f"{name:<14} {len(grid):>9} 方块  .schem {t_schem * 1e3:7.1f} ms  v3 {t_v3 * 1e3:7.1f} ms  "
+          f".litematic {t_lite * 1e3:7.1f} ms  .schematic {t_mcedit * 1e3:7.1f} ms")
+
+
+def bench_unpack(count=200_000, palette_size=300, seed=0):
+    values = np.random.default_rng(seed).integers(0, palette_size, count)
+    bits = max(2, (palette_size - 1).bit_length())
+    words = pack_bits(values, bits)
+    start = time.perf_counter()
+    legacy = legacy_unpack_bits(words, bits, count)
+    t_loop = time.perf_counter() - start
+    start = time.perf_counter()
+    unpacked = unpack_bits(words, bits, count)
+    t_numpy = time.perf_counter() - start
+    assert np.array_equal(unpacked, values) and np.array_equal(legacy, values), "位解包结果不一致"
+    print(f"解包 {count} 个 {bits} 位的值：逐项循环 {t_loop * 1e3:.1f} ms，NumPy {t_numpy * 1e3:.1f} ms "
+          f"（{t_loop / t_numpy:.0f}x）")
+
+
+def main():
+    schem_dir = sys.argv[1] if len(sys.argv) > 1 else "schem"
+    bench_unpack()
+    with tempfile.TemporaryDirectory() as work_dir:
+        for file_name in sorted(os.listdir(schem_dir)):
+            if file_name.endswith(".schem"):
+                bench_file(os.path.join(schem_dir, file_name), work_dir)
+    print("✅ Sponge v3、Litematica、MCEdit 加载结果与原 .schem 一致")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+.schem 加载基准：对比 nbtlib.load 整体读入后解码与流式加载（nbt_stream + 逐块解码），
+检查两者得到的网格一致，并记录耗时和 tracemalloc 峰值内存。
+
+用法：python benchmarks/bench_loader.py [schem 目录]
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from nbtlib import load
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as pipeline
+
+
+def load_with_nbtlib(path):
+    schem_data = load(path)
+    return pipeline.build_output_data(schem_data['BlockData'], schem_data['Palette'],
+                                      schem_data['Width'], schem_data['Height'], schem_data['Length'])
+
+
+def load_slabs(path):
+    """只保留一个 slab，模拟逐块处理超过内存的建筑。"""
+    for _, slab in pipeline.iter_schematic_slabs(path, slab_height=16):
+        pass
+    return slab
+
+
+def measure(func, path):
+    """返回 (耗时秒数, 峰值内存字节数, 结果)。"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(path)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def bench_file(path):
+    t_old, m_old, old = measure(load_with_nbtlib, path)
+    t_new, m_new, new = measure(pipeline.load_schematic, path)
+    t_slab, m_slab, _ = measure(load_slabs, path)
+    assert np.array_equal(old.blocks, new.blocks) and old.palette == new.palette, f"{path}: 加载结果不一致"
+
+    name = os.path.basename(path)
+    print(f"{name:<20} {len(new):>9} 方块  "
+          f"nbtlib {t_old * 1e3:8.1f} ms / {m_old / 2**20:6.1f} MiB  "
+          f"流式 {t_new * 1e3:7.1f} ms / {m_new / 2**20:6.1f} MiB  "
+          f"逐 slab {t_slab * 1e3:7.1f} ms / {m_slab / 2**20:6.1f} MiB")
+
+
+def main():
+    schem_dir = sys.argv[1] if len(sys.argv) > 1 else "schem"
+    for file_name in sorted(os.listdir(schem_dir)):
+        if file_name.endswith(".schem"):
+            bench_file(os.path.join(schem_dir, file_name))
+    print("✅ 流式加载与 nbtlib 加载结果一致")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+数据流程基准：对比旧的文本流程（block_data.txt → parsed_block_data.txt → eval → npy）
+与内存中的 run_pipeline，并检查两者生成的结构数组完全一致。
+
+用法：python benchmarks/bench_pipeline.py [schem 目录]
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as pipeline
+
+
+def run_text_pipeline(schem_dir, schem_file, work_dir):
+    """在 work_dir 中按旧流程运行，返回保存到 npy 文件夹中的结构数组。"""
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        os.symlink(os.path.abspath(os.path.join(cwd, schem_dir)), "schem")
+        pipeline.process_block_data(schem_file, interactive=False, dump_txt=True)
+        pipeline.parse_and_process_block_data()
+        pipeline.generate_rotated_and_mirrored_data()
+        count = len([name for name in os.listdir("npy") if name.endswith(".npy")])
+        return [np.load(os.path.join("npy", f"block_data_{i}.npy")) for i in range(count)]
+    finally:
+        os.chdir(cwd)
+
+
+def bench_file(schem_dir, schem_file):
+    with tempfile.TemporaryDirectory() as work_dir, contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        text_structures = run_text_pipeline(schem_dir, schem_file, work_dir)
+        t_text = time.perf_counter() - start
+
+        start = time.perf_counter()
+        structures = pipeline.run_pipeline(os.path.join(schem_dir, schem_file))
+        t_memory = time.perf_counter() - start
+
+    assert len(text_structures) == len(structures), f"{schem_file}: 变体数量不一致"
+    for old, new in zip(text_structures, structures):
+        assert np.array_equal(old, new), f"{schem_file}: 结构数组不一致"
+
+    print(f"{schem_file:<20} 文本流程 {t_text:8.3f} s -> 内存流程 {t_memory:8.3f} s "
+          f"({t_text / t_memory:5.1f}x)，{len(structures)} 个变体")
+
+
+def main():
+    schem_dir = sys.argv[1] if len(sys.argv) > 1 else "schem"
+    for file_name in sorted(os.listdir(schem_dir)):
+        if file_name.endswith(".schem"):
+            bench_file(schem_dir, file_name)
+    print("✅ 两种流程生成的结构数组完全一致")
+
+
+if __name__ == "__main__":
+    main()
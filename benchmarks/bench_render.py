@@ -0,0 +1,83 @@
+"""
+立方体预览渲染基准：对比原先每个方块一个 pv.Cube/actor 的做法与合并网格（外露面剔除 + 同行合并），
+离屏渲染若干帧并报告建网格耗时、面数和每帧耗时。
+
+用法：python benchmarks/bench_render.py [schem 目录] [帧数]
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pyvista as pv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as pipeline
+
+# 原实现每个方块一个 actor，超过这个数量时跳过，避免基准本身跑不完
+LEGACY_MAX_BLOCKS = 1000
+SYNTHETIC_PALETTE = ['minecraft:air', 'minecraft:stone', 'minecraft:oak_planks', 'minecraft:glass']
+
+
+def legacy_render(grid, frames, window_size=(1280, 720)):
+    """原实现：每个非空气方块一个立方体和一个 actor，返回 (建场景秒数, 每帧耗时数组)。"""
+    start = time.perf_counter()
+    mask = grid.non_air_mask()
+    colors = pipeline.palette_colors(grid.palette) / 255.0
+    plotter = pv.Plotter(off_screen=True, window_size=list(window_size))
+    for (x, y, z), block_id in zip(grid.coordinates(mask), grid.palette_indices(mask)):
+        cube = pv.Cube(center=(x, z, y), x_length=1, y_length=1, z_length=1)
+        plotter.add_mesh(cube, color=colors[block_id], show_edges=False)
+    plotter.show(auto_close=False)
+    build = time.perf_counter() - start
+
+    times = np.empty(frames)
+    for i in range(frames):
+        plotter.camera.azimuth = 360.0 * i / frames
+        start = time.perf_counter()
+        plotter.render()
+        times[i] = time.perf_counter() - start
+    plotter.close()
+    return build, times
+
+
+def synthetic_grid(size, fill=0.6, seed=0):
+    """size³ 的随机建筑：下方为实心地基，上方按 fill 比例随机放置方块。"""
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(1, len(SYNTHETIC_PALETTE), size=(size, size, size)).astype(np.uint16)
+    blocks[size // 2:][rng.random((size - size // 2, size, size)) > fill] = 0
+    return pipeline.VoxelGrid(blocks, SYNTHETIC_PALETTE)
+
+
+def bench_grid(name, grid, frames):
+    blocks = int(grid.non_air_mask().sum())
+    start = time.perf_counter()
+    mesh = pipeline.build_block_mesh(grid)
+    build = time.perf_counter() - start
+    times = pipeline.measure_render(mesh, frames=frames)
+    line = (f"{name:<20} {blocks:>9} 方块  合并网格 {mesh.n_cells:>8} 面  建网格 {build * 1e3:8.1f} ms  "
+            f"每帧 {times.mean() * 1e3:8.2f} ms")
+    if blocks <= LEGACY_MAX_BLOCKS:
+        legacy_build, legacy_times = legacy_render(grid, frames)
+        line += (f"  |  原实现 {blocks:>6} 个 actor  建场景 {legacy_build * 1e3:8.1f} ms  "
+                 f"每帧 {legacy_times.mean() * 1e3:8.2f} ms")
+    print(line)
+
+
+def main():
+    schem_dir = sys.argv[1] if len(sys.argv) > 1 else "schem"
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    for file_name in sorted(os.listdir(schem_dir)):
+        if file_name.endswith(".schem"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                grid = pipeline.load_schematic(os.path.join(schem_dir, file_name))
+            bench_grid(file_name, grid, frames)
+    for size in (16, 64, 100):
+        bench_grid(f"合成 {size}³", synthetic_grid(size), frames)
+
+
+if __name__ == "__main__":
+    main()
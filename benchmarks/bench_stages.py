@@ -0,0 +1,184 @@
+"""
+分阶段基准：生成 10³ ~ 256³ 的合成 Sponge .schem（palette 包含楼梯、原木、栅栏、门等真实方块状态，
+可选超大 palette 以产生三字节 varint），分别测量各阶段的耗时、峰值内存和吞吐量（体素/秒），
+结果写成 JSON，便于对比不同版本找出变慢的阶段。
+
+阶段：nbt_load（nbtlib.load）、stream_load（流式加载）、decode_block_data、build_output_data、
+parse_block（build_feature_lut，每次测量使用新的 BlockRegistry，不命中之前解析过的状态）、augment（augment_grid）、recompute_states（block_states.py）、
+npy_save（save_variants）、generate_schem。
+
+用法：python benchmarks/bench_stages.py [--sizes 10 32 64 128 256] [--large-palette 20000] [--output bench_stages.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from nbtlib import load
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as pipeline
+from block_registry import BlockRegistry
+
+WOODS = ["oak", "spruce", "birch", "dark_oak"]
+FACINGS = ["north", "east", "south", "west"]
+BOOLEANS = ["false", "true"]
+STAIR_SHAPES = ["straight", "inner_left", "inner_right", "outer_left", "outer_right"]
+# 大 palette 测试使用的边长（体素数需多于 palette 项数）
+LARGE_PALETTE_SIZE = 64
+
+
+def realistic_palette():
+    """返回接近真实建筑的 palette（约 900 项，已超过单字节 varint 的 128 个 ID）。"""
+    names = ["minecraft:air", "minecraft:grass_block[snowy=false]", "minecraft:dirt",
+             "minecraft:cobblestone", "minecraft:glass", "minecraft:crafting_table"]
+    for wood in WOODS:
+        names.append(f"minecraft:{wood}_planks")
+        names += [f"minecraft:{wood}_log[axis={axis}]" for axis in "xyz"]
+        names += [f"minecraft:{wood}_slab[type={kind},waterlogged={water}]"
+                  for kind in ("bottom", "top", "double") for water in BOOLEANS]
+        names += [f"minecraft:{wood}_door[facing={facing},half={half},hinge={hinge},open={opened},powered={powered}]"
+                  for facing in FACINGS for half in ("lower", "upper") for hinge in ("left", "right")
+                  for opened in BOOLEANS for powered in BOOLEANS]
+    for material in WOODS + ["stone", "cobblestone"]:
+        names += [f"minecraft:{material}_stairs[facing={facing},half={half},shape={shape},waterlogged={water}]"
+                  for facing in FACINGS for half in ("bottom", "top") for shape in STAIR_SHAPES for water in BOOLEANS]
+    for block in ("oak_fence", "glass_pane"):
+        names += [f"minecraft:{block}[east={e},north={n},south={s},waterlogged={w},west={west}]"
+                  for e in BOOLEANS for n in BOOLEANS for s in BOOLEANS for w in BOOLEANS for west in BOOLEANS]
+    return names
+
+
+def synthetic_grid(size, palette_size=None, air_ratio=0.5, seed=0):
+    """
+    size³ 的合成网格：一半左右为空气，其余方块按 Zipf 分布从 palette 中抽取（少数方块很常见）。
+    palette_size 大于真实 palette 时用编号方块补足，用来测试多字节 varint。
+    """
+    palette = realistic_palette()
+    if palette_size and palette_size > len(palette):
+        palette += [f"minecraft:synthetic_block_{i}" for i in range(palette_size - len(palette))]
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, len(palette))
+    blocks = rng.choice(np.arange(1, len(palette)), size=size ** 3, p=weights / weights.sum())
+    blocks[rng.random(size ** 3) < air_ratio] = 0
+    # 保证每个 palette 项至少出现一次，否则 write_schem 会去掉未使用的项，varint 达不到预期长度
+    used = min(len(palette), size ** 3)
+    blocks[rng.permutation(size ** 3)[:used]] = np.arange(used)
+    dtype = np.uint16 if len(palette) <= 2**16 else np.uint32
+    return pipeline.VoxelGrid(blocks.astype(dtype).reshape(size, size, size), palette)
+
+
+def measure(func, memory=True, setup=None):
+    """
+    运行 func 并返回 (结果, 耗时秒数, 峰值内存字节数)。
+    耗时在不开启 tracemalloc 时测量；memory 为 True 时再运行一次记录峰值内存。
+    setup 不为 None 时每次运行前调用（不计时），返回值作为 func 的参数。
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        result = func(*args)
+        seconds = time.perf_counter() - start
+        peak = None
+        if memory:
+            args = (setup(),) if setup else ()
+            tracemalloc.start()
+            func(*args)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return result, seconds, peak
+
+
+def bench_size(size, work_dir, palette_size=None, memory=True):
+    grid = synthetic_grid(size, palette_size)
+    voxels = len(grid)
+    path = os.path.join(work_dir, f"synthetic_{size}.schem")
+    with contextlib.redirect_stdout(io.StringIO()):
+        pipeline.write_schem(grid, path)
+    stages = {}
+
+    def run(stage, func, setup=None):
+        result, seconds, peak = measure(func, memory, setup)
+        stages[stage] = {
+            "seconds": seconds,
+            "peak_bytes": peak,
+            "voxels_per_second": voxels / seconds if seconds > 0 else None,
+        }
+        return result
+
+    schem_data = run("nbt_load", lambda: load(path))
+    loaded = run("stream_load", lambda: pipeline.load_schematic(path))
+    block_data = schem_data['BlockData']
+    run("decode_block_data", lambda: pipeline.decode_block_data(block_data))
+    run("build_output_data", lambda: pipeline.build_output_data(
+        block_data, schem_data['Palette'], schem_data['Width'], schem_data['Height'], schem_data['Length']))
+    # 全局 REGISTRY 在第一个尺寸后已缓存了这些状态字符串，每次测量换一个新的注册表
+    lut = run("parse_block", lambda registry: pipeline.build_feature_lut(loaded.palette, registry),
+              setup=BlockRegistry.load)
+    structures = run("augment", lambda: pipeline.augment_grid(loaded, lut=lut))
+    run("recompute_states", lambda: [pipeline.recompute_block_states(structure) for structure in structures])
+    run("npy_save", lambda: pipeline.save_variants(structures, os.path.join(work_dir, "npy")))
+    del structures
+    palette = {name: i for i, name in enumerate(loaded.palette)}
+    run("generate_schem", lambda: pipeline.generate_schem(
+        loaded.blocks, palette, loaded.width, loaded.height, loaded.length, os.path.join(work_dir, "out.schem")))
+
+    return {
+        "size": size,
+        "voxels": voxels,
+        "palette": len(loaded.palette),
+        "file_bytes": os.path.getsize(path),
+        "stages": stages,
+    }
+
+
+def print_result(result):
+    print(f"{result['size']}³（{result['voxels']} 体素，palette {result['palette']}，"
+          f"文件 {result['file_bytes'] / 2**20:.1f} MiB）")
+    for stage, stats in result["stages"].items():
+        peak = "" if stats["peak_bytes"] is None else f"  峰值 {stats['peak_bytes'] / 2**20:8.1f} MiB"
+        print(f"  {stage:<18} {stats['seconds'] * 1e3:10.1f} ms  "
+              f"{stats['voxels_per_second'] / 1e6:8.2f} M 体素/秒{peak}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="分阶段基准，结果写成 JSON")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 32, 64, 128, 256], help="合成建筑的边长")
+    parser.add_argument("--large-palette", type=int, default=20000,
+                        help="额外用这个大小的 palette 测试 64³ 建筑（超过 16384 时需要三字节 varint），0 表示不测")
+    parser.add_argument("--no-memory", action="store_true", help="不测峰值内存（每个阶段只运行一次）")
+    parser.add_argument("--output", default="bench_stages.json", help="JSON 结果文件")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        runs = [(size, None) for size in args.sizes]
+        if args.large_palette:
+            runs.append((LARGE_PALETTE_SIZE, args.large_palette))
+        for size, palette_size in runs:
+            result = bench_size(size, work_dir, palette_size, memory=not args.no_memory)
+            print_result(result)
+            results.append(result)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ 结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
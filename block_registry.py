@@ -0,0 +1,131 @@
+"""
+方块状态注册表：从 block_registry.json 读取方块类别、子类型、每个类别的属性定义和方块家族，
+导入时展开成 完整方块名称 → (block_type, subtype) 的字典，解析方块状态字符串只需一次字典查找，
+增加新的方块家族不会让解析变慢。
+
+方块状态字符串驻留为整数 ID，同一个状态只解析一次，特征向量按 ID 存放。
+数据文件中没有列出的方块按 fallback 的顺序做子串匹配（与旧版 parse_block 的行为相同），
+结果同样记入字典，之后不再匹配；匹配成功时提示一次，便于把这些方块补进数据文件。
+"""
+import json
+import os
+
+import numpy as np
+
+REGISTRY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "block_registry.json")
+NAMESPACE = "minecraft:"
+# 每个特征向量的属性通道数
+ATTR_COUNT = 5
+
+
+class BlockRegistry:
+    """
+    用法：
+
+        registry = BlockRegistry.load()
+        registry.parse("minecraft:oak_stairs[facing=east,half=top]")  # (2, 0, [1, 1, 0, 0, -1])
+        registry.feature_table(palette)                                # (P, 7) int8 特征表
+
+    types / subtypes / default_blocks 与数据文件中的同名字段相同；
+    properties[block_type] 为 [(属性名称, 取值列表, 默认取值)]，依次对应 5 个属性通道。
+    """
+
+    def __init__(self, data):
+        self.types = dict(data["types"])
+        self.subtypes = {self.types[name]: dict(table) for name, table in data.get("subtypes", {}).items()}
+        self.default_blocks = {self.types[name]: block for name, block in data["default_blocks"].items()}
+        self.properties = {}
+        # 属性取值 → 通道值的查找表：(属性名称, {取值: 下标}, 默认下标, 未知取值的下标)
+        self._schemas = {}
+        for name, schema in data.get("properties", {}).items():
+            if len(schema) > ATTR_COUNT:
+                raise ValueError(f"方块类别 {name} 的属性超过 {ATTR_COUNT} 个")
+            block_type = self.types[name]
+            self.properties[block_type] = [(p["name"], list(p["values"]), p["default"]) for p in schema]
+            compiled = []
+            for prop, values, default in self.properties[block_type]:
+                index = {value: i for i, value in enumerate(values)}
+                # 与旧版一致：二值属性中不等于第一个取值的都记为 1，其余未知取值按默认值处理
+                unknown = 1 if len(values) == 2 else index[default]
+                compiled.append((prop, index, index[default], unknown))
+            self._schemas[block_type] = compiled
+
+        self.blocks = {}
+        for family in data["families"]:
+            block_type = self.types[family["type"]]
+            # 家族中的 subtype 为子类型表中的名称，整个家族共用（如各种木材的栅栏门）；没有时按方块名称查找
+            subtype = family.get("subtype")
+            for material in family.get("materials", [""]):
+                name = family["pattern"].format(material)
+                self.blocks[name] = (block_type, self._subtype(block_type, subtype or name))
+        self.fallback = [(key, self.types[key]) for key in data.get("fallback", [])]
+
+        self.state_ids = {}
+        self.states = []
+        self._features = []
+
+    @classmethod
+    def load(cls, path=REGISTRY_FILE):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _subtype(self, block_type, name):
+        return self.subtypes.get(block_type, {}).get(name, -1)
+
+    def classify(self, name):
+        """返回方块名称（不含命名空间和属性）的 (block_type, subtype)，无法识别时返回 None。"""
+        if name in self.blocks:
+            return self.blocks[name]
+        entry = None
+        for key, block_type in self.fallback:
+            if key in name:
+                entry = (block_type, self._subtype(block_type, name))
+                print(f"未列出的方块 {name} 按名称中的 '{key}' 归为 {key} 类")
+                break
+        self.blocks[name] = entry
+        return entry
+
+    def _parse(self, block_str):
+        """解析一个方块状态字符串，返回 7 个通道值的元组，无法识别时返回 None。"""
+        if not block_str.startswith(NAMESPACE):
+            return None
+        name, _, properties = block_str[len(NAMESPACE):].partition("[")
+        entry = self.classify(name)
+        if entry is None:
+            return None
+        values = {}
+        if properties:
+            values = dict(prop.split("=", 1) for prop in properties.rstrip("]").split(","))
+        attrs = [-1] * ATTR_COUNT
+        for i, (prop, index, default, unknown) in enumerate(self._schemas.get(entry[0], [])):
+            value = values.get(prop)
+            attrs[i] = default if value is None else index.get(value, unknown)
+        return entry + tuple(attrs)
+
+    def intern(self, block_str):
+        """返回方块状态字符串的整数 ID，第一次见到时解析并记录。"""
+        state_id = self.state_ids.get(block_str)
+        if state_id is None:
+            state_id = len(self.states)
+            self.state_ids[block_str] = state_id
+            self.states.append(block_str)
+            self._features.append(self._parse(block_str))
+        return state_id
+
+    def parse(self, block_str):
+        """返回 (block_type, subtype, 属性列表)，无法识别时返回 None。"""
+        feature = self._features[self.intern(block_str)]
+        return None if feature is None else (feature[0], feature[1], list(feature[2:]))
+
+    def feature_table(self, palette):
+        """返回 (P, 7) 的 int8 特征表，无法识别的方块整行为 -1。"""
+        table = np.full((len(palette), 2 + ATTR_COUNT), -1, dtype=np.int8)
+        for i, block_str in enumerate(palette):
+            feature = self._features[self.intern(block_str)]
+            if feature is not None:
+                table[i] = feature
+        return table
+
+
+# 导入时构建一次，整个进程共用
+REGISTRY = BlockRegistry.load()
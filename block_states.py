@@ -0,0 +1,161 @@
+"""
+按相邻方块重新计算方块状态：栅栏/玻璃板的四个连接方向和楼梯的 shape（直/内角/外角）。
+
+旋转/镜像时这些属性由 D4 查表逐个方块置换，只要原结构正确结果就正确；但裁剪出的窗口、
+模型生成的结构中，这些属性常常与实际的相邻方块不一致。这里对整个特征张量一次性重算：
+先取出所有栅栏/玻璃板/楼梯的坐标，再把坐标平移一格（±x、±z）取出相邻方块的特征整体比较，
+没有逐方块的 Python 循环，耗时只与这些方块的数量有关。
+
+规则与游戏一致（简化）：
+- 栅栏连接栅栏，玻璃板连接玻璃板，两者都连接侧面完整的方块（原木、木板、功能方块、草方块）
+  和背面朝向自己的非外角楼梯；相邻方块无法识别（block_type 为 -1）时保留原来的取值
+- 栅栏门与栅栏同属 fence 类别（按 subtype 区分），栅栏会连接栅栏门，但栅栏门本身没有连接方向，不参与重算
+- 楼梯的 shape 由前后两个同 half 的楼梯决定（StairBlock.getStairsShape）
+- 超出边界的位置视为空气
+
+用法：
+    features = recompute_block_states(features)  # (X, Y, Z, 7) int8，返回新数组
+"""
+import numpy as np
+
+from block_registry import ATTR_COUNT, REGISTRY
+
+FEATURE_SIZE = 2 + ATTR_COUNT
+TYPES = REGISTRY.types
+STAIRS = TYPES["stairs"]
+# 栅栏门的 subtype（block_registry.json 中 fence 的子类型）
+FENCE_GATE = REGISTRY.subtypes[TYPES["fence"]]["oak_fence_gate"]
+AIR_FEATURE = np.array([TYPES["air"]] + [-1] * (FEATURE_SIZE - 1), dtype=np.int8)
+
+# 水平方向按 facing 的取值顺序：north、east、south、west；特征张量按 [x, y, z] 索引，north 为 -z
+DIRECTIONS = ["north", "east", "south", "west"]
+DX = np.array([0, 1, 0, -1])
+DZ = np.array([-1, 0, 1, 0])
+
+# 侧面完整、栅栏和玻璃板都会连接的方块类别
+SOLID_TYPES = ("log", "planks", "functional", "grass_block")
+# 方块类别 → 会与之相连的方块类别
+CONNECTIONS = {
+    "fence": ("fence",) + SOLID_TYPES,
+    "glass_pane": ("glass_pane",) + SOLID_TYPES,
+}
+
+
+def _channel(block_type, prop):
+    """返回某个方块类别的属性在特征向量中的通道下标。"""
+    names = [name for name, _, _ in REGISTRY.properties[TYPES[block_type]]]
+    return 2 + names.index(prop)
+
+
+def _value(block_type, prop, value):
+    """返回属性取值在特征向量中的编码。"""
+    for name, values, _ in REGISTRY.properties[TYPES[block_type]]:
+        if name == prop:
+            return values.index(value)
+    raise KeyError(prop)
+
+
+FACING = _channel("stairs", "facing")
+HALF = _channel("stairs", "half")
+SHAPE = _channel("stairs", "shape")
+STRAIGHT, INNER_LEFT, INNER_RIGHT, OUTER_LEFT, OUTER_RIGHT = (
+    _value("stairs", "shape", shape)
+    for shape in ("straight", "inner_left", "inner_right", "outer_left", "outer_right"))
+
+
+def _connection_table(block_type):
+    """(len(TYPES) + 1,) 的查找表，按相邻方块的 block_type + 1 索引：1 相连，0 不相连，-1 保留原值。"""
+    table = np.zeros(len(TYPES) + 1, dtype=np.int8)
+    table[0] = -1
+    for name in CONNECTIONS[block_type]:
+        table[TYPES[name] + 1] = 1
+    return table
+
+
+# (方块类别, 查找表, [(方向, 通道)])
+_CONNECTION_RULES = [
+    (TYPES[name], _connection_table(name), [(d, _channel(name, direction)) for d, direction in enumerate(DIRECTIONS)])
+    for name in CONNECTIONS
+]
+
+
+def _neighbours(features, xs, ys, zs, direction):
+    """
+    返回坐标 (xs, ys, zs) 处的方块在 direction（标量或数组，下标见 DIRECTIONS）方向上
+    相邻方块的特征 (N, 7)，超出边界的位置为空气。
+    """
+    width, _, length = features.shape[:3]
+    nx = xs + DX[direction]
+    nz = zs + DZ[direction]
+    result = features[np.clip(nx, 0, width - 1), ys, np.clip(nz, 0, length - 1)]
+    result[(nx < 0) | (nx >= width) | (nz < 0) | (nz >= length)] = AIR_FEATURE
+    return result
+
+
+def _stair_shapes(features, xs, ys, zs):
+    """按 StairBlock.getStairsShape 计算 (xs, ys, zs) 处楼梯的 shape。"""
+    facing = features[xs, ys, zs, FACING].astype(np.intp)
+    half = features[xs, ys, zs, HALF]
+    counter_clockwise = (facing + 3) % 4
+
+    def stairs(neighbour):
+        return (neighbour[:, 0] == STAIRS) & (neighbour[:, HALF] == half) & (neighbour[:, FACING] >= 0) & (
+            neighbour[:, FACING] < 4)
+
+    def can_take_shape(direction):
+        # 该方向上不是 facing、half 都相同的楼梯
+        side = _neighbours(features, xs, ys, zs, direction)
+        return ~(stairs(side) & (side[:, FACING] == facing))
+
+    # 背后（facing 方向）是垂直朝向的楼梯：外角
+    behind = _neighbours(features, xs, ys, zs, facing)
+    turn = np.where(stairs(behind), behind[:, FACING], facing).astype(np.intp)
+    outer = (turn % 2 != facing % 2) & can_take_shape((turn + 2) % 4)
+    # 前方是垂直朝向的楼梯：内角
+    front = _neighbours(features, xs, ys, zs, (facing + 2) % 4)
+    front_turn = np.where(stairs(front), front[:, FACING], facing).astype(np.intp)
+    inner = ~outer & (front_turn % 2 != facing % 2) & can_take_shape(front_turn)
+
+    shape = np.full(len(xs), STRAIGHT, dtype=np.int8)
+    shape[outer] = np.where(turn[outer] == counter_clockwise[outer], OUTER_LEFT, OUTER_RIGHT)
+    shape[inner] = np.where(front_turn[inner] == counter_clockwise[inner], INNER_LEFT, INNER_RIGHT)
+    return shape
+
+
+def recompute_block_states(features, inplace=False):
+    """
+    按相邻方块重算 (X, Y, Z, 7) 特征张量中楼梯的 shape 和栅栏/玻璃板的连接方向，
+    返回结果（inplace 为 True 时直接修改 features）。其余方块和通道不变。
+    """
+    features = np.asarray(features, dtype=np.int8)
+    if features.ndim != 4 or features.shape[3] != FEATURE_SIZE:
+        raise ValueError(f"特征张量形状应为 (X, Y, Z, {FEATURE_SIZE})，实际为 {features.shape}")
+    result = features if inplace else features.copy()
+    types = result[..., 0]
+
+    # 楼梯先算，栅栏/玻璃板是否连接楼梯取决于楼梯的 shape
+    xs, ys, zs = np.nonzero(types == STAIRS)
+    facing = result[xs, ys, zs, FACING]
+    valid = (facing >= 0) & (facing < 4) & (result[xs, ys, zs, HALF] >= 0)
+    xs, ys, zs = xs[valid], ys[valid], zs[valid]
+    if len(xs):
+        result[xs, ys, zs, SHAPE] = _stair_shapes(result, xs, ys, zs)
+
+    for block_type, table, channels in _CONNECTION_RULES:
+        mask = types == block_type
+        if block_type == TYPES["fence"]:
+            mask &= result[..., 1] != FENCE_GATE
+        xs, ys, zs = np.nonzero(mask)
+        if not len(xs):
+            continue
+        for direction, channel in channels:
+            neighbour = _neighbours(result, xs, ys, zs, direction)
+            connected = table[neighbour[:, 0].astype(np.intp) + 1]
+            # 楼梯只有背面完整：背面朝向本方块（facing 与方向相反）且不是外角时相连
+            back = ((neighbour[:, 0] == STAIRS) & (neighbour[:, FACING] == (direction + 2) % 4)
+                    & (neighbour[:, SHAPE] != OUTER_LEFT) & (neighbour[:, SHAPE] != OUTER_RIGHT))
+            connected[back] = 1
+            keep = connected < 0
+            connected[keep] = result[xs[keep], ys[keep], zs[keep], channel]
+            result[xs, ys, zs, channel] = connected
+    return result
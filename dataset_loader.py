@@ -0,0 +1,221 @@
+"""
+训练用的数据加载（接口与 PyTorch 的 Dataset / DataLoader 相同）：从内存映射的数据集
+（见 dataset_store.py）中读取基础结构，取样时随机做一个 D4 旋转/镜像，按需把特征编码为
+one-hot 或 embedding 下标，拼成连续的批次数组，并在后台线程中预取后面的批次。
+
+数据集中只需保存 'original' 变体（batch.py --originals-only），其余变体在取样时生成，
+磁盘占用和构建时间都降为原来的约 1/8。
+
+用法：
+    dataset = AugmentedDataset("dataset", encoding="onehot")
+    for batch in DataLoader(dataset, batch_size=16, shuffle=True, workers=4):
+        batch["features"]  # (N, X, Y, Z, C)，channels_first=True 时为 (N, C, X, Y, Z)
+"""
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from block_registry import REGISTRY
+from dataset_store import DatasetStore
+from main import AIR_FEATURE, ATTR_VALUES, BLOCK_TYPE_MAP, D4_TRANSFORMS, FEATURE_SIZE, transform_features
+
+ENCODINGS = ("raw", "onehot", "embedding")
+# one-hot 编码的通道数：block_type 的 one-hot（未知方块全为 0）+ subtype + 5 个属性
+ONEHOT_SIZE = len(BLOCK_TYPE_MAP) + FEATURE_SIZE - 1
+# subtype 的取值个数（各方块类别的子类型编号共用这一个通道）
+SUBTYPE_VALUES = max(subtype for table in REGISTRY.subtypes.values() for subtype in table.values()) + 1
+# embedding 编码中每个通道的取值个数（下标 0 表示 -1，即未知方块或不适用的属性），用作 nn.Embedding 的大小
+EMBEDDING_SIZE = max(len(BLOCK_TYPE_MAP), SUBTYPE_VALUES, ATTR_VALUES - 1) + 1
+
+
+def channel_count(encoding):
+    """返回编码后每个体素的通道数。"""
+    return ONEHOT_SIZE if encoding == "onehot" else FEATURE_SIZE
+
+
+def encode_features(features, encoding="raw", out=None):
+    """
+    把 (..., 7) int8 特征编码为训练用的数组，out 不为 None 时直接写入 out（形状相同、最后一维为通道数）。
+
+    raw:       int8 原始特征
+    onehot:    float32，block_type 展开为 len(BLOCK_TYPE_MAP) 个 one-hot 通道，其余 6 个通道保留原值
+    embedding: int64，每个通道加 1，-1 变为 0，可直接作为 nn.Embedding(EMBEDDING_SIZE, ..., padding_idx=0) 的输入
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"未知的编码方式: {encoding}，可选: {', '.join(ENCODINGS)}")
+    if encoding == "raw":
+        if out is None:
+            return features.copy()
+        out[...] = features
+        return out
+    if encoding == "embedding":
+        if out is None:
+            out = np.empty(features.shape, dtype=np.int64)
+        np.add(features, 1, out=out, dtype=np.int64)
+        return out
+
+    if out is None:
+        out = np.empty(features.shape[:-1] + (ONEHOT_SIZE,), dtype=np.float32)
+    types = len(BLOCK_TYPE_MAP)
+    # 与 arange 比较即得到 one-hot，block_type 为 -1 时所有通道都为 0
+    out[..., :types] = features[..., :1] == np.arange(types, dtype=np.int8)
+    out[..., types:] = features[..., 1:]
+    return out
+
+
+class AugmentedDataset:
+    """
+    取样时随机增强的数据集。dataset[i] 返回 (编码后的特征, 变换名称)。
+
+    path: DatasetWriter 写入的数据集目录
+    transforms: 随机选择的 D4 变换名称列表，默认全部 8 个；传入 ["original"] 即不增强
+    encoding: "raw"、"onehot" 或 "embedding"（见 encode_features）
+    originals_only: 为 True 且数据集中有 'original' 变体时，只使用这些样本作为基础结构，
+                    避免已保存的旋转/镜像变体被重复增强
+    seed: 随机种子；同一 (seed, epoch, 下标) 总是得到同一个变换，与取样顺序和线程无关
+    """
+
+    def __init__(self, path, transforms=None, encoding="raw", originals_only=True, seed=0):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"未知的编码方式: {encoding}，可选: {', '.join(ENCODINGS)}")
+        self.store = DatasetStore(path)
+        self.transforms = list(D4_TRANSFORMS) if transforms is None else list(transforms)
+        self.encoding = encoding
+        self.seed = seed
+        self.epoch = 0
+        samples = np.arange(len(self.store))
+        if originals_only and "original" in self.store.transforms:
+            original = self.store.transforms.index("original")
+            samples = samples[self.store.index["transform"] == original]
+        self.samples = samples
+
+    def __len__(self):
+        return len(self.samples)
+
+    def set_epoch(self, epoch):
+        """换一组随机变换（DataLoader 每轮开始时调用）。"""
+        self.epoch = epoch
+
+    def choose_transform(self, i):
+        rng = np.random.default_rng((self.seed, self.epoch, int(i)))
+        return self.transforms[rng.integers(len(self.transforms))]
+
+    def shape(self, i):
+        """第 i 个基础结构的 (X, Y, Z)（变换前）。"""
+        return tuple(int(v) for v in self.store.index[self.samples[i]]["shape"])
+
+    def load(self, i):
+        """返回第 i 个样本变换后的 int8 特征 (X, Y, Z, 7) 和变换名称。"""
+        transform = self.choose_transform(i)
+        structure = self.store[self.samples[i]]
+        if transform == "original":
+            return np.asarray(structure), transform
+        return transform_features(structure, transform), transform
+
+    def __getitem__(self, i):
+        features, transform = self.load(i)
+        return encode_features(features, self.encoding), transform
+
+    def source(self, i):
+        return self.store.info(self.samples[i])["source"]
+
+
+def collate(dataset, indices, shape=None, channels_first=False):
+    """
+    把若干样本拼成一个连续的批次，返回字典：
+    features: (N, X, Y, Z, C) 数组（channels_first=True 时为 (N, C, X, Y, Z)），
+              各样本放在左下角，其余位置填充空气；shape 为 None 时取本批次中各维的最大值
+    shapes: (N, 3) 每个样本变换后的实际尺寸
+    indices / transforms: 样本下标和所用的变换
+    """
+    loaded = [dataset.load(i) for i in indices]
+    shapes = np.array([features.shape[:3] for features, _ in loaded], dtype=np.int32).reshape(-1, 3)
+    if shape is None:
+        shape = tuple(int(v) for v in shapes.max(axis=0)) if len(loaded) else (0, 0, 0)
+    elif (shapes > np.asarray(shape)).any():
+        raise ValueError(f"样本尺寸超过批次尺寸 {tuple(shape)}")
+
+    channels = channel_count(dataset.encoding)
+    dtype = {"raw": np.int8, "onehot": np.float32, "embedding": np.int64}[dataset.encoding]
+    batch = np.empty((len(loaded),) + tuple(shape) + (channels,), dtype=dtype)
+    padding = encode_features(AIR_FEATURE, dataset.encoding)
+    for n, (features, _) in enumerate(loaded):
+        x, y, z = features.shape[:3]
+        target = batch[n]
+        if (x, y, z) != tuple(shape):
+            target[...] = padding
+        encode_features(features, dataset.encoding, out=target[:x, :y, :z])
+    if channels_first:
+        batch = np.ascontiguousarray(np.moveaxis(batch, -1, 1))
+    return {
+        "features": batch,
+        "shapes": shapes,
+        "indices": np.asarray(indices),
+        "transforms": [transform for _, transform in loaded],
+    }
+
+
+class DataLoader:
+    """
+    按批次遍历 AugmentedDataset，后台线程池提前准备 prefetch 个批次
+    （不少于 workers 个，保证每个线程都有批次可做）。
+
+    内存映射读取、D4 变换和编码主要是 NumPy 的整块操作，执行时会释放 GIL，
+    用线程即可并行，批次数组也不需要在进程之间复制。
+
+    shape: 固定的批次尺寸 (X, Y, Z)，为 None 时每个批次取其中样本的最大尺寸
+    as_torch: 为 True 时把 features 转为 torch.Tensor（与 NumPy 数组共享内存，需要安装 PyTorch）
+    """
+
+    def __init__(self, dataset, batch_size=8, shuffle=True, drop_last=False, workers=None, prefetch=2,
+                 shape=None, channels_first=False, as_torch=False, seed=0):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.prefetch = max(1, prefetch)
+        self.shape = shape
+        self.channels_first = channels_first
+        self.as_torch = as_torch
+        self.seed = seed
+        self.epoch = 0
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.dataset) // self.batch_size
+        return -(-len(self.dataset) // self.batch_size)
+
+    def batches(self):
+        """返回本轮的样本下标分组。"""
+        order = np.arange(len(self.dataset))
+        if self.shuffle:
+            np.random.default_rng((self.seed, self.epoch)).shuffle(order)
+        return [order[i:i + self.batch_size] for i in range(0, len(self) * self.batch_size, self.batch_size)]
+
+    def _collate(self, indices):
+        batch = collate(self.dataset, indices, self.shape, self.channels_first)
+        if self.as_torch:
+            import torch
+            batch["features"] = torch.from_numpy(batch["features"])
+        return batch
+
+    def __iter__(self):
+        self.dataset.set_epoch(self.epoch)
+        batches = self.batches()
+        self.epoch += 1
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                for indices in batches:
+                    pending.append(pool.submit(self._collate, indices))
+                    if len(pending) > max(self.prefetch, self.workers):
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                # 提前结束遍历时不再准备剩下的批次
+                for future in pending:
+                    future.cancel()
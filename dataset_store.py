@@ -0,0 +1,202 @@
+"""
+紧凑的数据集存储：所有结构和变体的 int8 特征拼接在同一个数组中，
+训练时可以用 np.load(mmap_mode='r') 随机读取单个样本，不需要把整个数据集读入内存。
+
+目录结构：
+    voxels.npy   一维 int8 数组，按样本依次存放展平后的 (X, Y, Z, 7) 特征
+    index.npy    结构化数组，每个样本一行：offset、shape、source、transform
+    meta.json    来源文件列表和变换名称列表（index 中的 source/transform 为其下标）
+"""
+import json
+import os
+import shutil
+import struct
+
+import numpy as np
+
+FEATURE_SIZE = 7
+VOXELS_FILE = "voxels.npy"
+INDEX_FILE = "index.npy"
+META_FILE = "meta.json"
+STORE_VERSION = 1
+
+# voxels.npy 使用固定长度的文件头，追加数据后只需原地改写其中的长度
+NPY_HEADER_BYTES = 128
+
+INDEX_DTYPE = np.dtype([
+    ("offset", "<i8"),       # 样本在 voxels.npy 中的起始位置（字节）
+    ("shape", "<i4", (3,)),  # (X, Y, Z)
+    ("source", "<i4"),       # meta.json 中 sources 的下标
+    ("transform", "<i2"),    # meta.json 中 transforms 的下标
+])
+
+
+def _npy_header(length):
+    """生成一维 int8 数组的 .npy 1.0 文件头，总长度固定为 NPY_HEADER_BYTES。"""
+    header = "{'descr': '|i1', 'fortran_order': False, 'shape': (%d,), }" % length
+    header = header.ljust(NPY_HEADER_BYTES - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+def _read_meta(path):
+    with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != STORE_VERSION:
+        raise ValueError(f"不支持的数据集版本: {meta.get('version')}")
+    return meta
+
+
+class DatasetWriter:
+    """
+    向数据集目录追加样本。用法：
+
+        with DatasetWriter("dataset") as writer:
+            writer.add(structure, "WoodHouse_3.schem", "rotate_90")
+
+    append 为 True 且目录中已有数据集时在末尾追加，否则覆盖。
+    """
+
+    def __init__(self, path, append=True):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        voxels_path = os.path.join(path, VOXELS_FILE)
+
+        if append and os.path.exists(voxels_path):
+            meta = _read_meta(path)
+            existing = np.load(voxels_path, mmap_mode="r")
+            if existing.offset != NPY_HEADER_BYTES or existing.dtype != np.int8:
+                raise ValueError(f"{voxels_path} 不是由 DatasetWriter 写入的文件，无法追加")
+            self.length = existing.shape[0]
+            del existing
+            self.sources = meta["sources"]
+            self.transforms = meta["transforms"]
+            self.rows = list(np.load(os.path.join(path, INDEX_FILE)))
+            self._file = open(voxels_path, "r+b")
+            self._file.seek(NPY_HEADER_BYTES + self.length)
+        else:
+            self.length = 0
+            self.sources = []
+            self.transforms = []
+            self.rows = []
+            self._file = open(voxels_path, "wb")
+            self._file.write(_npy_header(0))
+
+        self._source_ids = {name: i for i, name in enumerate(self.sources)}
+        self._transform_ids = {name: i for i, name in enumerate(self.transforms)}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _intern(self, table, ids, name):
+        if name not in ids:
+            ids[name] = len(table)
+            table.append(name)
+        return ids[name]
+
+    def add(self, structure, source, transform):
+        """追加一个 (X, Y, Z, 7) 结构，返回它在数据集中的样本下标。"""
+        structure = np.asarray(structure)
+        if structure.ndim != 4 or structure.shape[3] != FEATURE_SIZE:
+            raise ValueError(f"结构数组形状应为 (X, Y, Z, {FEATURE_SIZE})，实际为 {structure.shape}")
+        if structure.dtype != np.int8 and structure.size and (structure.min() < -128 or structure.max() > 127):
+            raise ValueError("结构数组中有超出 int8 范围的值")
+        data = np.ascontiguousarray(structure, dtype=np.int8)
+
+        row = np.zeros((), dtype=INDEX_DTYPE)
+        row["offset"] = self.length
+        row["shape"] = structure.shape[:3]
+        row["source"] = self._intern(self.sources, self._source_ids, str(source))
+        row["transform"] = self._intern(self.transforms, self._transform_ids, str(transform))
+        self._file.write(data.tobytes())
+        self.length += data.size
+        self.rows.append(row)
+        return len(self.rows) - 1
+
+    def close(self):
+        """写回文件头中的长度以及 index.npy 和 meta.json。"""
+        if self._file is None:
+            return
+        self._file.seek(0)
+        self._file.write(_npy_header(self.length))
+        self._file.close()
+        self._file = None
+
+        np.save(os.path.join(self.path, INDEX_FILE), np.array(self.rows, dtype=INDEX_DTYPE))
+        meta = {
+            "version": STORE_VERSION,
+            "dtype": "int8",
+            "feature_size": FEATURE_SIZE,
+            "sources": self.sources,
+            "transforms": self.transforms,
+        }
+        with open(os.path.join(self.path, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class DatasetStore:
+    """
+    以内存映射方式只读打开数据集，store[i] 返回第 i 个样本的 (X, Y, Z, 7) int8 视图。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        meta = _read_meta(path)
+        self.sources = meta["sources"]
+        self.transforms = meta["transforms"]
+        self.index = np.load(os.path.join(path, INDEX_FILE))
+        self.voxels = np.load(os.path.join(path, VOXELS_FILE), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        row = self.index[i]
+        shape = tuple(int(v) for v in row["shape"])
+        start = int(row["offset"])
+        size = int(np.prod(shape)) * FEATURE_SIZE
+        return self.voxels[start:start + size].reshape(shape + (FEATURE_SIZE,))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def info(self, i):
+        """返回第 i 个样本的来源文件、变换名称和尺寸。"""
+        row = self.index[i]
+        return {
+            "source": self.sources[row["source"]],
+            "transform": self.transforms[row["transform"]],
+            "shape": tuple(int(v) for v in row["shape"]),
+        }
+
+    def nbytes(self):
+        """数据集在磁盘上占用的字节数。"""
+        return sum(os.path.getsize(os.path.join(self.path, name))
+                   for name in (VOXELS_FILE, INDEX_FILE, META_FILE))
+
+
+def merge_stores(paths, output, append=True, remove=False, select=None):
+    """
+    把多个数据集按顺序合并到 output 中，返回每个输入数据集第一个样本在 output 中的下标。
+
+    remove 为 True 时合并后删除输入目录。
+    select: 与 paths 一一对应的样本下标列表，只合并其中的样本；为 None 时合并全部样本。
+    """
+    starts = []
+    with DatasetWriter(output, append=append) as writer:
+        for n, path in enumerate(paths):
+            store = DatasetStore(path)
+            starts.append(len(writer))
+            for i in (range(len(store)) if select is None else select[n]):
+                info = store.info(i)
+                writer.add(store[i], info["source"], info["transform"])
+            del store
+            if remove:
+                shutil.rmtree(path)
+    return starts
@@ -0,0 +1,90 @@
+"""
+基于哈希的结构去重：每个结构数组用 int8 字节内容的 BLAKE2b 摘要作为键，
+同一建筑的 D4 变体共享一个规范摘要（全部变体摘要中的最小值），
+因此对称建筑或旋转/镜像后重复出现的建筑在整个数据集中只会保留一份。
+
+DedupIndex 把见过的规范摘要追加写入一个二进制文件（每个摘要 16 字节），
+多次批量运行时可以跳过已经处理过的结构。查找和插入都是 O(1)，总体 O(n)。
+"""
+import hashlib
+import os
+
+import numpy as np
+
+DIGEST_SIZE = 16
+DEDUP_FILE = "dedup.bin"
+
+
+def structure_digest(structure):
+    """返回结构数组的 16 字节摘要（形状 + int8 字节内容）。"""
+    structure = np.ascontiguousarray(structure, dtype=np.int8)
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    h.update(np.asarray(structure.shape, dtype="<i4").tobytes())
+    h.update(structure.data)
+    return h.digest()
+
+
+def canonical_digest(variants):
+    """
+    返回一组 D4 变体的规范摘要：所有变体摘要中的最小值。
+
+    同一建筑的任意旋转/镜像得到的变体集合相同，规范摘要也就相同，
+    不需要在字节层面比较整个数组的字典序。
+    """
+    return min(structure_digest(structure) for structure in variants)
+
+
+class DedupIndex:
+    """
+    持久化的规范摘要集合。用法：
+
+        with DedupIndex("dataset/dedup.bin") as index:
+            if index.add(canonical_digest(variants)):
+                ...  # 第一次见到的结构
+
+    reset 为 True 时丢弃文件中已有的摘要。新摘要在 close() 时追加到文件末尾。
+    """
+
+    def __init__(self, path, reset=False):
+        self.path = path
+        self.digests = set()
+        self.pending = []
+        if reset and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                raw = f.read()
+            if len(raw) % DIGEST_SIZE:
+                raise ValueError(f"{path} 的长度不是 {DIGEST_SIZE} 的整数倍，文件可能已损坏")
+            self.digests = {raw[i:i + DIGEST_SIZE] for i in range(0, len(raw), DIGEST_SIZE)}
+
+    def __len__(self):
+        return len(self.digests)
+
+    def __contains__(self, digest):
+        return digest in self.digests
+
+    def add(self, digest):
+        """记录摘要，之前没有见过时返回 True，重复时返回 False。"""
+        if digest in self.digests:
+            return False
+        self.digests.add(digest)
+        self.pending.append(digest)
+        return True
+
+    def close(self):
+        """把本次新增的摘要追加写入文件。"""
+        if not self.pending:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "ab") as f:
+            f.write(b"".join(self.pending))
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
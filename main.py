@@ -1,113 +1,278 @@
 import numpy as np
 import pyvista as pv
-from nbtlib import File, Compound, Int, ByteArray, load
-import re
+from nbtlib import File, Compound, Int, ByteArray
+import hashlib
 import os
-
-# 定义方块类型和子类型映射
-BLOCK_TYPE_MAP = {
-    "log": 0,
-    "planks": 1,
-    "stairs": 2,
-    "slab": 3,
-    "fence": 4,
-    "glass_pane": 5,
-    "door": 6,
-    "functional": 7,  # 比如箱子、工作台这种
-    "grass_block": 8,
-    "air": 9
-}
-
-STAIR_SUBTYPE_MAP = {
-    "oak_stairs": 0,
-    "dark_oak_stairs": 1,
-    "birch_stairs": 2,
-    "spruce_stairs": 3
-}
+import json
+import time
+
+import profiling
+from block_registry import REGISTRY, REGISTRY_FILE
+from block_states import recompute_block_states
+from dataset_store import DatasetWriter
+from dedup_index import DEDUP_FILE, DedupIndex, canonical_digest, structure_digest
+from nbt_stream import DEFAULT_CHUNK_BYTES, SchematicStream
+from schematic_formats import LEGACY_BLOCKS_FILE, read_schematic, register_reader
+from stage_cache import StageCache
+
+# 方块类型和楼梯子类型映射，定义在 block_registry.json 中
+# （functional 为箱子、工作台这种功能方块）
+BLOCK_TYPE_MAP = REGISTRY.types
+STAIR_SUBTYPE_MAP = REGISTRY.subtypes[BLOCK_TYPE_MAP["stairs"]]
+
+# BlockData 中的 varint 最多 5 字节（可表示 int32 范围内的非负 ID）
+VARINT_MAX_BYTES = 5
+VARINT_MAX_VALUE = 2**31 - 1
+
+# 每个体素的特征向量长度：[block_type, subtype] + 5 个属性
+FEATURE_SIZE = 7
 
 def encode_block_data(decoded_data):
     """
-    编码解码后的 block_data，处理负数和特殊编码的方块 ID，恢复为原始数据格式。
-    """
-    encoded_data = []
-    for value in decoded_data:
-        if value <= 127:
-            # 如果值小于等于 127，直接添加
-            encoded_data.append(value)
-        else:
-            # 需要分割为多个字节，处理超出 127 的数值
-            negative_value = (value % 128) - 128  # 计算负数部分
-            next_value = value // 128      # 计算增量部分
-
-            # 确保编码后的值在 -128 到 127 范围内
-            if negative_value < -128 or negative_value > 127:
-                raise ValueError(f"编码值 {negative_value} 超出了 ByteArray 可接受范围")
-            if next_value < -128 or next_value > 127:
-                raise ValueError(f"增量值 {next_value} 超出了 ByteArray 可接受范围")
+    把方块 ID 编码为 Sponge BlockData 使用的 varint 字节（int8 数组）。
 
-            encoded_data.append(negative_value)
-            encoded_data.append(next_value)
-
-    return encoded_data
+    每个 ID 按 7 位一组从低到高写出，除最后一个字节外都带 0x80 续位标记，
+    支持任意长度的 varint，因此 palette 超过 16384 项也能正确编码。
+    """
+    values = np.asarray(decoded_data).ravel()
+    if values.size == 0:
+        return np.empty(0, dtype=np.int8)
+    if values.min() < 0 or values.max() > VARINT_MAX_VALUE:
+        raise ValueError(f"方块 ID 超出 varint 可编码范围 [0, {VARINT_MAX_VALUE}]")
+
+    # 只有 ID > 127 的方块需要多字节，通常只占很小一部分
+    multi = np.flatnonzero(values > 0x7F)
+    if multi.size == 0:
+        return values.astype(np.int8)
+
+    wide = values[multi].astype(np.int64)
+    nbytes = np.full(wide.shape, 2, dtype=np.int64)
+    for k in range(2, VARINT_MAX_BYTES):
+        nbytes += wide >= (1 << (7 * k))
+
+    # 先在原位置写入每个 ID 的最后一个字节（不带续位标记）
+    encoded = values.astype(np.uint8)
+    encoded[multi] = wide >> (7 * (nbytes - 1))
+
+    # 再把前面的续位字节按顺序插入到对应位置之前
+    extra = nbytes - 1
+    owner = np.repeat(np.arange(multi.size), extra)
+    position = np.arange(owner.size) - np.repeat(np.cumsum(extra) - extra, extra)
+    prefix = ((wide[owner] >> (7 * position)) & 0x7F) | 0x80
+    return np.insert(encoded, multi[owner], prefix.astype(np.uint8)).view(np.int8)
 
 def decode_block_data(block_data):
     """
-    解码 block_data，把负数和特殊编码的方块 ID 转换为正确的无符号数或计算值。
+    解码 Sponge BlockData 的 varint 字节流，返回方块 ID 数组（int32）。
+
+    直接在 int8/uint8 缓冲区上用掩码找出续位字节，把连续的续位字节分组后
+    用 cumsum/reduceat 合并到各自 varint 的最后一个字节上，支持任意长度的 varint。
     """
-    decoded_data = []
-    i = 0
+    buf = np.asarray(block_data)
+    if buf.dtype == np.int8:
+        buf = buf.view(np.uint8)
+    else:
+        buf = buf.astype(np.uint8)
+    buf = buf.ravel()
+
+    cont = buf > 0x7F
+    cont_idx = np.flatnonzero(cont)
+    # 没有续位字节时每个字节就是一个 ID
+    if cont_idx.size == 0:
+        return buf.astype(np.int32)
+    if cont[-1]:
+        raise ValueError("BlockData 以未结束的 varint 结尾，数据可能已损坏")
+
+    # 相邻的续位字节属于同一个 varint，段号由 cumsum 得到
+    run_first = np.empty(cont_idx.size, dtype=bool)
+    run_first[0] = True
+    np.not_equal(np.diff(cont_idx), 1, out=run_first[1:])
+    run_head = np.flatnonzero(run_first)
+    run_id = np.cumsum(run_first) - 1
+    run_start = cont_idx[run_head]
+    terminal = np.append(cont_idx[run_head[1:] - 1], cont_idx[-1]) + 1
+    lengths = terminal - run_start + 1
+    if lengths.max() > VARINT_MAX_BYTES:
+        raise ValueError(f"varint 长度超过 {VARINT_MAX_BYTES} 字节，数据可能已损坏")
+
+    # 5 字节的 varint 可能超出 int32 的移位范围，先用 int64 计算
+    dtype = np.int64 if lengths.max() == VARINT_MAX_BYTES else np.int32
+    parts = (buf[cont_idx] & 0x7F).astype(dtype) << (7 * (cont_idx - run_start[run_id]))
+    decoded = buf.astype(dtype)
+    decoded[terminal] = (decoded[terminal] << (7 * (lengths - 1))) + np.add.reduceat(parts, run_head)
+    return decoded[~cont].astype(np.int32, copy=False)
+
+class VoxelGrid:
+    """
+    以 palette 下标存储的稠密体素网格，替代每个方块一个字典的列表。
 
-    while i < len(block_data):
-        value = block_data[i]
-        
-        if value == 127:
-            decoded_data.append(value)  # Start mark as Byte(127)
-            i += 1
-        elif value < 0:
-            negative_value = value
-            next_value = block_data[i + 1]
-            
-            # 根据规则计算最终值
-            calculated_value = (next_value + 1) * 128 + negative_value
-            decoded_data.append(calculated_value)
-            i += 2  # 跳过下一个增量值
-        else:
-            decoded_data.append(value)  # 正常的 Byte(x)
-            i += 1
+    blocks:  (H, L, W) 的无符号整数数组，blocks[y, z, x] 为该位置方块在 palette 中的下标
+    palette: 方块状态字符串列表，palette[i] 为下标 i 对应的方块（如 'minecraft:oak_log[axis=y]'）
+    """
 
-    return decoded_data
+    def __init__(self, blocks, palette, air_block='minecraft:air'):
+        self.blocks = np.asarray(blocks)
+        if self.blocks.ndim != 3:
+            raise ValueError(f"blocks 必须是 (H, L, W) 三维数组，实际维度为 {self.blocks.ndim}")
+        self.palette = list(palette)
+        self.air_block = air_block
+
+    @classmethod
+    def from_block_data(cls, block_data, palette, width, height, length, air_block='minecraft:air'):
+        """
+        从 .schem 中的 BlockData（varint 字节）和 Palette（名称 -> ID）构建网格。
+        """
+        width, height, length = int(width), int(height), int(length)
+        ids = decode_block_data(block_data)
+
+        # palette 中缺失的 ID 记为 'unknown'，与原先 id_to_block.get(..., 'unknown') 一致
+        size = max([int(v) + 1 for v in palette.values()] + [int(ids.max()) + 1 if ids.size else 0])
+        names = ['unknown'] * size
+        for block, block_id in palette.items():
+            names[int(block_id)] = str(block)
+
+        # BlockData 不足时剩余位置补 'unknown'，多余部分忽略
+        count = width * height * length
+        if ids.size < count:
+            if 'unknown' not in names:
+                names.append('unknown')
+            ids = np.concatenate([ids, np.full(count - ids.size, names.index('unknown'), dtype=ids.dtype)])
+        dtype = np.uint16 if len(names) <= 2**16 else np.uint32
+        blocks = ids[:count].astype(dtype).reshape(height, length, width)
+        return cls(blocks, names, air_block=air_block)
+
+    @classmethod
+    def from_output_data(cls, output_data, air_block='minecraft:air'):
+        """
+        从旧格式的字典列表（{'block': 名称, 'coordinates': (x, y, z)}）构建网格。
+        """
+        names, inverse = np.unique([data['block'] for data in output_data], return_inverse=True)
+        coords = np.array([data['coordinates'] for data in output_data], dtype=np.int64).reshape(-1, 3)
+        width, height, length = coords.max(axis=0) + 1 if len(coords) else (0, 0, 0)
+        palette = [str(name) for name in names]
+        if air_block not in palette:
+            palette.append(air_block)
+        blocks = np.full((height, length, width), palette.index(air_block), dtype=np.uint16)
+        blocks[coords[:, 1], coords[:, 2], coords[:, 0]] = inverse
+        return cls(blocks, palette, air_block=air_block)
+
+    @property
+    def shape(self):
+        """网格尺寸 (H, L, W)，即 (y, z, x)。"""
+        return self.blocks.shape
+
+    @property
+    def width(self):
+        return self.blocks.shape[2]
+
+    @property
+    def height(self):
+        return self.blocks.shape[0]
+
+    @property
+    def length(self):
+        return self.blocks.shape[1]
+
+    def __len__(self):
+        return self.blocks.size
+
+    def __getitem__(self, key):
+        """按 (y, z, x) 切片，返回共享 palette 的子网格（数组为视图，不复制）。"""
+        sub = self.blocks[key]
+        if sub.ndim != 3:
+            raise IndexError("VoxelGrid 只支持保持三维的切片，例如 grid[0:5, :, 2:8]")
+        return VoxelGrid(sub, self.palette, air_block=self.air_block)
+
+    def palette_index(self, block_name):
+        """返回方块名称在 palette 中的下标，不存在时返回 -1。"""
+        try:
+            return self.palette.index(block_name)
+        except ValueError:
+            return -1
+
+    def mask(self, block_name):
+        """返回某种方块的 (H, L, W) 布尔掩码。"""
+        index = self.palette_index(block_name)
+        if index < 0:
+            return np.zeros(self.shape, dtype=bool)
+        return self.blocks == index
+
+    def non_air_mask(self):
+        """返回所有非空气方块的 (H, L, W) 布尔掩码。"""
+        return ~self.mask(self.air_block)
+
+    def coordinates(self, mask=None):
+        """
+        返回掩码内方块的 (N, 3) 坐标数组，列顺序为 (x, y, z)，
+        顺序与 BlockData 一致（先 y，再 z，最后 x）。
+        """
+        if mask is None:
+            mask = np.ones(self.shape, dtype=bool)
+        y, z, x = np.nonzero(mask)
+        return np.stack([x, y, z], axis=1)
+
+    def non_air_coordinates(self):
+        """返回所有非空气方块的 (N, 3) 坐标数组，列顺序为 (x, y, z)。"""
+        return self.coordinates(self.non_air_mask())
+
+    def palette_indices(self, mask=None):
+        """返回掩码内方块的 palette 下标（与 coordinates 顺序一致）。"""
+        if mask is None:
+            return self.blocks.ravel()
+        return self.blocks[mask]
+
+    def block_names(self, mask=None):
+        """返回掩码内方块的名称数组（object 数组，与 coordinates 顺序一致）。"""
+        return np.asarray(self.palette, dtype=object)[self.palette_indices(mask)]
+
+    def to_output_data(self):
+        """转换为旧格式的字典列表，仅用于兼容旧代码。"""
+        names = self.block_names()
+        return [{'block': name, 'coordinates': (int(x), int(y), int(z))}
+                for name, (x, y, z) in zip(names, self.coordinates())]
+
+def as_voxel_grid(data, air_block='minecraft:air'):
+    """把 VoxelGrid 或旧格式的字典列表统一为 VoxelGrid。"""
+    if isinstance(data, VoxelGrid):
+        return data
+    return VoxelGrid.from_output_data(data, air_block=air_block)
 
 def build_output_data(block_data, palette, width, height, length):
     """
-    根据 block_data 和 palette 构建输出数据，包括方块名称和三维坐标。
-    """
-    # 解码 block_data
-    decoded_block_data = decode_block_data(block_data)
-
-    # 构建反向映射
-    id_to_block = {v: k for k, v in palette.items()}
-
-    # 构建输出数据
-    output_data = []
-    index = 0
-    for y in range(height):
-        for z in range(length):
-            for x in range(width):
-                if index >= len(decoded_block_data):
-                    break
-                block_id = decoded_block_data[index]
-                block_name = id_to_block.get(block_id, 'unknown')
-                output_data.append({
-                    'block': block_name,
-                    'coordinates': (x, y, z)
-                })
-                index += 1
-
-    print(f"✅ 成功加载 {len(output_data)} 个方块数据！")
+    根据 block_data 和 palette 构建 VoxelGrid（palette 下标网格 + 方块名称列表）。
+    """
+    grid = VoxelGrid.from_block_data(block_data, palette, width, height, length)
+
+    print(f"✅ 成功加载 {len(grid)} 个方块数据！")
     print(f"✅ 成功加载 {len(palette)} 个方块 ID！")
     print(f"✅ 地图尺寸 (宽度x): {int(width)}，(高度y): {int(height)}，(长度z): {int(length)}")
-    
-    return output_data
+
+    return grid
+
+def write_schem(output_data, filename, air_block='minecraft:air'):
+    """
+    把 VoxelGrid 写成 gzip 压缩的 .schem 文件。
+
+    palette 用 np.unique 去重（同名的多个下标会合并），没有用到的项用 bincount 去掉，
+    BlockData 用 encode_block_data 一次性编码。
+    """
+    grid = as_voxel_grid(output_data, air_block=air_block)
+    names, remap = np.unique(np.asarray(grid.palette, dtype=object).astype(str), return_inverse=True)
+    used = np.bincount(remap[grid.blocks.ravel()], minlength=len(names)) > 0
+    remap = (np.cumsum(used) - 1)[remap]
+    blocks = remap[grid.blocks.ravel()]
+    names = names[used]
+
+    schem_data = File(Compound({
+        'Palette': Compound({str(block): Int(i) for i, block in enumerate(names)}),
+        'PaletteMax': Int(len(names)),
+        'BlockData': ByteArray(encode_block_data(blocks)),
+        'Width': Int(grid.width),
+        'Height': Int(grid.height),
+        'Length': Int(grid.length),
+        'Version': Int(1)
+    }))
+    schem_data.save(filename, gzipped=True)
 
 def generate_schem(block_array, palette, width, height, length, filename):
     """
@@ -121,290 +286,762 @@ def generate_schem(block_array, palette, width, height, length, filename):
     length: Z 轴方向的长度。
     filename: 输出的 .schem 文件名（如 'output.schem'）。
     """
-    
-    # 构建 BlockData，确保 Y 轴倒序，这样在 Minecraft 中是“从下往上”展示
-    block_data = []
-    for y in range(height):
-        for z in range(length):
-            for x in range(width):
-                block_data.append(block_array[y, z, x])
-
-    # 编码 block_data
-    encoded_block_data = encode_block_data(block_data)
-
-    # 转换为 ByteArray 格式（编码后的数据不会超出 int8 范围）
-    block_data = ByteArray(encoded_block_data)
-
-    # 构建 NBT 数据
-    schem_data = File(Compound({
-        'Palette': Compound({block: Int(id) for block, id in palette.items()}),
-        'PaletteMax': Int(len(palette)),
-        'BlockData': block_data,
-        'Width': Int(width),
-        'Height': Int(height),
-        'Length': Int(length),
-        'Version': Int(1)
-    }))
-
-    # 保存为 .schem 文件
-    with open(filename, 'wb') as f:
-        schem_data.write(f)
+    # 按 y、z、x 的顺序取出 BlockData 对应的部分，整体交给 write_schem 写入
+    blocks = np.asarray(block_array)[:height, :length, :width]
+    names = ['unknown'] * (max(int(i) for i in palette.values()) + 1)
+    for block, block_id in palette.items():
+        names[int(block_id)] = block
+    write_schem(VoxelGrid(blocks, names), filename)
 
     print(f"✅ 成功生成 '{filename}' 文件！")
 
 def parse_short(value):
     return int(value.split('(')[1].rstrip(')'))
 
-def preview_point_cloud(output_data, air_block='minecraft:air', point_size=50):
+# block_color 的缓存：方块状态字符串 -> (R, G, B)
+_block_color_cache = {}
+
+def block_color(block_name):
     """
-    使用 PyVista 可视化 Minecraft 方块数据的点云。
+    方块的固定颜色：方块状态字符串 BLAKE2b 摘要的前 3 个字节。
+    Python 内置的 hash() 对字符串加了随机盐，每个进程的结果都不同，这里在不同进程和不同次运行中都一致。
     """
-    points = []
-    colors = []
+    color = _block_color_cache.get(block_name)
+    if color is None:
+        color = tuple(hashlib.blake2b(block_name.encode("utf-8"), digest_size=3).digest())
+        _block_color_cache[block_name] = color
+    return color
 
-    for data in output_data:
-        x, y, z = data['coordinates']
-        block_name = data['block']
+def palette_colors(palette):
+    """
+    为 palette 中每种方块生成一个固定的颜色（见 block_color），返回 (P, 3) 的 0-255 RGB 数组。
+    """
+    return np.array([block_color(block_name) for block_name in palette], dtype=np.uint8).reshape(-1, 3)
 
-        if block_name == air_block:
-            continue  # 跳过空气方块
+# 预览时一次最多交给 VTK 的方块（点或立方体）数量，超过时自动使用更粗的 LOD 层级
+DEFAULT_POINT_BUDGET = 200_000
 
-        # 把坐标加入点云，同时把 y 和 z 对调，让模型“站正”
-        points.append([x, z, y])
+def downsample_grid(grid, air_block='minecraft:air'):
+    """
+    把每个 2×2×2 的方块合并成一格（多数表决）：8 个子格中只要有非空气方块就保留，
+    取出现次数最多的非空气方块，平票时取 palette 下标较小者。尺寸为奇数时按空气补齐。
+    """
+    grid = as_voxel_grid(grid, air_block=air_block)
+    palette = list(grid.palette)
+    air = grid.palette_index(air_block)
+    if air < 0:
+        palette.append(air_block)
+        air = len(palette) - 1
+
+    h, l, w = grid.shape
+    blocks = np.pad(grid.blocks, [(0, h % 2), (0, l % 2), (0, w % 2)], constant_values=air)
+    h, l, w = blocks.shape
+    children = np.sort(blocks.reshape(h // 2, 2, l // 2, 2, w // 2, 2)
+                       .transpose(0, 2, 4, 1, 3, 5).reshape(-1, 8), axis=1)
+
+    # 每个子格在 8 个子格中出现的次数，空气不参与表决
+    counts = np.empty(children.shape, dtype=np.int8)
+    for j in range(8):
+        counts[:, j] = (children == children[:, j:j + 1]).sum(axis=1)
+    counts[children == air] = 0
+    result = children[np.arange(len(children)), counts.argmax(axis=1)]
+    result[counts.max(axis=1) == 0] = air
+    return VoxelGrid(result.reshape(h // 2, l // 2, w // 2), palette, air_block=air_block)
+
+def build_lod_levels(grid, air_block='minecraft:air'):
+    """
+    生成 LOD 金字塔：第 0 层为原网格，第 k 层的每一格对应原网格中 2^k 边长的立方体，
+    逐层减半直到三个方向都只剩一格。
+    """
+    levels = [as_voxel_grid(grid, air_block=air_block)]
+    while max(levels[-1].shape) > 1:
+        levels.append(downsample_grid(levels[-1], air_block))
+    return levels
+
+def select_lod_level(levels, point_budget=DEFAULT_POINT_BUDGET):
+    """返回非空气方块数不超过 point_budget 的最精细层级；point_budget 为 None 时总是返回 0。"""
+    if point_budget is None:
+        return 0
+    for level, grid in enumerate(levels):
+        if grid.non_air_mask().sum() <= point_budget:
+            return level
+    return len(levels) - 1
+
+def lod_point_cloud(grid, scale=1, origin=(0, 0, 0)):
+    """
+    把某一 LOD 层级（或其中的一块区域）转为点云，坐标换算回原网格并把 y 和 z 对调。
+    origin 为区域在该层级中的起点 (x, y, z)。
+    """
+    mask = grid.non_air_mask()
+    points = (grid.coordinates(mask) + np.asarray(origin)) * scale + (scale - 1) / 2
+    cloud = pv.PolyData(points[:, [0, 2, 1]].astype(np.float32))
+    cloud['colors'] = palette_colors(grid.palette)[grid.palette_indices(mask)]
+    return cloud
+
+def lod_block_mesh(grid, scale=1, origin=(0, 0, 0)):
+    """与 lod_point_cloud 相同，但生成外露面合并网格（见 build_block_mesh）。"""
+    mesh = build_block_mesh(grid, air_block=grid.air_block)
+    if mesh.n_points:
+        mesh.points = (mesh.points + np.asarray(origin)[[0, 2, 1]]) * scale + (scale - 1) / 2
+    return mesh
+
+def budget_block_mesh(grid, point_budget=DEFAULT_POINT_BUDGET):
+    """
+    返回 (外露面合并网格, LOD 层级)：非空气方块超过 point_budget 时使用满足预算的最精细层级，
+    为 None 时总是使用原网格。
+    """
+    level = 0
+    if point_budget is not None and grid.non_air_mask().sum() > point_budget:
+        levels = build_lod_levels(grid, grid.air_block)
+        level = select_lod_level(levels, point_budget)
+        grid = levels[level]
+    return lod_block_mesh(grid, 2 ** level), level
+
+def lod_region_meshes(levels, base, lo, hi, point_budget=DEFAULT_POINT_BUDGET, build=lod_point_cloud):
+    """
+    在 [lo, hi)（原网格中的 (x, y, z) 范围）内使用不超过 point_budget 的最精细层级，
+    区域外仍使用 base 层级。返回 (区域外网格, 区域内网格, 区域内层级)；
+    没有比 base 更精细且满足预算的层级时区域内网格为 None。
+    """
+    base_scale = 2 ** base
+    base_grid = levels[base]
+    # 区域按 base 层级的格子对齐，保证两部分之间没有缝隙或重叠
+    dims = np.array([base_grid.width, base_grid.height, base_grid.length])
+    start = np.clip(np.floor(np.asarray(lo) / base_scale).astype(int), 0, dims)
+    stop = np.clip(np.ceil(np.asarray(hi) / base_scale).astype(int), 0, dims)
+    if np.any(stop <= start):
+        return build(base_grid, base_scale), None, base
+
+    detail = None
+    for level in range(base - 1, -1, -1):
+        factor = 2 ** (base - level)
+        (x0, y0, z0), (x1, y1, z1) = start * factor, stop * factor
+        region = levels[level][y0:y1, z0:z1, x0:x1]
+        if region.non_air_mask().sum() > point_budget:
+            break
+        detail = (level, region, (x0, y0, z0))
+    if detail is None:
+        return build(base_grid, base_scale), None, base
+
+    # 区域外的 base 层级：把区域内的格子置为空气
+    air = base_grid.palette_index(base_grid.air_block)
+    palette = list(base_grid.palette)
+    if air < 0:
+        palette.append(base_grid.air_block)
+        air = len(palette) - 1
+    blocks = base_grid.blocks.copy()
+    blocks[start[1]:stop[1], start[2]:stop[2], start[0]:stop[0]] = air
+    outside = VoxelGrid(blocks, palette, air_block=base_grid.air_block)
+
+    level, region, origin = detail
+    return build(outside, base_scale), build(region, 2 ** level, origin), level
+
+def show_with_lod(plotter, grid, add, build=lod_point_cloud, point_budget=DEFAULT_POINT_BUDGET,
+                  air_block='minecraft:air'):
+    """
+    按 point_budget 自动选择 LOD 层级并添加到 plotter 中；每次旋转/缩放结束后，
+    对相机视野内的区域换用更精细的层级（渐进细化）。
+
+    add(mesh, name) 负责把网格添加到 plotter（同名 actor 会被替换）。
+    point_budget 为 None 时不使用 LOD。返回选中的基础层级。
+    """
+    grid = as_voxel_grid(grid, air_block=air_block)
+    if point_budget is None or grid.non_air_mask().sum() <= point_budget:
+        add(build(grid), 'lod_base')
+        return 0
+    levels = build_lod_levels(grid, air_block)
+    base = select_lod_level(levels, point_budget)
+    add(build(levels[base], 2 ** base), 'lod_base')
+    print(f"✅ 方块较多，使用 LOD 第 {base} 层（每格 {2 ** base}³ 个方块）预览，放大后自动细化")
+
+    last = {}
+
+    def refine(*_):
+        camera = plotter.camera
+        half = camera.distance * np.tan(np.radians(camera.view_angle) / 2)
+        focal = np.asarray(camera.focal_point)
+        # 显示坐标为 (x, z, y)
+        lo, hi = (focal - half)[[0, 2, 1]], (focal + half)[[0, 2, 1]]
+        # 视野覆盖的 base 格子没有变化时不需要重新生成
+        key = (tuple(np.floor(lo / 2 ** base)), tuple(np.ceil(hi / 2 ** base)))
+        if last.get('key') == key:
+            return
+        last['key'] = key
+        outside, inside, _ = lod_region_meshes(levels, base, lo, hi, point_budget, build)
+        add(outside, 'lod_base')
+        if inside is None:
+            plotter.remove_actor('lod_detail')
+        else:
+            add(inside, 'lod_detail')
+        plotter.render()
 
-        # 给不同的方块一个颜色（简单用哈希生成颜色）
-        color = hash(block_name) % 0xFFFFFF  # 转成 24 位颜色
-        r = (color >> 16) & 0xFF
-        g = (color >> 8) & 0xFF
-        b = color & 0xFF
-        colors.append([r, g, b])
+    plotter.iren.style.AddObserver('EndInteractionEvent', refine)
+    return base
 
-    # 转换为 NumPy 数组
-    points = np.array(points)
-    colors = np.array(colors)
+def preview_point_cloud(output_data, air_block='minecraft:air', point_size=50, point_budget=DEFAULT_POINT_BUDGET):
+    """
+    使用 PyVista 可视化 Minecraft 方块数据的点云。
 
-    if len(points) == 0:
+    非空气方块超过 point_budget 时自动使用 LOD（见 show_with_lod），为 None 时总是显示全部方块。
+    output_data 可以是 VoxelGrid，也可以是旧格式的字典列表。
+    """
+    grid = as_voxel_grid(output_data, air_block=air_block)
+    if not grid.non_air_mask().any():
         print("❌ 没有可视化的方块（可能都是空气方块）")
         return
 
-    # 用 PyVista 创建点云
-    cloud = pv.PolyData(points)
-    cloud['colors'] = colors / 255.0  # PyVista 需要 0-1 范围的 RGB
-
-    # 绘图
+    # 点云坐标把 y 和 z 对调，让模型“站正”；颜色按 palette 下标查表（见 lod_point_cloud）
     plotter = pv.Plotter()
-    plotter.add_points(cloud, scalars='colors', rgb=True, point_size=point_size)
+
+    def add(cloud, name):
+        plotter.add_points(cloud, scalars='colors', rgb=True, point_size=point_size, name=name)
+
+    show_with_lod(plotter, grid, add, lod_point_cloud, point_budget, air_block)
     plotter.show()
 
-def preview_cubes_with_colors(output_data, air_block='minecraft:air'):
+def build_block_mesh(output_data, air_block='minecraft:air', merge_faces=True):
+    """
+    把所有非空气方块合并成一个 PolyData，只保留外露的面（相邻位置没有方块的面），
+    内部被遮挡的面全部剔除。每个面的颜色以 cell 标量 'colors'（0-255 RGB）存储，
+    整栋建筑只需要一个 actor。坐标同样把 y 和 z 对调，方块中心位于整数坐标。
+
+    merge_faces 为 True 时，同一行中相邻、朝向相同且方块相同的外露面合并成一个长方形
+    （一维的贪心合并），面数通常可以减少数倍。
+    """
+    grid = as_voxel_grid(output_data, air_block=air_block)
+    # 转为 (x, z, y) 顺序，与显示坐标一致，三个轴构成右手系
+    blocks = grid.blocks.transpose(2, 1, 0)
+    solid = np.pad(~grid.mask(air_block).transpose(2, 1, 0), 1)
+    dims = np.array(blocks.shape)
+    colors = palette_colors(grid.palette)
+    unit = np.eye(3, dtype=np.int64)
+
+    corners = []
+    face_colors = []
+    inner = (slice(1, -1),) * 3
+    for axis in range(3):
+        u, v = (axis + 1) % 3, (axis + 2) % 3
+        for side in (1, -1):
+            neighbor = list(inner)
+            neighbor[axis] = slice(1 + side, solid.shape[axis] - 1 + side)
+            exposed = solid[inner] & ~solid[tuple(neighbor)]
+            if not exposed.any():
+                continue
+
+            # 把 u 轴移到最后，沿 u 轴找出同一方块的连续外露面（每段只保留起点和长度）
+            others = [a for a in range(3) if a != u]
+            row_exposed = np.moveaxis(exposed, u, -1)
+            row_blocks = np.moveaxis(blocks, u, -1)
+            joined = np.zeros_like(row_exposed)
+            if merge_faces:
+                joined[..., 1:] = (row_exposed[..., 1:] & row_exposed[..., :-1]
+                                   & (row_blocks[..., 1:] == row_blocks[..., :-1]))
+            ends_next = np.zeros_like(joined)
+            ends_next[..., :-1] = joined[..., 1:]
+            starts = np.flatnonzero(row_exposed & ~joined)
+            lengths = np.flatnonzero(row_exposed & ~ends_next) - starts + 1
+
+            cells = np.empty((starts.size, 3), dtype=np.int64)
+            cells[:, others[0]], cells[:, others[1]], cells[:, u] = np.unravel_index(starts, row_exposed.shape)
+            span = lengths[:, None] * unit[u]
+            # 正方向的面位于方块的上界，顶点按从外侧看逆时针排列
+            if side == 1:
+                cells[:, axis] += 1
+                quad = [0 * span, span, span + unit[v], 0 * span + unit[v]]
+            else:
+                quad = [0 * span, 0 * span + unit[v], span + unit[v], span]
+            corners.append(np.stack([cells + offset for offset in quad], axis=1))
+            face_colors.append(colors[row_blocks.reshape(-1)[starts]])
+
+    if not corners:
+        return pv.PolyData()
+
+    # 相邻面共用的顶点按格点编号合并
+    corners = np.concatenate(corners)
+    lattice = np.ravel_multi_index(corners.reshape(-1, 3).T, dims + 1)
+    keys, faces = np.unique(lattice, return_inverse=True)
+    points = np.stack(np.unravel_index(keys, dims + 1), axis=1).astype(np.float32) - 0.5
+    mesh = pv.PolyData.from_regular_faces(points, faces.reshape(-1, 4))
+    mesh.cell_data['colors'] = np.concatenate(face_colors)
+    return mesh
+
+def measure_render(mesh, frames=60, window_size=(1280, 720)):
+    """
+    离屏渲染 mesh，每帧把相机绕竖直轴转动一次，返回每帧耗时（秒）的数组。
+    """
+    plotter = pv.Plotter(off_screen=True, window_size=list(window_size))
+    plotter.add_mesh(mesh, scalars='colors', rgb=True, show_edges=False)
+    plotter.show(auto_close=False)
+    times = np.empty(frames)
+    for i in range(frames):
+        plotter.camera.azimuth = 360.0 * i / frames
+        start = time.perf_counter()
+        plotter.render()
+        times[i] = time.perf_counter() - start
+    plotter.close()
+    return times
+
+def preview_cubes_with_colors(output_data, air_block='minecraft:air', off_screen=False, frames=60,
+                              point_budget=DEFAULT_POINT_BUDGET):
     """
     根据 Minecraft 方块数据生成立方体，并为每个方块设置不同的颜色。
+
+    所有方块合并为一个网格（见 build_block_mesh）后一次性添加到场景中；
+    非空气方块超过 point_budget 时自动使用 LOD（见 show_with_lod），为 None 时总是显示全部方块。
+    off_screen 为 True 时不打开窗口，离屏渲染 frames 帧并打印帧耗时，返回每帧耗时数组。
+    output_data 可以是 VoxelGrid，也可以是旧格式的字典列表。
     """
+    grid = as_voxel_grid(output_data, air_block=air_block)
+    if not grid.non_air_mask().any():
+        print("❌ 没有可视化的方块（可能都是空气方块）")
+        return None
+
+    if off_screen:
+        start = time.perf_counter()
+        mesh, level = budget_block_mesh(grid, point_budget)
+        build_seconds = time.perf_counter() - start
+        times = measure_render(mesh, frames=frames)
+        print(f"✅ LOD 第 {level} 层，{mesh.n_cells} 个外露面，建网格 {build_seconds * 1e3:.1f} ms，"
+              f"平均每帧 {times.mean() * 1e3:.2f} ms（最慢 {times.max() * 1e3:.2f} ms，约 {1 / times.mean():.0f} FPS）")
+        return times
+
     plotter = pv.Plotter()
 
-    for data in output_data:
-        x, y, z = data['coordinates']
-        block_name = data['block']
+    def add(mesh, name):
+        plotter.add_mesh(mesh, scalars='colors', rgb=True, show_edges=False, name=name)
 
-        if block_name == air_block:
-            continue  # 跳过空气方块
+    show_with_lod(plotter, grid, add, lod_block_mesh, point_budget, air_block)
+    plotter.show()
+    return None
 
-        # 生成立方体
-        cube = pv.Cube(center=(x, z, y), x_length=1, y_length=1, z_length=1)
+# 切片轴对应 coordinates() 返回的列
+SLICE_AXES = {'x': 0, 'y': 1, 'z': 2}
 
-        # 生成颜色（哈希转颜色）
-        color = hash(block_name) % 0xFFFFFF
-        r = (color >> 16) & 0xFF
-        g = (color >> 8) & 0xFF
-        b = color & 0xFF
-        color = [r / 255.0, g / 255.0, b / 255.0]
+def group_layers(output_data, slice_axis='z', air_block='minecraft:air'):
+    """
+    把非空气方块按切片轴分层：排序一次后按层的边界切分，不再对每一层重新扫描全部方块。
+    返回 (层坐标数组, 每层的 (N, 3) 坐标列表, 每层的 palette 下标列表)，坐标列顺序为 (x, y, z)。
+    """
+    if slice_axis not in SLICE_AXES:
+        raise ValueError(f"slice_axis 只能是 {', '.join(SLICE_AXES)}，实际为 {slice_axis!r}")
+    grid = as_voxel_grid(output_data, air_block=air_block)
+    mask = ~grid.mask(air_block)
+    coords = grid.coordinates(mask)
+    ids = grid.palette_indices(mask)
+
+    if not coords.size:
+        return np.empty(0, dtype=coords.dtype), [], []
+
+    order = np.argsort(coords[:, SLICE_AXES[slice_axis]], kind='stable')
+    coords, ids = coords[order], ids[order]
+    layer_of = coords[:, SLICE_AXES[slice_axis]]
+    bounds = np.flatnonzero(np.diff(layer_of)) + 1
+    layers = layer_of[np.concatenate([[0], bounds])]
+    return layers, np.split(coords, bounds), np.split(ids, bounds)
+
+def build_layer_meshes(output_data, slice_axis='z', air_block='minecraft:air'):
+    """
+    为每一层预先生成一个点云 PolyData（颜色存为 'colors' 点标量），返回 (层坐标数组, PolyData 列表)。
+    坐标同样把 y 和 z 对调。
+    """
+    grid = as_voxel_grid(output_data, air_block=air_block)
+    colors = palette_colors(grid.palette)
+    layers, coords, ids = group_layers(grid, slice_axis, air_block)
+    meshes = []
+    for layer_coords, layer_ids in zip(coords, ids):
+        cloud = pv.PolyData(layer_coords[:, [0, 2, 1]].astype(np.float32))
+        cloud['colors'] = colors[layer_ids]
+        meshes.append(cloud)
+    return layers, meshes
+
+def preview_slices(output_data, slice_axis='z', air_block='minecraft:air', show_below=True, point_size=5):
+    """
+    使用 PyVista 可视化 Minecraft 方块数据的切片展示。
 
-        # 直接在 add_mesh 里传颜色，避免 point_data 的问题
-        plotter.add_mesh(cube, color=color, show_edges=False)
+    每一层的网格只在打开窗口前生成一次，拖动滑块时只切换各层的可见性，不重新计算。
+    show_below 为 True 时同时显示当前层之前的所有层，否则只显示当前层。
+    output_data 可以是 VoxelGrid，也可以是旧格式的字典列表。
+    """
+    layers, meshes = build_layer_meshes(output_data, slice_axis, air_block)
+    if not meshes:
+        print("❌ 没有可视化的方块（可能都是空气方块）")
+        return
 
+    plotter = pv.Plotter()
+    actors = [plotter.add_points(mesh, scalars='colors', rgb=True, point_size=point_size) for mesh in meshes]
+
+    def show_layer(value):
+        current = int(round(value))
+        for i, actor in enumerate(actors):
+            actor.SetVisibility(i <= current if show_below else i == current)
+
+    show_layer(len(actors) - 1)
+    if len(actors) > 1:
+        plotter.add_slider_widget(lambda value: show_layer(value), [0, len(actors) - 1], value=len(actors) - 1,
+                                  title=f"{slice_axis} 层（共 {len(actors)} 层，从 {layers[0]} 开始）",
+                                  fmt="%.0f", interaction_event='always')
     plotter.show()
 
-def preview_slices(output_data, slice_axis='z', air_block='minecraft:air'):
+# 旋转/镜像只会改变 5 个属性通道（特征向量的第 2~6 位），属性取值范围为 -1~4
+ATTR_SIZE = FEATURE_SIZE - 2
+ATTR_VALUES = 6
+
+def _identity_attr_tables():
     """
-    使用 PyVista 可视化 Minecraft 方块数据的切片展示。
+    返回不改变任何属性的 (perm, values) 查找表，按 block_type + 1 索引（-1 为未知方块）：
+    perm[t, c]:       变换后第 c 个属性来自变换前的哪个属性
+    values[t, c, v]:  第 c 个属性的取值 v - 1 变换后的新取值
     """
-    slices = []
-    blocks = []
+    perm = np.tile(np.arange(ATTR_SIZE), (len(BLOCK_TYPE_MAP) + 1, 1))
+    values = np.tile(np.arange(-1, ATTR_VALUES - 1, dtype=np.int8), (len(BLOCK_TYPE_MAP) + 1, ATTR_SIZE, 1))
+    return perm, values
 
-    for data in output_data:
-        x, y, z = data['coordinates']
-        block_name = data['block']
+def _rotate_90_attr_tables():
+    """
+    绕 y 轴旋转 90 度时的属性查找表，方向与 transform_coordinates 一致：
+    (x, y, z) → (z, y, X-1-x)，即 east → north → west → south → east（north 为 -z）。
+    """
+    perm, values = _identity_attr_tables()
+    for key in ("stairs", "door"):
+        # facing: north → west, east → north, south → east, west → south
+        values[BLOCK_TYPE_MAP[key] + 1, 0, 1:5] = [3, 0, 1, 2]
+    # axis: x ↔ z
+    values[BLOCK_TYPE_MAP["log"] + 1, 0, 1:4] = [2, 1, 0]
+    for key in ("fence", "glass_pane"):
+        # [east, north, south, waterlogged, west] 分别取自旋转前的 [south, east, west, waterlogged, north]
+        perm[BLOCK_TYPE_MAP[key] + 1] = [2, 0, 4, 3, 1]
+    return perm, values
+
+def _mirror_north_south_attr_tables():
+    """南北镜像（x 取反）时的属性查找表。"""
+    perm, values = _identity_attr_tables()
+    for key in ("stairs", "door"):
+        # facing: east ↔ west
+        values[BLOCK_TYPE_MAP[key] + 1, 0, 1:5] = [0, 3, 2, 1]
+    # 门的 hinge: left ↔ right
+    values[BLOCK_TYPE_MAP["door"] + 1, 2, 1:3] = [1, 0]
+    # 楼梯的 shape: inner_left ↔ inner_right，outer_left ↔ outer_right
+    values[BLOCK_TYPE_MAP["stairs"] + 1, 2, 1:6] = [0, 2, 1, 4, 3]
+    for key in ("fence", "glass_pane"):
+        # x 取反：east ↔ west，[east, north, south, waterlogged, west] → [west, north, south, waterlogged, east]
+        perm[BLOCK_TYPE_MAP[key] + 1] = [4, 1, 2, 3, 0]
+    return perm, values
+
+def _compose_attr_tables(first, second):
+    """返回先应用 first 再应用 second 的属性查找表。"""
+    perm1, values1 = first
+    perm2, values2 = second
+    types = np.arange(len(BLOCK_TYPE_MAP) + 1)[:, None]
+    perm = np.take_along_axis(perm1, perm2, axis=1)
+    # values[t, c, v] = values2[t, c, values1[t, perm2[t, c], v] + 1]
+    moved = values1[types, perm2]
+    values = np.take_along_axis(values2, moved.astype(np.intp) + 1, axis=2)
+    return perm, values
+
+def _build_d4_transforms():
+    """
+    构建 D4 二面体群的 8 个变换：先（可选）南北镜像，再绕 y 轴旋转 k 次 90 度。
+    前 6 个的顺序与旧版 generate_rotated_and_mirrored_data 的输出一致。
+    """
+    rotate = _rotate_90_attr_tables()
+    mirror = _mirror_north_south_attr_tables()
+    layout = [
+        ("original", 0, False),
+        ("rotate_90", 1, False),
+        ("rotate_180", 2, False),
+        ("rotate_270", 3, False),
+        ("mirror_north_south", 0, True),
+        ("mirror_east_west", 2, True),
+        ("mirror_north_south_rotate_90", 1, True),
+        ("mirror_north_south_rotate_270", 3, True),
+    ]
+    transforms = {}
+    for name, turns, mirrored in layout:
+        tables = mirror if mirrored else _identity_attr_tables()
+        for _ in range(turns):
+            tables = _compose_attr_tables(tables, rotate)
+        transforms[name] = (turns, mirrored) + tables
+    return transforms
+
+# 名称 → (旋转次数, 是否先南北镜像, perm 表, values 表)
+D4_TRANSFORMS = _build_d4_transforms()
+
+def transform_coordinates(volume, transform):
+    """
+    对 (X, Y, Z, ...) 数组做 D4 变换的坐标部分：南北镜像为沿 x 翻转，
+    旋转 90 度为 (x, y, z) → (z, y, X-1-x)。返回视图，不复制数据。
+    """
+    turns, mirrored = D4_TRANSFORMS[transform][:2]
+    if mirrored:
+        volume = np.flip(volume, axis=0)
+    return np.rot90(volume, turns, axes=(2, 0))
 
-        if block_name == air_block:
-            continue  # 跳过空气方块
+def transform_attributes(features, transform):
+    """
+    用预先计算的查找表对特征数组（最后一维为 7）做 D4 变换的属性部分，
+    重新映射 facing、axis、hinge、shape 以及栅栏/玻璃板的连接方向。
+    """
+    perm, values = D4_TRANSFORMS[transform][2:]
+    features = np.asarray(features)
+    types = features[..., 0].astype(np.intp) + 1
+    moved = np.take_along_axis(features[..., 2:], perm[types], axis=-1)
+    result = features.copy()
+    result[..., 2:] = values[types[..., None], np.arange(ATTR_SIZE), moved.astype(np.intp) + 1]
+    return result
+
+def transform_features(features, transform):
+    """对 (X, Y, Z, 7) 特征张量做完整的 D4 变换，返回新的连续数组。"""
+    return np.ascontiguousarray(transform_attributes(transform_coordinates(features, transform), transform))
+
+def parse_block(block_str, report_unknown=True):
+    """
+    解析方块状态字符串，返回 (block_type, subtype, 5 个属性的列表)，无法识别时返回 None。
 
-        # 按切片轴对方块进行分组
-        if slice_axis == 'z':
-            slices.append(z)
-        elif slice_axis == 'y':
-            slices.append(y)
-        else:
-            slices.append(x)
+    方块类别和属性定义见 block_registry.json；同一个状态字符串只解析一次。
+    """
+    parsed = REGISTRY.parse(block_str)
+    if parsed is None and report_unknown and block_str.startswith("minecraft:"):
+        print(f"未知方块类型: {block_str[len('minecraft:'):].split('[', 1)[0]}")
+    return parsed
+
+# 特征向量只记录了方块类别，还原方块状态时使用的默认方块（楼梯按 subtype 区分材质，subtype 为 -1 时为石楼梯）
+FEATURE_BLOCK_NAMES = REGISTRY.default_blocks
+STAIR_SUBTYPE_NAMES = {subtype: name for name, subtype in STAIR_SUBTYPE_MAP.items()}
+# 栅栏门与栅栏同属 fence 类别，特征中没有栅栏门自己的属性（facing、open 等），还原时只写方块名称
+FENCE_GATE_SUBTYPE = REGISTRY.subtypes[BLOCK_TYPE_MAP["fence"]]["oak_fence_gate"]
+
+# parse_block 的逆映射：每种方块的属性通道依次对应的属性名称和取值
+FEATURE_PROPERTIES = {block_type: [(prop, values) for prop, values, _ in schema]
+                      for block_type, schema in REGISTRY.properties.items()}
+
+def decode_feature(feature):
+    """
+    把一个特征向量 [block_type, subtype, attr_0, ..., attr_4] 还原为方块状态字符串（parse_block 的逆操作）。
 
-        blocks.append([x, y, z])
+    未填充或无法识别的类别还原为空气；超出取值范围的属性省略，由游戏使用默认值。
+    """
+    block_type, subtype, *attrs = (int(v) for v in feature)
+    if block_type not in FEATURE_BLOCK_NAMES:
+        return "minecraft:air"
+    name = FEATURE_BLOCK_NAMES[block_type]
+    if block_type == BLOCK_TYPE_MAP["stairs"]:
+        name = STAIR_SUBTYPE_NAMES.get(subtype, name)
+    if block_type == BLOCK_TYPE_MAP["fence"] and subtype == FENCE_GATE_SUBTYPE:
+        return "minecraft:oak_fence_gate"
+
+    properties = []
+    for (prop, values), value in zip(FEATURE_PROPERTIES.get(block_type, []), attrs):
+        if 0 <= value < len(values):
+            properties.append(f"{prop}={values[value]}")
+    # 与游戏导出的 palette 一致，属性按名称排序
+    properties.sort()
+    return f"minecraft:{name}[{','.join(properties)}]" if properties else f"minecraft:{name}"
+
+# decode_feature 的缓存：特征向量（打包成 int64）-> 方块状态字符串
+_decoded_feature_cache = {}
+
+def decode_features(features, air_block='minecraft:air'):
+    """
+    把 (X, Y, Z, 7) 的特征张量还原为 VoxelGrid。
 
-    # 获取唯一的切片层（去重）
-    slice_layers = list(set(slices))
-    slice_layers.sort()
+    特征向量先打包成 int64 用 np.unique 去重，每种特征只查一次缓存的逆映射表。
+    """
+    features = np.asarray(features, dtype=np.int8)
+    if features.ndim != 4 or features.shape[3] != FEATURE_SIZE:
+        raise ValueError(f"特征张量形状应为 (X, Y, Z, {FEATURE_SIZE})，实际为 {features.shape}")
+    packed = np.zeros(features.shape[:3] + (8,), dtype=np.int8)
+    packed[..., :FEATURE_SIZE] = features
+    keys, inverse = np.unique(packed.view(np.int64).ravel(), return_inverse=True)
+
+    names = []
+    for key, row in zip(keys.tolist(), keys.view(np.int8).reshape(-1, 8)):
+        if key not in _decoded_feature_cache:
+            _decoded_feature_cache[key] = decode_feature(row[:FEATURE_SIZE])
+        names.append(_decoded_feature_cache[key])
+
+    # 特征张量按 [x, y, z] 索引，VoxelGrid 按 [y, z, x]
+    blocks = inverse.reshape(features.shape[:3]).transpose(1, 2, 0)
+    dtype = np.uint16 if len(names) <= 2**16 else np.uint32
+    return VoxelGrid(blocks.astype(dtype), names, air_block=air_block)
+
+def export_structures(structures, output_dir="schem_out", output_file="structure_", recompute_states=True):
+    """
+    批量把特征张量写成 .schem 文件（output_dir/output_file{i}.schem），返回文件路径列表。
 
-    # 构建并展示每一层切片
-    plotter = pv.Plotter()
-    for slice_layer in slice_layers:
-        slice_data = [block for i, block in enumerate(blocks) if blocks[i][2] == slice_layer]
-        points = np.array(slice_data)
+    recompute_states: 为 True 时先按相邻方块重算楼梯的 shape 和栅栏/玻璃板的连接方向
+                      （见 block_states.py），模型生成的结构中这些属性常常与相邻方块不一致
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for i, structure in enumerate(structures):
+        path = os.path.join(output_dir, f"{output_file}{i}.schem")
+        if recompute_states:
+            structure = recompute_block_states(structure)
+        write_schem(decode_features(structure), path)
+        paths.append(path)
+    print(f"✅ {len(paths)} 个结构已导出到 {output_dir}/")
+    return paths
+
+def build_feature_lut(palette, registry=REGISTRY):
+    """
+    把 palette 中每种方块只解析一次，得到 (P, 7) 的 int8 特征表。
 
-        if len(points) > 0:
-            cloud = pv.PolyData(points)
-            plotter.add_points(cloud, color='blue', point_size=5)
+    每行为 [block_type, subtype, attr_0, ..., attr_4]，与 npy 中每个体素的特征向量一致；
+    无法识别的方块整行为 -1（与 npy 中未填充的位置相同），按方块名称汇总后只提示一次。
+    registry 默认为进程共用的 REGISTRY，其中已解析过的状态字符串不再解析。
+    """
+    with profiling.stage("parse_block"):
+        lut = registry.feature_table(palette)
+
+    unknown = {}
+    for i in np.flatnonzero(lut[:, 0] == -1):
+        # 同一种方块的不同状态（如 stone_brick_wall[...]）合并统计
+        name = palette[i].split('[', 1)[0]
+        unknown[name] = unknown.get(name, 0) + 1
+    for name, count in unknown.items():
+        print(f"未知方块类型: {name}（{count} 个 palette 项）")
+    return lut
+
+def extract_features(grid, lut=None):
+    """
+    通过一次查表得到每个体素的特征张量，形状为 (H, L, W, 7)，即 features[y, z, x]。
 
-    plotter.show()
+    lut: 可选的预先构建好的特征表（见 build_feature_lut），默认按 grid.palette 构建。
+    """
+    grid = as_voxel_grid(grid)
+    if lut is None:
+        lut = build_feature_lut(grid.palette)
+    return lut[grid.blocks]
 
-def rotate_block(x, y, z, rotation_angle, max_x, max_z):
-    if rotation_angle == 90:
-        return z, y, max_x - x
-    elif rotation_angle == 180:
-        return max_x - x, y, max_z - z
-    elif rotation_angle == 270:
-        return max_z - z, y, x
-    return x, y, z
-
-def rotate_attr_vector(block_type, attr_vector, rotation_angle):
-    if block_type == BLOCK_TYPE_MAP["stairs"] or block_type == BLOCK_TYPE_MAP["door"]:
-        facing = attr_vector[0]
-        new_facing = (facing + rotation_angle // 90) % 4
-        attr_vector[0] = new_facing
-    elif block_type == BLOCK_TYPE_MAP["log"]:
-        axis = attr_vector[0]
-        axis_map = {0: 2, 2: 0} if rotation_angle in [90, 270] else {0: 0, 1: 1, 2: 2}
-        attr_vector[0] = axis_map.get(axis, axis)
-    elif block_type in [BLOCK_TYPE_MAP["fence"], BLOCK_TYPE_MAP["glass_pane"]]:
-        east, north, south, waterlogged, west = attr_vector
-        if rotation_angle == 90:
-            attr_vector = [north, west, east, waterlogged, south]
-        elif rotation_angle == 180:
-            attr_vector = [west, south, north, waterlogged, east]
-        elif rotation_angle == 270:
-            attr_vector = [south, east, west, waterlogged, north]
-    return attr_vector
-
-def mirror_block(x, y, z, mirror_direction, max_x, max_z):
-    if mirror_direction == "north_south":
-        return max_x - x, y, z
-    elif mirror_direction == "east_west":
-        return x, y, max_z - z
-    return x, y, z
-
-def mirror_attr_vector(block_type, attr_vector, mirror_direction):
-    if block_type == BLOCK_TYPE_MAP["stairs"] or block_type == BLOCK_TYPE_MAP["door"]:
-        facing = attr_vector[0]
-        if mirror_direction == "north_south":
-            attr_vector[0] = facing if facing in [0, 2] else 4 - facing
-            if block_type == BLOCK_TYPE_MAP["door"]:
-                attr_vector[2] = abs(attr_vector[2] - 1)
-            elif block_type == BLOCK_TYPE_MAP["stairs"]:
-                if attr_vector[2] in {1, 2, 3, 4}:
-                    attr_vector[2] = {1: 2, 2: 1, 3: 4, 4: 3}.get(attr_vector[2], attr_vector[2])
-        elif mirror_direction == "east_west":
-            attr_vector[0] = facing if facing in [1, 3] else 2 - facing
-            if block_type == BLOCK_TYPE_MAP["door"]:
-                attr_vector[2] = abs(attr_vector[2] - 1)
-            elif block_type == BLOCK_TYPE_MAP["stairs"]:
-                if attr_vector[2] in {1, 2, 3, 4}:
-                    attr_vector[2] = {1: 2, 2: 1, 3: 4, 4: 3}.get(attr_vector[2], attr_vector[2])
-    elif block_type in [BLOCK_TYPE_MAP["fence"], BLOCK_TYPE_MAP["glass_pane"]]:
-        east, north, south, waterlogged, west = attr_vector            
-        if mirror_direction == "north_south":
-            attr_vector = [east, south, north, waterlogged, west]
-        elif mirror_direction == "east_west":
-            attr_vector = [west, north, south, waterlogged, east]
-    return attr_vector
-
-def parse_block(block_str):
-    match = re.match(r"minecraft:(\w+)(?:\[(.*?)\])?", block_str)
-    if not match:
-        return None
+def apply_block_fixups(grid):
+    """
+    导出数据集前的方块修正：泥土统一替换为草方块，并把 y=9 层的四个角置为空气。
+    返回新的 VoxelGrid，不修改原网格。
+    """
+    palette = list(grid.palette)
+    remap = np.arange(len(palette))
+    if 'minecraft:dirt' in palette:
+        dirt = palette.index('minecraft:dirt')
+        if 'minecraft:grass_block[snowy=false]' in palette:
+            remap[dirt] = palette.index('minecraft:grass_block[snowy=false]')
+        else:
+            palette[dirt] = 'minecraft:grass_block[snowy=false]'
+    blocks = remap[grid.blocks].astype(grid.blocks.dtype)
 
-    block_name, properties = match.groups()
-    for key in BLOCK_TYPE_MAP:
-        if key in block_name:
-            block_type = BLOCK_TYPE_MAP[key]
-            break
-    else:
-        print(f"未知方块类型: {block_name}")
-        return None
+    if 'minecraft:air' not in palette:
+        palette.append('minecraft:air')
+    air = palette.index('minecraft:air')
+    height, length, width = blocks.shape
+    for x, z in [(9, 9), (0, 9), (0, 0), (9, 0)]:
+        if x < width and 9 < height and z < length:
+            blocks[9, z, x] = air
 
-    attr_vector = []
-    subtype = -1
-    prop_dict = {}
-    if properties:
-        prop_dict = dict(prop.split('=') for prop in properties.split(','))
+    return VoxelGrid(blocks, palette, air_block=grid.air_block)
 
-    if block_type == BLOCK_TYPE_MAP["stairs"]:
-        subtype = STAIR_SUBTYPE_MAP.get(block_name, -1)
-        attr_vector = [
-            ["north", "east", "south", "west"].index(prop_dict.get("facing", "north")),
-            0 if prop_dict.get("half", "bottom") == "bottom" else 1,
-            ["straight","inner_left", "inner_right", "outer_left", "outer_right"].index(prop_dict.get("shape", "straight")),
-            0 if prop_dict.get("waterlogged", "false") == "false" else 1
-        ]
-    elif block_type == BLOCK_TYPE_MAP["log"]:
-        axis_map = {'x': 0, 'y': 1, 'z': 2}
-        attr_vector = [axis_map.get(prop_dict.get('axis', 'y'))]
-    elif block_type == BLOCK_TYPE_MAP["slab"]:
-        attr_vector = [
-            0 if prop_dict.get("type", "bottom") == "bottom" else 1,
-            0 if prop_dict.get("waterlogged", "false") == "false" else 1
-        ]
-    elif block_type in (BLOCK_TYPE_MAP["fence"], BLOCK_TYPE_MAP["glass_pane"]):
-        attr_vector = [
-            0 if prop_dict.get("east", "false") == "false" else 1,
-            0 if prop_dict.get("north", "false") == "false" else 1,
-            0 if prop_dict.get("south", "false") == "false" else 1,
-            0 if prop_dict.get("waterlogged", "false") == "false" else 1,
-            0 if prop_dict.get("west", "false") == "false" else 1
-        ]
-    elif block_type == BLOCK_TYPE_MAP["door"]:
-        attr_vector = [
-            ["north", "east", "south", "west"].index(prop_dict.get("facing", "north")),
-            0 if prop_dict.get("half", "lower") == "lower" else 1,
-            0 if prop_dict.get("hinge", "left") == "left" else 1,
-            0 if prop_dict.get("open", "false") == "false" else 1,
-            0 if prop_dict.get("powered", "false") == "false" else 1
-        ]
-    elif block_type == BLOCK_TYPE_MAP["grass_block"]:
-        attr_vector = [0 if prop_dict.get("snowy", "false") == "false" else 1]
-    elif block_type == BLOCK_TYPE_MAP["air"]:
-        attr_vector = []
-    while len(attr_vector) < 5:
-        attr_vector.append(-1)
-    return (block_type, subtype, attr_vector)
-
-def process_block_data(schem_file):
-    # 确保 schem 文件夹存在
-    if not os.path.exists("schem"):
-        os.makedirs("schem")
-    
-    # 加载 .schem 文件
-    schem_path = os.path.join("schem", schem_file)
-    schem_data = load(schem_path)
-    palette = schem_data['Palette']
-    block_data = schem_data['BlockData']
-    width = schem_data['Width']
-    height = schem_data['Height']
-    length = schem_data['Length']
-
-    # 解码 block_data
-    decoded_block_data = decode_block_data(block_data)
-
-    # 构建输出数据
-    output_data = build_output_data(decoded_block_data, palette, width, height, length)
-    
-    # 用户输入检测
+def export_block_data_txt(grid, filename):
+    """
+    把 VoxelGrid 按 "x,y,z,方块名称" 的格式逐行写入文本文件（顺序与 BlockData 一致）。
+    """
+    # 每种方块的行尾只格式化一次
+    suffixes = [f",{name}\n" for name in grid.palette]
+    coords = grid.coordinates().tolist()
+    indices = grid.palette_indices().tolist()
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.writelines(f"{x},{y},{z}{suffixes[i]}" for (x, y, z), i in zip(coords, indices))
+
+def iter_block_ids(stream):
+    """
+    逐块解码 SchematicStream 中的 BlockData，生成 int32 方块 ID 数组。
+    跨越块边界的 varint 留到下一块开头一起解码。
+    """
+    carry = np.empty(0, dtype=np.uint8)
+    for chunk in stream.iter_block_data():
+        if carry.size:
+            chunk = np.concatenate([carry, chunk])
+        ends = np.flatnonzero(chunk < 0x80)
+        if ends.size == 0:
+            carry = chunk
+            continue
+        cut = ends[-1] + 1
+        yield decode_block_data(chunk[:cut].view(np.int8))
+        carry = chunk[cut:]
+    if carry.size:
+        decode_block_data(carry.view(np.int8))  # 以未结束的 varint 结尾，抛出 ValueError
+
+def iter_schematic_slabs(schem_path, slab_height=16, air_block='minecraft:air', chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    流式读取 .schem 文件，沿 y 方向每 slab_height 层生成一个 (y0, VoxelGrid)。
+
+    边解压边解码，内存占用只与一个 slab 的大小有关，可处理超过内存的建筑。
+    slab_height 为 None 时一次返回整个网格。ID 的处理与 VoxelGrid.from_block_data 一致：
+    palette 中缺失的 ID 记为 'unknown'，BlockData 不足时补 'unknown'，多余部分忽略。
+    """
+    with SchematicStream(schem_path, chunk_bytes) as stream:
+        width, height, length = stream.width, stream.height, stream.length
+        names = ['unknown'] * (max(stream.palette.values(), default=-1) + 1)
+        for block, block_id in stream.palette.items():
+            names[block_id] = block
+        dtype = np.uint16 if len(names) <= 2**16 else np.uint32
+        slab_height = slab_height or height
+        layer = width * length
+
+        ids = iter_block_ids(stream)
+        pending = np.empty(0, dtype=np.int32)
+        for y0 in range(0, height, slab_height):
+            rows = min(slab_height, height - y0)
+            buffer = np.empty(rows * layer, dtype=dtype)
+            filled = 0
+            while filled < buffer.size:
+                if not pending.size:
+                    pending = next(ids, None)
+                    if pending is None:
+                        # BlockData 不足，剩余位置补 'unknown'
+                        if 'unknown' not in names:
+                            names.append('unknown')
+                        buffer[filled:] = names.index('unknown')
+                        pending = np.empty(0, dtype=np.int32)
+                        break
+                    if pending.size and pending.max() >= len(names):
+                        if pending.max() >= np.iinfo(dtype).max:
+                            raise ValueError(f"BlockData 中的 ID {pending.max()} 超出 palette 范围")
+                        names.extend(['unknown'] * (int(pending.max()) + 1 - len(names)))
+                take = min(pending.size, buffer.size - filled)
+                buffer[filled:filled + take] = pending[:take]
+                pending = pending[take:]
+                filled += take
+            yield y0, VoxelGrid(buffer.reshape(rows, length, width), list(names), air_block=air_block)
+
+def iter_schematic_chunks(schem_path, chunk_size=16, air_block='minecraft:air'):
+    """
+    流式读取 .schem 文件，按 chunk_size³ 的区块生成 ((x0, y0, z0), VoxelGrid)，边缘区块可能更小。
+    """
+    for y0, slab in iter_schematic_slabs(schem_path, chunk_size, air_block=air_block):
+        for z0 in range(0, slab.length, chunk_size):
+            for x0 in range(0, slab.width, chunk_size):
+                yield (x0, y0, z0), slab[:, z0:z0 + chunk_size, x0:x0 + chunk_size]
+
+def read_sponge(schem_path):
+    """流式读取 Sponge .schem 文件（v1/v2/v3），解码到预先分配的 uint16 网格中，返回 (blocks, palette)。"""
+    _, grid = next(iter_schematic_slabs(schem_path, slab_height=None))
+    return grid.blocks, grid.palette
+
+register_reader(".schem", read_sponge)
+
+def load_schematic(schem_path):
+    """
+    加载结构文件，返回 VoxelGrid。按扩展名选择读取函数（见 schematic_formats）：
+    Sponge .schem（流式）、MCEdit .schematic、Litematica .litematic 都解码为同样的 palette 下标网格。
+    """
+    with profiling.stage("load", schem_path) as info:
+        grid = VoxelGrid(*read_schematic(schem_path))
+        info["voxels"] = len(grid)
+    print(f"✅ 成功加载 {len(grid)} 个方块数据！")
+    print(f"✅ 成功加载 {len(grid.palette)} 个方块 ID！")
+    print(f"✅ 地图尺寸 (宽度x): {grid.width}，(高度y): {grid.height}，(长度z): {grid.length}")
+    return grid
+
+def preview_menu(output_data):
+    """交互式选择可视化方式，直到用户输入 q/Q 退出。"""
     while True:
         user_input = input("请输入要可视化的选项（1: 点云, 2: 切片, 3: 彩色立方体, 13: 点云和彩色立方体, q/Q: 退出）：")
         
@@ -421,32 +1058,45 @@ def process_block_data(schem_file):
                 preview_cubes_with_colors(output_data)
             if '1' not in user_input and '2' not in user_input and '3' not in user_input:
                 print("无效的输入，请重新输入。")
-                
-    # 保存方块数据到文本文件
-    with open('block_data.txt', 'w', encoding='utf-8') as f:
-        for block in output_data:
-            x, y, z = block['coordinates']
-            block_name = block['block']
-            if block_name == 'minecraft:dirt':
-                block_name = 'minecraft:grass_block[snowy=false]'
-            if x == 9 and y == 9 and z == 9:
-                block_name = 'minecraft:air'
-            elif x == 0 and y == 9 and z == 9:
-                block_name = 'minecraft:air'
-            elif x == 0 and y == 9 and z == 0:
-                block_name = 'minecraft:air'
-            elif x == 9 and y == 9 and z == 0:
-                block_name = 'minecraft:air'
-            f.write(f"{x},{y},{z},{block_name}\n")
-
-    # 保存元数据
-    with open('metadata.txt', 'w', encoding='utf-8') as f:
-        f.write(f"{width},{height},{length}\n")
-        for block, block_id in palette.items():
-            f.write(f"{block},{block_id}\n")
+
+def process_block_data(schem_file, interactive=True, dump_txt=True, cache=None):
+    """
+    加载 schem 文件夹中的 .schem 文件并返回 VoxelGrid。
+
+    interactive: 是否进入交互式可视化菜单
+    dump_txt: 是否导出 block_data.txt 和 metadata.txt（旧的文本流程需要）
+    cache: 可选的 StageCache，文件未改动时直接读取缓存的网格
+    """
+    # 确保 schem 文件夹存在
+    if not os.path.exists("schem"):
+        os.makedirs("schem")
+    
+    # 流式加载 .schem 文件
+    output_data = load_schematic_cached(os.path.join("schem", schem_file), cache)
+    
+    # 用户输入检测
+    if interactive:
+        with profiling.stage("preview", schem_file):
+            preview_menu(output_data)
+
+    if not dump_txt:
+        return output_data
+
+    with profiling.stage("export_txt", schem_file) as info:
+        info["voxels"] = len(output_data)
+        # 保存方块数据到文本文件
+        export_block_data_txt(apply_block_fixups(output_data), 'block_data.txt')
+
+        # 保存元数据（格式与 nbtlib 标签的字符串形式一致）
+        with open('metadata.txt', 'w', encoding='utf-8') as f:
+            f.write(f"{Int(output_data.width)},{Int(output_data.height)},{Int(output_data.length)}\n")
+            for block_id, block in enumerate(output_data.palette):
+                f.write(f"{block},{Int(block_id)}\n")
     print("✅ 方块数据已成功导出到 block_data.txt！")
     print("✅ 元数据已成功导出到 metadata.txt！")
 
+    return output_data
+
 def parse_and_process_block_data():
     input_file = "block_data.txt"
     output_file = "parsed_block_data.txt"
@@ -454,161 +1104,396 @@ def parse_and_process_block_data():
     with open(input_file, "r", encoding="utf-8") as f:
         block_data = f.readlines()
 
+    # 每种方块字符串只解析一次
+    parsed_cache = {}
     with open(output_file, "w", encoding="utf-8") as f:
         for line in block_data:
             parts = line.strip().split(',', 3)
             x, y, z, block_name = parts
-            result = int(x), int(y), int(z), parse_block(block_name)
+            if block_name not in parsed_cache:
+                parsed_cache[block_name] = parse_block(block_name)
+            result = int(x), int(y), int(z), parsed_cache[block_name]
             if result:
                 f.write(f"{result}\n")
     print(f"✅ 解析完成，结果已保存到 {output_file}")
 
+def export_parsed_block_data_txt(grid, filename):
+    """
+    把 VoxelGrid 按 parsed_block_data.txt 的格式逐行写入（每种方块只解析一次）。
+    """
+    suffixes = [f", {parse_block(name, report_unknown=False)})\n" for name in grid.palette]
+    coords = grid.coordinates().tolist()
+    indices = grid.palette_indices().tolist()
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.writelines(f"({x}, {y}, {z}{suffixes[i]}" for (x, y, z), i in zip(coords, indices))
+
+def dump_debug_txt(grid, output_dir="."):
+    """
+    导出调试用的 block_data.txt、metadata.txt 和 parsed_block_data.txt，
+    格式与旧的文本流程一致，便于人工检查。
+    """
+    export_block_data_txt(grid, os.path.join(output_dir, 'block_data.txt'))
+    with open(os.path.join(output_dir, 'metadata.txt'), 'w', encoding='utf-8') as f:
+        f.write(f"{Int(grid.width)},{Int(grid.height)},{Int(grid.length)}\n")
+        for block_id, block in enumerate(grid.palette):
+            f.write(f"{block},{Int(block_id)}\n")
+    export_parsed_block_data_txt(grid, os.path.join(output_dir, 'parsed_block_data.txt'))
+    print(f"✅ 调试文本已导出到 {os.path.abspath(output_dir)}")
+
+def augment_grid(grid, transforms=None, lut=None, with_names=False, recompute_states=False):
+    """
+    对 VoxelGrid 做 D4 旋转/镜像增强，返回去重后的 (X, Y, Z, 7) int8 结构数组列表。
+
+    属性变换只作用在 (P, 7) 的 palette 特征表上，坐标变换只作用在 palette 下标网格上，
+    最后对每个变换做一次查表得到特征张量。
+    transforms: 变换名称列表（见 D4_TRANSFORMS），默认使用全部 8 个。
+    lut: 可选的预先构建好的特征表（见 build_feature_lut），默认按 grid.palette 构建。
+    with_names: 为 True 时返回 (变换名称, 数组) 列表。
+    recompute_states: 为 True 时对每个变体按相邻方块重算楼梯 shape 和栅栏/玻璃板连接（见 block_states.py）。
+    """
+    grid = as_voxel_grid(grid)
+    transforms = list(D4_TRANSFORMS) if transforms is None else list(transforms)
+    if lut is None:
+        lut = build_feature_lut(grid.palette)
+    index = grid.blocks.transpose(2, 0, 1)  # (H, L, W) → (X, Y, Z)
+    with profiling.stage("augment") as info:
+        info["voxels"] = len(grid) * len(transforms)
+        variants = augment_indexed(index, lut, transforms)
+    if recompute_states:
+        variants = recompute_variants(variants)
+    return unique_variants(transforms, variants, with_names)
+
+def recompute_variants(variants):
+    """按相邻方块重算每个变体的楼梯 shape 和栅栏/玻璃板连接（直接修改变体数组）。"""
+    with profiling.stage("recompute_states") as info:
+        info["voxels"] = sum(int(np.prod(variant.shape[:3])) for variant in variants)
+        return [recompute_block_states(variant, inplace=True) for variant in variants]
+
+def run_pipeline(source, dump_txt=False, debug_dir=".", with_names=False, recompute_states=False):
+    """
+    内存中的完整数据流程：.schem → VoxelGrid → 方块修正 → 旋转/镜像增强 → 结构数组。
+
+    source: .schem 文件路径，或已经加载好的 VoxelGrid
+    dump_txt: 是否额外导出调试用的文本文件（见 dump_debug_txt）
+    with_names: 为 True 时返回 (变换名称, 数组) 列表
+    recompute_states: 为 True 时对每个变体按相邻方块重算楼梯 shape 和栅栏/玻璃板连接
+    返回去重后的 (X, Y, Z, 7) int8 结构数组列表（D4 全部 8 个变换）。
+    """
+    grid = source if isinstance(source, VoxelGrid) else load_schematic(source)
+    with profiling.stage("fixups") as info:
+        info["voxels"] = len(grid)
+        grid = apply_block_fixups(grid)
+    if dump_txt:
+        with profiling.stage("dump_txt"):
+            dump_debug_txt(grid, debug_dir)
+    return augment_grid(grid, with_names=with_names, recompute_states=recompute_states)
+
+# 流程版本：修改解码、方块修正、特征提取或增强的逻辑时加一，使旧的缓存条目失效
+PIPELINE_VERSION = 2
+# 决定加载和解析结果的数据文件：方块注册表和旧格式的数字 ID 对照表
+MAPPING_FILES = (REGISTRY_FILE, LEGACY_BLOCKS_FILE)
+
+def cache_salt(recompute_states=False):
+    """
+    缓存键中文件内容以外的部分：流程版本、是否重算方块状态和 MAPPING_FILES 中各数据文件的内容
+    （block_registry.json、legacy_blocks.json），任何一项变化后旧的缓存都不再命中。
+    """
+    options = {"version": PIPELINE_VERSION, "recompute_states": recompute_states}
+    salt = [json.dumps(options, sort_keys=True).encode("utf-8")]
+    for path in MAPPING_FILES:
+        with open(path, "rb") as f:
+            data = f.read()
+        # 每个文件前写入长度，避免内容在文件之间移动时得到相同的拼接结果
+        salt.append(len(data).to_bytes(8, "little") + data)
+    return b"".join(salt)
+
+def load_schematic_cached(schem_path, cache=None):
+    """加载 .schem 文件；cache（StageCache）中有解码后的网格时直接读取，否则加载后写入缓存。"""
+    if cache is None:
+        return load_schematic(schem_path)
+    key = cache.key(schem_path)
+    arrays = cache.get(key, "grid")
+    if arrays is not None:
+        grid = VoxelGrid(arrays["blocks"], arrays["palette"].tolist())
+        print(f"✅ 从缓存读取 {len(grid)} 个方块数据（{schem_path}）")
+        return grid
+    grid = load_schematic(schem_path)
+    cache.put(key, "grid", {"blocks": grid.blocks, "palette": np.array(grid.palette, dtype=str)})
+    return grid
+
+def cached_variants(cache, key):
+    """返回缓存中通过往返检查的 (变换名称, 结构数组) 列表，未命中时返回 None。"""
+    arrays = None if cache is None else cache.get(key, "variants")
+    return None if arrays is None else list(arrays.items())
+
+def cache_variants(cache, key, named_structures):
+    """把通过往返检查的 (变换名称, 结构数组) 列表写入缓存。"""
+    if cache is not None:
+        cache.put(key, "variants", dict(named_structures))
+
 def get_unique_arrays(arrays):
-    """返回独特数组的数组（使用哈希表优化）"""
+    """返回独特数组的数组（以 int8 字节内容的摘要作为哈希键，保留首次出现的顺序）"""
     seen = set()
     unique_arrays = []
     for arr in arrays:
-        arr_hashable = tuple(map(tuple, arr))  # 将数组转换为可哈希的元组
-        if arr_hashable not in seen:
+        arr = np.asarray(arr)
+        digest = structure_digest(arr)
+        if digest not in seen:
             unique_arrays.append(arr)
-            seen.add(arr_hashable)
+            seen.add(digest)
     return unique_arrays
 
-def generate_rotated_and_mirrored_data():
-    input_file = "parsed_block_data.txt"
-    output_file = "block_data_"
+def unique_variants(transforms, variants, with_names=False):
+    """
+    检查南北镜像是否与原结构一致，并返回去重后的变体列表。
+    with_names 为 True 时返回 (变换名称, 数组) 列表。
+    """
+    named = dict(zip(transforms, variants))
+    if "original" in named and "mirror_north_south" in named:
+        if np.array_equal(named["original"], named["mirror_north_south"]):
+            print("原数组与南北镜像后的数组完全一致！")
+        else:
+            print("原数组与南北镜像后的数组不同")
+    unique_arrays = get_unique_arrays(variants)
+    if not with_names:
+        return unique_arrays
 
-    blocks_original, blocks_90, blocks_180, blocks_270, blocks_mirror_north_south, blocks_mirror_east_west = [], [], [], [], [], []
+    # get_unique_arrays 保留首次出现的数组对象本身，据此找回对应的变换名称
+    kept = {id(arr) for arr in unique_arrays}
+    return [(name, arr) for name, arr in zip(transforms, variants) if id(arr) in kept]
+
+def augment_indexed(index, lut, transforms):
+    """
+    对 (X, Y, Z) 的特征表下标网格做 D4 变换：坐标变换作用在下标网格上，
+    属性变换只作用在 (P, 7) 的特征表上，最后每个变换只做一次查表。
+    返回与 transforms 一一对应的 (X', Y, Z', 7) 特征张量列表。
+    """
+    return [np.take(transform_attributes(lut, name), np.ascontiguousarray(transform_coordinates(index, name)), axis=0)
+            for name in transforms]
 
-    with open('metadata.txt', 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-        width, height, length = map(parse_short, lines[0].strip().split(','))
+def augment_features(features, transforms=None, with_names=False, recompute_states=False):
+    """
+    对 (X, Y, Z, 7) 特征张量做 D4 旋转/镜像增强，返回去重后的结构数组列表。
 
+    特征向量的种类通常很少：先把每个 7 字节的特征向量打包成 int64 去重，
+    再按 augment_indexed 的方式只变换去重后的特征表。
+    transforms: 变换名称列表（见 D4_TRANSFORMS），默认使用全部 8 个。
+    with_names: 为 True 时返回 (变换名称, 数组) 列表。
+    recompute_states: 为 True 时对每个变体按相邻方块重算楼梯 shape 和栅栏/玻璃板连接（见 block_states.py）。
+    """
+    transforms = list(D4_TRANSFORMS) if transforms is None else list(transforms)
+    features = np.asarray(features, dtype=np.int8)
+    packed = np.zeros(features.shape[:3] + (8,), dtype=np.int8)
+    packed[..., :FEATURE_SIZE] = features
+    keys, inverse = np.unique(packed.view(np.int64).ravel(), return_inverse=True)
+    lut = keys.view(np.int8).reshape(-1, 8)[:, :FEATURE_SIZE]
+    index = inverse.reshape(features.shape[:3])
+    variants = augment_indexed(index, lut, transforms)
+    if recompute_states:
+        variants = recompute_variants(variants)
+    return unique_variants(transforms, variants, with_names)
+
+def read_parsed_block_data(input_file, width, height, length):
+    """
+    读取 parsed_block_data.txt，返回 (X, Y, Z, 7) 的 int8 特征张量（未知方块和未出现的位置为 -1）。
+    """
+    features = np.full((width, height, length, FEATURE_SIZE), -1, dtype=np.int8)
     with open(input_file, "r", encoding="utf-8") as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
-            parts = eval(line)
-            x, y, z, (block_type, subtype, attr_vector) = parts
-
-            blocks_original.append([x, y, z, block_type, subtype] + attr_vector)
-
-            for angle in [90, 180, 270]:
-                new_x, new_y, new_z = rotate_block(x, y, z, angle, width-1, length-1)
-                new_attr_vector = rotate_attr_vector(block_type, attr_vector.copy(), angle)
-                locals()[f"blocks_{angle}"].append([new_x, new_y, new_z, block_type, subtype] + new_attr_vector)
-
-            for direction in ["north_south", "east_west"]:
-                new_x, new_y, new_z = mirror_block(x, y, z, direction, width-1, length-1)
-                new_attr_vector = mirror_attr_vector(block_type, attr_vector.copy(), direction)
-                locals()[f"blocks_mirror_{direction}"].append([new_x, new_y, new_z, block_type, subtype] + new_attr_vector)
-
-    arrays = [blocks_original, blocks_90, blocks_180, blocks_270, blocks_mirror_north_south, blocks_mirror_east_west]
-    for i in range(len(arrays)):
-        arrays[i] = sorted(arrays[i], key=lambda block: (block[0], block[1], block[2]))
-
-    original_array = np.array(blocks_original, dtype=np.int32)
-    mirror_north_south_array = np.array(blocks_mirror_north_south, dtype=np.int32)
-    mirror_east_west_array = np.array(blocks_mirror_east_west, dtype=np.int32)
-
-    original_array = original_array[np.lexsort(original_array[:, :3].T)]
-    mirror_north_south_array = mirror_north_south_array[np.lexsort(mirror_north_south_array[:, :3].T)]
-    mirror_east_west_array = mirror_east_west_array[np.lexsort(mirror_east_west_array[:, :3].T)]
-
-    if not np.array_equal(original_array, mirror_north_south_array):
-        for i in range(len(original_array)):
-            if not np.array_equal(original_array[i], mirror_north_south_array[i]):
-                print(f"原数组: {original_array[i]}")
-                print(f"南北镜像后: {mirror_north_south_array[i]}")
-    else: 
-        print("原数组与南北镜像后的数组完全一致！")
-
-    unique_arrays = get_unique_arrays(arrays)
-    for i, array in enumerate(unique_arrays):
-        array = np.array(array, dtype=np.int32)
-        max_x, max_y, max_z = array[:, 0].max(), array[:, 1].max(), array[:, 2].max()
-        structure = np.full((max_x + 1, max_y + 1, max_z + 1, 7), -1, dtype=np.int32)
-
-        for x, y, z, block_type, subtype, *attr_vector in array:
-            structure[x, y, z] = [block_type, subtype] + attr_vector
-
-        # 确保 npy 文件夹存在
-        if not os.path.exists("npy"):
-            os.makedirs("npy")
-        
-        # 保存到 npy 文件夹
-        np.save(os.path.join("npy", output_file + str(i)), structure)
-        print(f"✅ 数据成功保存到 npy/{output_file + str(i)}.npy，形状为 {structure.shape}")
-
-def compare_npy_and_txt(npy_file, input_txt, check_file):
+            x, y, z, parsed = eval(line)
+            if parsed is None:
+                continue
+            block_type, subtype, attr_vector = parsed
+            features[x, y, z] = [block_type, subtype] + attr_vector
+    return features
+
+def save_variants(structures, output_dir="npy", output_file="block_data_"):
+    """把增强后的结构数组依次保存为 output_dir/block_data_N.npy（int32）。"""
+    # 确保 npy 文件夹存在
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    with profiling.stage("save_npy") as info:
+        info["voxels"] = sum(int(np.prod(structure.shape[:3])) for structure in structures)
+        for i, structure in enumerate(structures):
+            np.save(os.path.join(output_dir, output_file + str(i)), structure.astype(np.int32))
+            print(f"✅ 数据成功保存到 {output_dir}/{output_file + str(i)}.npy，形状为 {structure.shape}")
+
+def generate_rotated_and_mirrored_data(grid=None):
     """
-    比较 .npy 文件和解析后的文本文件，检查两者是否一致。
+    生成旋转和镜像后的数据并保存到 npy 文件夹。
 
-    参数：
-    npy_file: .npy 文件路径。
-    input_txt: 解析后的文本文件路径。
-    check_file: 保存比对结果的文本文件路径。
+    grid: 可选的 VoxelGrid；为 None 时从 metadata.txt 和 parsed_block_data.txt 读取。
     """
-    # 加载 .npy 数据
-    structure = np.load(npy_file)
+    input_file = "parsed_block_data.txt"
+
+    if grid is None:
+        with open('metadata.txt', 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+            width, height, length = map(parse_short, lines[0].strip().split(','))
+        with profiling.stage("read_txt", input_file) as info:
+            info["voxels"] = width * height * length
+            features = read_parsed_block_data(input_file, width, height, length)
+        with profiling.stage("augment") as info:
+            info["voxels"] = width * height * length * len(D4_TRANSFORMS)
+            structures = augment_features(features)
+    else:
+        structures = augment_grid(grid)
+
+    save_variants(structures)
 
-    # 获取形状信息
-    W, H, D, _ = structure.shape
+# 无法识别的方块（特征为 -1）导出为空气，重新读取后得到的特征向量
+AIR_FEATURE = np.array([BLOCK_TYPE_MAP["air"]] + [-1] * (FEATURE_SIZE - 1), dtype=np.int8)
 
-    # 把 npy 文件还原为文本格式
-    reconstructed_lines = []
+def _feature_mismatches(stage, grid, expected, actual, max_report):
+    """
+    比较两个 (X, Y, Z, 7) 特征张量，返回 (不一致的数量, 前 max_report 个不一致位置的说明)。
+    期望值用 grid 中原来的方块名称表示，实际值用 decode_feature 解码后的方块状态表示。
+    """
+    if expected.shape != actual.shape:
+        return 1, [{"stage": stage, "error": f"形状不一致: {expected.shape} != {actual.shape}"}]
+    if np.array_equal(expected, actual):
+        return 0, []
+    positions = np.argwhere(np.any(expected != actual, axis=-1))
+    report = [{
+        "stage": stage,
+        "x": int(x), "y": int(y), "z": int(z),
+        "expected": grid.palette[grid.blocks[y, z, x]],
+        "actual": decode_feature(actual[x, y, z]),
+    } for x, y, z in positions[:max_report]]
+    return len(positions), report
+
+def validate_round_trip(grid, structure=None, lut=None, max_report=20, recompute_states=False):
+    """
+    检查 schem → 特征 → npy → schem 的往返是否一致，只记录不一致的位置。
 
-    # 修正遍历顺序，确保是 (x, y, z)
-    for y in range(H):
-        for z in range(D):
-            for x in range(W):
-                block_data = structure[x, y, z]
+    grid: 已经过 apply_block_fixups 的 VoxelGrid
+    structure: 保存的 'original' 结构数组（(X, Y, Z, 7)），为 None 时只检查 schem 往返
+    recompute_states: structure 是否经过 recompute_block_states，为 True 时与重算后的特征比较
+    返回 {"ok": bool, "counts": {阶段: 不一致数量}, "mismatches": [...]}，
+    mismatches 中每个阶段最多 max_report 项，方块以解码后的方块状态字符串表示。
+    """
+    lut = build_feature_lut(grid.palette) if lut is None else lut
+    # extract_features 按 [y, z, x] 排列，npy 按 [x, y, z]
+    expected = extract_features(grid, lut).transpose(2, 0, 1, 3)
+    counts = {}
+    mismatches = []
+
+    # 1. 保存的结构数组与网格直接提取的特征一致
+    if structure is not None:
+        structure = np.asarray(structure)
+        target = recompute_block_states(expected) if recompute_states else expected
+        counts["npy"], report = _feature_mismatches("npy", grid, target, structure.astype(np.int8), max_report)
+        mismatches += report
+
+    # 2. 特征 → 方块状态 → BlockData 编码/解码 → 特征，无法识别的方块应变为空气。
+    #    expected 由 lut 查表得到，逐个 palette 项解码与 decode_features 逐体素解码结果相同
+    names = [decode_feature(row) for row in lut]
+    ids = decode_block_data(encode_block_data(grid.blocks.ravel()))
+    restored = extract_features(VoxelGrid(ids.reshape(grid.shape), names)).transpose(2, 0, 1, 3)
+    round_trip = expected.copy()
+    round_trip[expected[..., 0] == -1] = AIR_FEATURE
+    counts["schem"], report = _feature_mismatches("schem", grid, round_trip, restored, max_report)
+    mismatches += report
+
+    return {"ok": not any(counts.values()), "counts": counts, "mismatches": mismatches}
+
+def print_validation(result, name=""):
+    """打印 validate_round_trip 的结果，只列出不一致的位置。"""
+    if result["ok"]:
+        print(f"✅ {name} 往返检查通过")
+        return
+    summary = "，".join(f"{stage} {count} 处" for stage, count in result["counts"].items() if count)
+    print(f"❌ {name} 往返检查发现不一致：{summary}")
+    for item in result["mismatches"]:
+        if "error" in item:
+            print(f"  [{item['stage']}] {item['error']}")
+        else:
+            print(f"  [{item['stage']}] ({item['x']}, {item['y']}, {item['z']}) "
+                  f"期望 {item['expected']}，实际 {item['actual']}")
 
-                # 不跳过 -1，保留检查完整性
-                block_type, subtype, *attr_vector = block_data
-                block_type = int(block_type)
-                subtype = int(subtype)
-                attr_vector = [int(v) for v in attr_vector]
+def check_npy_against_schem(npy_file="npy/block_data_0.npy", schem_file="WoodHouse_3.schem"):
+    """检查 npy 文件夹中的 'original' 结构与 schem 文件夹中的 .schem 是否一致。"""
+    grid = apply_block_fixups(load_schematic(os.path.join("schem", schem_file)))
+    result = validate_round_trip(grid, np.load(npy_file))
+    print_validation(result, npy_file)
+    return result
 
-                # 还原成文本行格式
-                reconstructed_line = f"({x}, {y}, {z}, ({block_type}, {subtype}, {attr_vector}))"
-                reconstructed_lines.append(reconstructed_line)
+# 是否导出调试用的文本文件和 npy 文件
+DEBUG_DUMP_TXT = False
 
-    # 读取原始文本数据
-    with open(input_txt, "r", encoding="utf-8") as f:
-        original_lines = [line.strip() for line in f.readlines()]
+# 增强后的数据追加写入的数据集目录（见 dataset_store.py）
+DATASET_DIR = "dataset"
 
-    # 比对并写入检查文件
-    with open(check_file, "w", encoding="utf-8") as f:
-        max_len = max(len(original_lines), len(reconstructed_lines))
+# 是否缓存解码后的网格和增强后的变体（见 stage_cache.py），文件未改动时不再重新处理
+USE_STAGE_CACHE = True
 
-        for i in range(max_len):
-            orig = original_lines[i] if i < len(original_lines) else "[原文件缺失行]"
-            recon = reconstructed_lines[i] if i < len(reconstructed_lines) else "[还原文件缺失行]"
+# 是否对增强后的每个变体按相邻方块重算楼梯 shape 和栅栏/玻璃板连接（见 block_states.py）
+RECOMPUTE_BLOCK_STATES = False
 
-            if orig != recon:
-                f.write(f"❌ 差异行:\n原始:   {orig}\n还原:   {recon}\n\n")
-            else:
-                f.write(f"✅ 一致行:\n{orig}\n\n")
+def save_to_dataset(named_structures, source, dataset_dir=DATASET_DIR, dedup=True):
+    """
+    把 (变换名称, 结构数组) 列表追加到数据集目录中。
 
-    print(f"检查完成，结果保存到 {check_file}")
+    dedup 为 True 时，数据集中已有同一结构（含任意旋转/镜像）的样本则跳过。
+    """
+    index = DedupIndex(os.path.join(dataset_dir, DEDUP_FILE)) if dedup else None
+    if index is not None:
+        digest = canonical_digest(structure for _, structure in named_structures)
+        if digest in index:
+            print(f"❌ {source} 与数据集中已有的结构重复（含旋转/镜像），已跳过")
+            return
+    with profiling.stage("save", source) as info, DatasetWriter(dataset_dir) as writer:
+        info["voxels"] = sum(int(np.prod(structure.shape[:3])) for _, structure in named_structures)
+        for transform, structure in named_structures:
+            writer.add(structure, source, transform)
+        total = len(writer)
+    if index is not None:
+        index.add(digest)
+        index.close()
+    print(f"✅ {len(named_structures)} 个变体已追加到 {dataset_dir}/，数据集共 {total} 个样本")
+
+def process_schem_file(schem_file, cache=None):
+    """加载、增强、检查并写入数据集，返回加载的 VoxelGrid。cache 中已有的结果直接复用。"""
+    grid = process_block_data(schem_file, dump_txt=False, cache=cache)
+    key = None if cache is None else cache.key(os.path.join("schem", schem_file))
+    structures = cached_variants(cache, key)
+    if structures is not None:
+        print(f"✅ 从缓存读取 {len(structures)} 个变体")
+    else:
+        structures = run_pipeline(grid, dump_txt=DEBUG_DUMP_TXT, with_names=True,
+                                  recompute_states=RECOMPUTE_BLOCK_STATES)
+
+        # 写入数据集前检查往返一致性（'original' 总是第一个变体）
+        with profiling.stage("validate", schem_file) as info:
+            info["voxels"] = len(grid)
+            result = validate_round_trip(apply_block_fixups(grid), structures[0][1],
+                                         recompute_states=RECOMPUTE_BLOCK_STATES)
+        print_validation(result, schem_file)
+        if not result["ok"]:
+            return grid
+        cache_variants(cache, key, structures)
+    save_to_dataset(structures, schem_file)
+
+    if DEBUG_DUMP_TXT:
+        save_variants([structure for _, structure in structures])
+    return grid
 
-def check_accuracy_of_txt2npy():
-    # 比较生成的 .npy 文件和解析后的文本文件
-    npy_file = "npy/block_data_0.npy"  # 替换为你的 .npy 文件路径
-    input_txt = "parsed_block_data.txt"  # 替换为你的解析后的文本文件路径
-    check_file = "check_txt2npy.txt"  # 替换为你的检查结果文件路径
-    compare_npy_and_txt(npy_file, input_txt, check_file)
-    
 def main():
     schem_file = "WoodHouse_3.schem"  # 替换为你的 .schem 文件路径
-    process_block_data(schem_file)
-    parse_and_process_block_data()
-    generate_rotated_and_mirrored_data()
-    
-    # 是否需要检查生成的 .npy 与 .txt 文件的一致性
-    check_accuracy_of_txt2npy()
+    # 设置环境变量 SCHEM_PROFILE=trace.json 时记录各阶段耗时（见 profiling.py）
+    trace_path, profiler = profiling.from_env()
+    cache = StageCache(salt=cache_salt(RECOMPUTE_BLOCK_STATES)) if USE_STAGE_CACHE else None
+    with profiling.activate(profiler):
+        with profiling.file(schem_file) as info:
+            info["voxels"] = len(process_schem_file(schem_file, cache))
+    if cache is not None:
+        cache.evict()
+    if profiler is not None:
+        profiler.save(trace_path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,216 @@
+"""
+流式读取 Sponge .schem 文件：边解压边解析 NBT，只保留 Width/Height/Length/Palette，
+BlockData 以固定大小的字节块逐块返回，不会像 nbtlib.load 那样把整个 NBT 树和
+ByteArray 读入内存。
+
+支持 Sponge v1/v2（字段都在根标签中）和 v3（字段在 Schematic 中，Palette 和方块数据 Data 在 Schematic.Blocks 中）。
+
+BlockData 出现在 Palette 或尺寸字段之前时，先把它写入临时文件，读完其余字段后再从临时文件返回。
+"""
+import gzip
+import struct
+import tempfile
+
+import numpy as np
+
+TAG_END = 0
+TAG_BYTE = 1
+TAG_SHORT = 2
+TAG_INT = 3
+TAG_LONG = 4
+TAG_FLOAT = 5
+TAG_DOUBLE = 6
+TAG_BYTE_ARRAY = 7
+TAG_STRING = 8
+TAG_LIST = 9
+TAG_COMPOUND = 10
+TAG_INT_ARRAY = 11
+TAG_LONG_ARRAY = 12
+
+# 定长标签的字节数
+FIXED_SIZES = {TAG_BYTE: 1, TAG_SHORT: 2, TAG_INT: 4, TAG_LONG: 8, TAG_FLOAT: 4, TAG_DOUBLE: 8}
+# 数组标签中每个元素的字节数
+ARRAY_ITEM_SIZES = {TAG_BYTE_ARRAY: 1, TAG_INT_ARRAY: 4, TAG_LONG_ARRAY: 8}
+INTEGER_FORMATS = {TAG_BYTE: ">b", TAG_SHORT: ">h", TAG_INT: ">i", TAG_LONG: ">q"}
+
+HEADER_FIELDS = ("Width", "Height", "Length", "Palette")
+# 需要进入读取的复合标签：Sponge v3 的 Schematic 和 Schematic.Blocks（Biomes 等其余复合标签直接跳过）
+NESTED_COMPOUNDS = ("Schematic", "Blocks")
+DEFAULT_CHUNK_BYTES = 1 << 16
+
+
+class _Reader:
+    """在文件对象上按字节读取 NBT 基本类型。"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def read(self, n):
+        data = self.f.read(n)
+        if len(data) != n:
+            raise ValueError("NBT 数据意外结束，文件可能已损坏")
+        return data
+
+    def skip(self, n):
+        while n > 0:
+            n -= len(self.read(min(n, DEFAULT_CHUNK_BYTES)))
+
+    def unpack(self, fmt):
+        return struct.unpack(fmt, self.read(struct.calcsize(fmt)))[0]
+
+    def string(self):
+        return self.read(self.unpack(">H")).decode("utf-8")
+
+    def integer(self, tag):
+        return self.unpack(INTEGER_FORMATS[tag])
+
+    def skip_payload(self, tag):
+        if tag in FIXED_SIZES:
+            self.skip(FIXED_SIZES[tag])
+        elif tag in ARRAY_ITEM_SIZES:
+            self.skip(self.unpack(">i") * ARRAY_ITEM_SIZES[tag])
+        elif tag == TAG_STRING:
+            self.skip(self.unpack(">H"))
+        elif tag == TAG_LIST:
+            item_tag = self.unpack(">B")
+            count = self.unpack(">i")
+            if item_tag in FIXED_SIZES:
+                self.skip(count * FIXED_SIZES[item_tag])
+            else:
+                for _ in range(count):
+                    self.skip_payload(item_tag)
+        elif tag == TAG_COMPOUND:
+            while True:
+                child = self.unpack(">B")
+                if child == TAG_END:
+                    break
+                self.skip(self.unpack(">H"))
+                self.skip_payload(child)
+        else:
+            raise ValueError(f"未知的 NBT 标签类型: {tag}")
+
+
+def _open(path):
+    """按文件头判断是否为 gzip，返回可逐块读取（边读边解压）的文件对象。"""
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    if magic == b"\x1f\x8b":
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+class SchematicStream:
+    """
+    流式打开 .schem 文件。用法：
+
+        with SchematicStream(path) as stream:
+            stream.width, stream.height, stream.length, stream.palette
+            for chunk in stream.iter_block_data():
+                ...  # chunk 为 uint8 数组
+
+    palette 为 {方块名称: ID} 字典。
+    """
+
+    def __init__(self, path, chunk_bytes=DEFAULT_CHUNK_BYTES):
+        self.path = path
+        self.chunk_bytes = chunk_bytes
+        self.width = self.height = self.length = None
+        self.palette = None
+        self.block_data_size = None
+        self._file = _open(path)
+        self._reader = _Reader(self._file)
+        self._spool = None
+        try:
+            self._read_header()
+        except Exception:
+            self.close()
+            raise
+
+    def _header_complete(self):
+        return None not in (self.width, self.height, self.length, self.palette)
+
+    def _read_header(self):
+        reader = self._reader
+        if reader.unpack(">B") != TAG_COMPOUND:
+            raise ValueError(f"{self.path} 不是 NBT 复合标签文件")
+        reader.string()
+        if self._read_fields(None):
+            return
+
+        missing = [name for name in HEADER_FIELDS if getattr(self, name.lower()) is None]
+        if self.block_data_size is None:
+            missing.append("BlockData")
+        if missing:
+            raise ValueError(f"{self.path} 缺少字段: {', '.join(missing)}")
+
+    def _read_fields(self, compound):
+        """
+        读取复合标签 compound（根标签为 None）中的字段，直到 TAG_END。
+        其余字段都已读到、BlockData 可以直接从解压流中逐块读取时返回 True，此时停在 BlockData 的数据处。
+        """
+        reader = self._reader
+        while True:
+            tag = reader.unpack(">B")
+            if tag == TAG_END:
+                return False
+            name = reader.string()
+            if name in NESTED_COMPOUNDS and tag == TAG_COMPOUND:
+                if self._read_fields(name):
+                    return True
+            elif name in ("Width", "Height", "Length") and tag in INTEGER_FORMATS:
+                # Sponge 规范中为 Short，按无符号处理，兼容写成 Int 的文件
+                setattr(self, name.lower(), reader.integer(tag) & (0xFFFF if tag == TAG_SHORT else -1))
+            elif name == "Palette" and tag == TAG_COMPOUND:
+                self.palette = self._read_palette()
+            elif (name == "BlockData" or (name == "Data" and compound == "Blocks")) and tag == TAG_BYTE_ARRAY:
+                self.block_data_size = reader.unpack(">i")
+                if self._header_complete():
+                    return True
+                self._spool_block_data()
+            else:
+                reader.skip_payload(tag)
+
+    def _read_palette(self):
+        reader = self._reader
+        palette = {}
+        while True:
+            tag = reader.unpack(">B")
+            if tag == TAG_END:
+                return palette
+            name = reader.string()
+            if tag not in INTEGER_FORMATS:
+                raise ValueError(f"Palette 项 {name} 的类型不是整数")
+            palette[name] = reader.integer(tag)
+
+    def _spool_block_data(self):
+        """BlockData 先于其他字段出现时，把它复制到临时文件中。"""
+        self._spool = tempfile.TemporaryFile()
+        remaining = self.block_data_size
+        while remaining > 0:
+            data = self._reader.read(min(remaining, self.chunk_bytes))
+            self._spool.write(data)
+            remaining -= len(data)
+        self._spool.seek(0)
+
+    def iter_block_data(self):
+        """逐块返回 BlockData 的原始字节（uint8 数组），每块最多 chunk_bytes 字节。"""
+        source = self._reader if self._spool is None else _Reader(self._spool)
+        remaining = self.block_data_size
+        while remaining > 0:
+            data = source.read(min(remaining, self.chunk_bytes))
+            remaining -= len(data)
+            yield np.frombuffer(data, dtype=np.uint8)
+
+    def close(self):
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
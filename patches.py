@@ -0,0 +1,120 @@
+"""
+把大型建筑切成固定大小的训练立方体（默认 10×10×10，与模型的输入尺寸一致）。
+
+在 palette 下标网格上用 sliding_window_view 得到全部窗口的零拷贝视图，用三维前缀和
+（summed-area table）一次算出每个窗口中非空气方块的数量，过滤掉全是或几乎全是空气的窗口，
+只有保留下来的窗口才会被复制并查表得到 (X, Y, Z, 7) 特征，整个过程没有逐窗口的 Python 循环。
+
+用法：
+    for origin, patch in iter_patches(grid, size=10, stride=5):
+        writer.add(patch, f"Church.schem@{origin[0]},{origin[1]},{origin[2]}", "original")
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from block_states import recompute_block_states
+from main import VoxelGrid, as_voxel_grid, build_feature_lut
+
+DEFAULT_PATCH_SIZE = 10
+# 非空气方块占比低于该值的窗口不保留
+DEFAULT_MIN_OCCUPANCY = 0.05
+# 每次查表转换的窗口数，限制临时特征数组的大小
+PATCH_CHUNK = 256
+
+
+def summed_area_table(mask):
+    """返回 (H+1, L+1, W+1) 的三维前缀和，sat[y, z, x] 为 mask[:y, :z, :x] 中 True 的个数。"""
+    dtype = np.int32 if mask.size < 2**31 else np.int64
+    sat = np.zeros(tuple(n + 1 for n in mask.shape), dtype=dtype)
+    inner = sat[1:, 1:, 1:]
+    np.cumsum(mask, axis=0, dtype=dtype, out=inner)
+    np.cumsum(inner, axis=1, out=inner)
+    np.cumsum(inner, axis=2, out=inner)
+    return sat
+
+
+def window_starts(length, size, stride):
+    """一个维度上的窗口起点 0, stride, 2*stride, ...；最后一个窗口与末端对齐，保证覆盖整个建筑。"""
+    starts = np.arange(0, length - size + 1, stride)
+    if starts[-1] != length - size:
+        starts = np.append(starts, length - size)
+    return starts
+
+
+def window_counts(sat, size, starts):
+    """
+    按前缀和的容斥（窗口 8 个角）一次算出所有窗口中的计数。
+    starts 为 (y 起点, z 起点, x 起点)，返回形状为三者长度的数组。
+    """
+    ys, zs, xs = starts
+
+    def corner(dy, dz, dx):
+        return sat[np.ix_(ys + dy, zs + dz, xs + dx)]
+
+    s = size
+    return (corner(s, s, s) - corner(0, s, s) - corner(s, 0, s) - corner(s, s, 0)
+            + corner(0, 0, s) + corner(0, s, 0) + corner(s, 0, 0) - corner(0, 0, 0))
+
+
+def pad_to_size(grid, size):
+    """尺寸小于 size 的维度在末端补空气，小型建筑也能得到一个完整的窗口。"""
+    pad = [max(0, size - n) for n in grid.shape]
+    if not any(pad):
+        return grid
+    palette = list(grid.palette)
+    if grid.air_block not in palette:
+        palette.append(grid.air_block)
+    blocks = np.pad(grid.blocks, [(0, n) for n in pad], constant_values=palette.index(grid.air_block))
+    return VoxelGrid(blocks, palette, air_block=grid.air_block)
+
+
+def select_patches(grid, size=DEFAULT_PATCH_SIZE, stride=None, min_occupancy=DEFAULT_MIN_OCCUPANCY):
+    """
+    返回保留窗口的起点 (K, 3)（按 (y, z, x)）和每个窗口的非空气占比 (K,)。
+
+    stride: 窗口步长，默认等于 size（互不重叠）
+    min_occupancy: 非空气方块的最低占比，至少要有一个非空气方块
+    """
+    grid = pad_to_size(as_voxel_grid(grid), size)
+    stride = stride or size
+    starts = [window_starts(n, size, stride) for n in grid.shape]
+    counts = window_counts(summed_area_table(grid.non_air_mask()), size, starts)
+    keep = np.nonzero(counts >= max(1, min_occupancy * size**3))
+    origins = np.stack([axis_starts[i] for axis_starts, i in zip(starts, keep)], axis=1)
+    return origins, counts[keep] / size**3
+
+
+def iter_patches(grid, size=DEFAULT_PATCH_SIZE, stride=None, min_occupancy=DEFAULT_MIN_OCCUPANCY, lut=None,
+                 chunk=PATCH_CHUNK, recompute_states=False):
+    """
+    逐个返回 ((x, y, z) 起点, (size, size, size, 7) int8 特征) ，特征布局与 npy 相同，即 [x, y, z]。
+
+    lut: 可选的预先构建好的特征表（见 build_feature_lut），默认按 grid.palette 构建；
+         补齐尺寸时 palette 末尾新增的空气由这里补上对应的特征
+    recompute_states: 为 True 时按窗口内的相邻方块重算楼梯 shape 和栅栏/玻璃板连接（见 block_states.py），
+                      窗口边缘上连向窗口外的栅栏/玻璃板会断开
+    保留的窗口每 chunk 个一组从视图中取出并查表，内存占用与建筑大小无关。
+    """
+    grid = pad_to_size(as_voxel_grid(grid), size)
+    if lut is None:
+        lut = build_feature_lut(grid.palette)
+    elif len(lut) < len(grid.palette):
+        # 原 palette 中没有空气时 pad_to_size 会在末尾加入空气，lut 中还没有这些项
+        lut = np.concatenate([lut, build_feature_lut(grid.palette[len(lut):])])
+    origins, _ = select_patches(grid, size, stride, min_occupancy)
+    # (Y', Z', X', size, size, size) 的零拷贝视图
+    windows = sliding_window_view(grid.blocks, (size, size, size))
+    for first in range(0, len(origins), chunk):
+        block = origins[first:first + chunk]
+        # 只有保留的窗口会被复制；(K, y, z, x, 7) → (K, x, y, z, 7)
+        features = lut[windows[block[:, 0], block[:, 1], block[:, 2]]].transpose(0, 3, 1, 2, 4)
+        for (y, z, x), patch in zip(block, features):
+            patch = np.ascontiguousarray(patch)
+            if recompute_states:
+                recompute_block_states(patch, inplace=True)
+            yield (int(x), int(y), int(z)), patch
+
+
+def patch_source(source, origin):
+    """数据集中窗口样本的来源名称：文件名@x,y,z。"""
+    return f"{source}@{origin[0]},{origin[1]},{origin[2]}"
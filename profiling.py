@@ -0,0 +1,207 @@
+"""
+流程各阶段的计时和追踪：按阶段、按文件记录墙钟时间、CPU 时间、峰值常驻内存（RSS）和体素数，
+写成 Chrome trace 格式的 JSON（可在 chrome://tracing 或 https://ui.perfetto.dev 中打开），
+并可选地对最慢的 N 个文件保存 cProfile 结果（.prof，可用 pstats / snakeviz 查看）。
+
+默认关闭，关闭时 stage() 只返回一个空的上下文管理器，几乎没有开销。开启方式：
+
+    SCHEM_PROFILE=trace.json SCHEM_PROFILE_TOP=5 python main.py
+    python batch.py schem --profile trace.json --profile-top 5
+
+代码中的用法：
+
+    with profiling.stage("load", source) as info:
+        grid = ...
+        info["voxels"] = len(grid)
+"""
+import cProfile
+import heapq
+import json
+import marshal
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows 上没有 resource 模块，不记录峰值 RSS
+    resource = None
+
+PROFILE_ENV = "SCHEM_PROFILE"
+PROFILE_TOP_ENV = "SCHEM_PROFILE_TOP"
+
+
+def peak_rss():
+    """返回当前进程到目前为止的峰值常驻内存（字节），平台不支持时返回 None。"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 上单位是字节，Linux 上是 KiB
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Profiler:
+    """
+    收集追踪事件和最慢文件的 cProfile 结果。
+
+    每个阶段记录为一个 Chrome trace 的完整事件（ph="X"），args 中包含 source、voxels、
+    cpu_seconds、peak_rss_bytes（进程到阶段结束时的峰值 RSS）和 voxels_per_second。
+    profile_top 大于 0 时 file() 会用 cProfile 记录每个文件，只保留耗时最长的 profile_top 个。
+    """
+
+    def __init__(self, profile_top=0):
+        self.profile_top = profile_top
+        self.events = []
+        # (秒数, 序号, 来源, cProfile 统计字典) 的小顶堆，序号用于打破平局
+        self.profiles = []
+        self._count = 0
+
+    @contextmanager
+    def stage(self, name, source=None, cat="stage"):
+        info = {} if source is None else {"source": source}
+        ts = time.time() * 1e6
+        start = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield info
+        finally:
+            seconds = time.perf_counter() - start
+            info["cpu_seconds"] = time.process_time() - cpu
+            info["peak_rss_bytes"] = peak_rss()
+            if info.get("voxels") and seconds > 0:
+                info["voxels_per_second"] = info["voxels"] / seconds
+            self.events.append({
+                "name": name, "cat": cat, "ph": "X", "ts": ts, "dur": seconds * 1e6,
+                "pid": os.getpid(), "tid": 0, "args": info,
+            })
+
+    @contextmanager
+    def file(self, source):
+        """整个文件的处理过程，profile_top 大于 0 时同时用 cProfile 记录。"""
+        profile = cProfile.Profile() if self.profile_top > 0 else None
+        with self.stage("file", source, cat="file") as info:
+            if profile is not None:
+                profile.enable()
+            try:
+                yield info
+            finally:
+                if profile is not None:
+                    profile.disable()
+        if profile is not None:
+            profile.create_stats()
+            self._keep_profile(self.events[-1]["dur"] / 1e6, source, profile.stats)
+
+    def _keep_profile(self, seconds, source, stats):
+        self._count += 1
+        item = (seconds, self._count, source, stats)
+        if len(self.profiles) < self.profile_top:
+            heapq.heappush(self.profiles, item)
+        elif seconds > self.profiles[0][0]:
+            heapq.heapreplace(self.profiles, item)
+
+    def to_dict(self):
+        """返回可在进程间传递的数据（见 merge）。"""
+        return {"events": self.events,
+                "profiles": [(seconds, source, stats) for seconds, _, source, stats in self.profiles]}
+
+    def merge(self, data):
+        """合并工作进程中 to_dict() 的结果。"""
+        self.events.extend(data["events"])
+        for seconds, source, stats in data["profiles"]:
+            self._keep_profile(seconds, source, stats)
+
+    def summary(self):
+        """按阶段汇总：{阶段: {"count", "seconds", "cpu_seconds", "voxels", "voxels_per_second"}}。"""
+        totals = defaultdict(lambda: {"count": 0, "seconds": 0.0, "cpu_seconds": 0.0, "voxels": 0})
+        for event in self.events:
+            total = totals[event["name"]]
+            total["count"] += 1
+            total["seconds"] += event["dur"] / 1e6
+            total["cpu_seconds"] += event["args"]["cpu_seconds"]
+            total["voxels"] += event["args"].get("voxels", 0)
+        for total in totals.values():
+            total["voxels_per_second"] = total["voxels"] / total["seconds"] if total["seconds"] > 0 else 0.0
+        return dict(totals)
+
+    def print_summary(self):
+        for name, total in sorted(self.summary().items(), key=lambda item: -item[1]["seconds"]):
+            print(f"  {name:<16} {total['count']:>6} 次  墙钟 {total['seconds']:9.3f} s  "
+                  f"CPU {total['cpu_seconds']:9.3f} s  {total['voxels_per_second'] / 1e6:8.2f} M 体素/秒")
+
+    def save(self, path):
+        """
+        把追踪事件写入 path（Chrome trace JSON，otherData 中附带按阶段的汇总），
+        cProfile 结果写入 path 同名的 _profiles 文件夹，按耗时从长到短编号。
+        """
+        trace = {"traceEvents": self.events, "displayTimeUnit": "ms", "otherData": {"summary": self.summary()}}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(trace, f, ensure_ascii=False)
+        print(f"✅ 追踪数据已保存到 {path}，共 {len(self.events)} 个事件")
+        self.print_summary()
+
+        if not self.profiles:
+            return
+        profile_dir = os.path.splitext(path)[0] + "_profiles"
+        os.makedirs(profile_dir, exist_ok=True)
+        for rank, (seconds, _, source, stats) in enumerate(sorted(self.profiles, reverse=True)):
+            name = re.sub(r"[^\w.-]+", "_", source)
+            # 与 cProfile.Profile.dump_stats 的格式相同，可直接用 pstats.Stats 读取
+            with open(os.path.join(profile_dir, f"{rank:02d}_{name}.prof"), "wb") as f:
+                marshal.dump(stats, f)
+            print(f"  cProfile：{source}（{seconds:.2f} s）")
+        print(f"✅ 最慢的 {len(self.profiles)} 个文件的 cProfile 结果已保存到 {profile_dir}/")
+
+
+class _NullStage:
+    """未开启追踪时使用的空上下文管理器。"""
+
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+_active = None
+
+
+def get_profiler():
+    """返回当前生效的 Profiler，未开启时返回 None。"""
+    return _active
+
+
+@contextmanager
+def activate(profiler):
+    """在 with 块内把 profiler 设为当前生效的 Profiler（None 表示关闭），退出时恢复原来的设置。"""
+    global _active
+    previous, _active = _active, profiler
+    try:
+        yield profiler
+    finally:
+        _active = previous
+
+
+def from_env():
+    """环境变量 SCHEM_PROFILE 设置了输出路径时返回 (路径, Profiler)，否则返回 (None, None)。"""
+    path = os.environ.get(PROFILE_ENV)
+    if not path:
+        return None, None
+    return path, Profiler(int(os.environ.get(PROFILE_TOP_ENV, "0")))
+
+
+def stage(name, source=None):
+    """记录一个阶段；未开启追踪时不做任何事。with 返回的字典中可以填入 voxels 等附加信息。"""
+    if _active is None:
+        return _NULL_STAGE
+    return _active.stage(name, source)
+
+
+def file(source):
+    """记录一个文件的完整处理过程；未开启追踪时不做任何事。"""
+    if _active is None:
+        return _NULL_STAGE
+    return _active.file(source)
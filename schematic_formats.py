@@ -0,0 +1,267 @@
+"""
+结构文件读取层：按扩展名选择读取函数，把不同格式的结构文件都解码为同样的 (blocks, palette)：
+blocks 为 (H, L, W) 的 palette 下标数组（uint16，palette 超过 65536 项时为 uint32），palette 为方块状态字符串列表，
+之后的流程（VoxelGrid、特征提取、增强）与格式无关。
+
+- .schem：Sponge v1/v2/v3，在 main 中注册（流式读取，见 nbt_stream 和 main.iter_schematic_slabs）
+- .schematic：MCEdit / Schematica 旧格式，数字 ID + data 按 legacy_blocks.json 转换为方块状态字符串
+- .litematic：Litematica，位压缩的 long 数组用 NumPy 位运算整体解包，多个区域合并到一个网格中
+
+新格式只需实现 path -> (blocks, palette) 的函数，再调用 register_reader 注册扩展名。
+
+用法：
+    blocks, palette = read_schematic("schem/house.litematic")
+"""
+import json
+import os
+
+import numpy as np
+from nbtlib import load
+
+LEGACY_BLOCKS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "legacy_blocks.json")
+AIR_BLOCK = "minecraft:air"
+UNKNOWN_BLOCK = "unknown"
+# Litematica 每次解包的方块数，限制中间数组的内存占用
+UNPACK_CHUNK = 1 << 20
+
+# 扩展名（小写，含点）-> 读取函数 path -> (blocks, palette)
+READERS = {}
+
+
+def register_reader(extension, reader):
+    """注册 extension 格式的读取函数，已注册的扩展名会被覆盖。"""
+    READERS[extension.lower()] = reader
+
+
+def schematic_extensions():
+    """返回已注册的扩展名元组。"""
+    return tuple(READERS)
+
+
+def read_schematic(path):
+    """按扩展名读取结构文件，返回 (blocks, palette)。"""
+    extension = os.path.splitext(path)[1].lower()
+    reader = READERS.get(extension)
+    if reader is None:
+        raise ValueError(f"不支持的结构文件格式: {path}（支持 {', '.join(schematic_extensions())}）")
+    return reader(path)
+
+
+def _grid_dtype(palette_size):
+    return np.uint16 if palette_size <= 2**16 else np.uint32
+
+
+def _load_legacy_table(path=LEGACY_BLOCKS_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+LEGACY = _load_legacy_table()
+# 门是上下两格：下半格保存 facing/open，上半格保存 hinge/powered，解析时需要另一半的 data
+LEGACY_DOORS = np.array([int(block_id) for block_id in LEGACY["doors"]])
+
+
+def _flag(value):
+    return "true" if value else "false"
+
+
+def legacy_state(block_id, data, partner=0):
+    """
+    把旧版数字 ID 和 data（0~15）转换为方块状态字符串（1.13 之后的命名）。
+    partner 为门另一半的 data。legacy_blocks.json 中没有的 ID 返回 None。
+
+    栅栏、玻璃板的连接方向和楼梯的 shape 在旧格式中不保存，这里取默认值，
+    需要时用 block_states.recompute_block_states 按相邻方块重算。
+    """
+    key = str(block_id)
+    facing = data & 3
+    if key in LEGACY["blocks"]:
+        name = LEGACY["blocks"][key]
+        # 取值列表按 data 取模索引，忽略树叶等方块 data 高位的标记
+        return "minecraft:" + (name if isinstance(name, str) else name[data % len(name)])
+    if key in LEGACY["colored"]:
+        return "minecraft:" + LEGACY["colored"][key].format(LEGACY["colors"][data])
+    if key in LEGACY["logs"]:
+        materials = LEGACY["logs"][key]
+        axis = data >> 2
+        # axis 为 3 时六面都是树皮
+        block = f"{materials[facing % len(materials)]}_{'wood' if axis == 3 else 'log'}"
+        return f"minecraft:{block}[axis={'yxzy'[axis]}]"
+    if key in LEGACY["stairs"]:
+        direction = ("east", "west", "south", "north")[facing]
+        half = "top" if data & 4 else "bottom"
+        return (f"minecraft:{LEGACY['stairs'][key]}_stairs"
+                f"[facing={direction},half={half},shape=straight,waterlogged=false]")
+    if key in LEGACY["slabs"] or key in LEGACY["double_slabs"]:
+        double = key in LEGACY["double_slabs"]
+        materials = (LEGACY["double_slabs"] if double else LEGACY["slabs"])[key]
+        slab_type = "double" if double else "top" if data & 8 else "bottom"
+        return f"minecraft:{materials[(data & 7) % len(materials)]}_slab[type={slab_type},waterlogged=false]"
+    if key in LEGACY["fences"]:
+        return (f"minecraft:{LEGACY['fences'][key]}_fence"
+                "[east=false,north=false,south=false,waterlogged=false,west=false]")
+    if key in LEGACY["fence_gates"]:
+        direction = ("south", "west", "north", "east")[facing]
+        return (f"minecraft:{LEGACY['fence_gates'][key]}_fence_gate"
+                f"[facing={direction},in_wall=false,open={_flag(data & 4)},powered=false]")
+    if key in LEGACY["doors"]:
+        lower, upper = (partner, data) if data & 8 else (data, partner)
+        direction = ("east", "south", "west", "north")[lower & 3]
+        return (f"minecraft:{LEGACY['doors'][key]}_door[facing={direction},half={'upper' if data & 8 else 'lower'},"
+                f"hinge={'right' if upper & 1 else 'left'},open={_flag(lower & 4)},powered={_flag(upper & 2)}]")
+    if key in LEGACY["trapdoors"]:
+        direction = ("north", "south", "west", "east")[facing]
+        return (f"minecraft:{LEGACY['trapdoors'][key]}_trapdoor[facing={direction},half={'top' if data & 8 else 'bottom'},"
+                f"open={_flag(data & 4)},powered=false,waterlogged=false]")
+    return None
+
+
+def _legacy_id_names(root):
+    """文件自带的 ID -> 方块名称映射（MCEdit-Unified 的 BlockIDs 或 Schematica 的 SchematicaMapping）。"""
+    names = {}
+    if "BlockIDs" in root:
+        names.update({int(block_id): str(name) for block_id, name in root["BlockIDs"].items()})
+    if "SchematicaMapping" in root:
+        names.update({int(block_id): str(name) for name, block_id in root["SchematicaMapping"].items()})
+    return names
+
+
+def read_mcedit(path):
+    """
+    读取 MCEdit / Schematica 的 .schematic 文件，返回 (blocks, palette)。
+
+    Blocks 为每个方块的 ID 低 8 位，AddBlocks（可选）每字节存两个方块的高 4 位（偶数下标在高半字节），
+    Data 为每个方块的 data。每种 (ID, data) 只转换一次名称，网格由查找表一次映射得到。
+    """
+    root = load(path)
+    if "Schematic" in root:
+        root = root["Schematic"]
+    missing = [name for name in ("Width", "Height", "Length", "Blocks", "Data") if name not in root]
+    if missing:
+        raise ValueError(f"{path} 不是 MCEdit .schematic 文件，缺少字段: {', '.join(missing)}")
+    width, height, length = (int(root[name]) & 0xFFFF for name in ("Width", "Height", "Length"))
+    count = width * height * length
+
+    ids = np.asarray(root["Blocks"]).view(np.uint8)[:count].astype(np.int32)
+    data = np.asarray(root["Data"]).view(np.uint8)[:count].astype(np.int32) & 0xF
+    if ids.size < count or data.size < count:
+        raise ValueError(f"{path} 的 Blocks/Data 长度不足 {count}")
+    if "AddBlocks" in root:
+        add = np.asarray(root["AddBlocks"]).view(np.uint8)
+        nibbles = np.empty(add.size * 2, dtype=np.int32)
+        nibbles[0::2] = add >> 4
+        nibbles[1::2] = add & 0xF
+        ids |= nibbles[:count] << 8
+
+    # 门的另一半：下半格取上方一格的 data，上半格取下方一格的 data
+    partner = np.zeros_like(data)
+    doors = np.isin(ids, LEGACY_DOORS)
+    if doors.any():
+        layer = width * length
+        index = np.flatnonzero(doors)
+        other = np.where(data[index] & 8, index - layer, index + layer)
+        valid = (other >= 0) & (other < count)
+        partner[index[valid]] = data[other[valid]]
+
+    # 键最多 20 位，用 bincount 找出出现过的键再查表，不需要 np.unique 排序
+    keys = (ids << 8) | (partner << 4) | data
+    used = np.flatnonzero(np.bincount(keys))
+    id_names = _legacy_id_names(root)
+    palette = []
+    for key in used.tolist():
+        block_id, block_partner, block_data = key >> 8, (key >> 4) & 0xF, key & 0xF
+        name = legacy_state(block_id, block_data, block_partner)
+        palette.append(name or id_names.get(block_id, UNKNOWN_BLOCK))
+    remap = np.zeros(used[-1] + 1 if used.size else 0, dtype=_grid_dtype(len(palette)))
+    remap[used] = np.arange(len(used))
+    return remap[keys].reshape(height, length, width), palette
+
+
+def unpack_bits(words, bits, count):
+    """
+    从紧密排列的 long 数组（每个值 bits 位，从低位开始，可以跨越两个 long）中解出 count 个值。
+
+    每 64 个值正好占 bits 个 long，组内每个值所在的 long 和位偏移都相同，只需算一次；
+    把 long 数组按组排成 (组数, bits) 后整列移位，跨越边界的值再从下一个 long 取高位，没有逐项循环。
+    """
+    words = np.asarray(words).astype(np.int64).view(np.uint64)
+    if words.size * 64 < count * bits:
+        raise ValueError(f"BlockStates 长度不足：需要 {count} 个 {bits} 位的值")
+    groups = -(-count // 64)
+    # 补齐到整数组，再多补一个 0，最后一个值也可以统一读取下一个 long
+    padded = np.zeros(groups * bits + 1, dtype=np.uint64)
+    padded[:min(words.size, padded.size)] = words[:padded.size]
+
+    bit = np.arange(64, dtype=np.uint64) * np.uint64(bits)
+    word = (bit >> np.uint64(6)).astype(np.intp)
+    offset = bit & np.uint64(63)
+    spans = offset + np.uint64(bits) > 64
+    mask = np.uint64((1 << bits) - 1)
+
+    out = np.empty(groups * 64, dtype=_grid_dtype(1 << bits))
+    step = max(1, UNPACK_CHUNK // 64)
+    for g0 in range(0, groups, step):
+        g1 = min(g0 + step, groups)
+        current = padded[g0 * bits:g1 * bits].reshape(-1, bits)
+        following = padded[g0 * bits + 1:g1 * bits + 1].reshape(-1, bits)
+        values = current[:, word] >> offset
+        values[:, spans] |= following[:, word[spans]] << (np.uint64(64) - offset[spans])
+        out[g0 * 64:g1 * 64] = (values & mask).ravel()
+    return out[:count]
+
+
+def _block_state(entry):
+    """Litematica 调色板项（Name + Properties）-> 方块状态字符串，属性按名称排序，与 Sponge 调色板一致。"""
+    name = str(entry["Name"])
+    properties = entry.get("Properties")
+    if not properties:
+        return name
+    return f"{name}[{','.join(f'{key}={properties[key]}' for key in sorted(properties))}]"
+
+
+def _region_bounds(region):
+    """返回区域的 (最小角 (x, y, z), 尺寸 (x, y, z))。Size 为负时区域从 Position 向负方向延伸。"""
+    position = np.array([int(region["Position"][axis]) for axis in "xyz"])
+    size = np.array([int(region["Size"][axis]) for axis in "xyz"])
+    return position + np.where(size < 0, size + 1, 0), np.abs(size)
+
+
+def read_litematica(path):
+    """
+    读取 Litematica 的 .litematic 文件，返回 (blocks, palette)。
+
+    每个区域的 BlockStates 按 bits = max(2, ceil(log2(调色板大小))) 位紧密排列，下标顺序为 (y, z, x)，
+    与 VoxelGrid 一致。多个区域按 Position 合并到一个网格中，调色板合并去重，没有区域覆盖的位置为空气。
+    """
+    root = load(path)
+    if "Regions" not in root or not len(root["Regions"]):
+        raise ValueError(f"{path} 不是 Litematica 文件，或者没有区域")
+
+    regions = []
+    # 合并后的调色板：方块状态字符串 -> 下标（按加入顺序）
+    index = {AIR_BLOCK: 0}
+    for region in root["Regions"].values():
+        corner, size = _region_bounds(region)
+        names = [_block_state(entry) for entry in region["BlockStatePalette"]]
+        # 区域调色板下标 -> 合并后的调色板下标
+        lut = np.array([index.setdefault(name, len(index)) for name in names], dtype=np.int64)
+        bits = max(2, (len(names) - 1).bit_length())
+        regions.append((corner, size, lut, region["BlockStates"], bits))
+    palette = list(index)
+
+    dtype = _grid_dtype(len(palette))
+    lo = np.min([corner for corner, *_ in regions], axis=0)
+    hi = np.max([corner + size for corner, size, *_ in regions], axis=0)
+    width, height, length = hi - lo
+    blocks = np.zeros((height, length, width), dtype=dtype)
+    for corner, (sx, sy, sz), lut, states, bits in regions:
+        values = unpack_bits(states, bits, int(sx * sy * sz))
+        if values.size and values.max() >= len(lut):
+            raise ValueError(f"{path} 的 BlockStates 中有超出调色板范围的下标 {values.max()}")
+        x, y, z = corner - lo
+        blocks[y:y + sy, z:z + sz, x:x + sx] = lut.astype(dtype)[values].reshape(sy, sz, sx)
+    return blocks, palette
+
+
+register_reader(".schematic", read_mcedit)
+register_reader(".litematic", read_litematica)
@@ -0,0 +1,293 @@
+"""
+结构相似度索引：判断生成的建筑是否与训练集中的某个样本几乎相同。
+
+每个结构算出一个紧凑的签名：
+- 占用位图：把非空气方块缩放到 16×16×16 的网格（每格内有方块即为 1），打包为 512 字节；
+  再每 4×4×4 格合并为一格，得到 4×4×4 的粗位图（正好一个 64 位字），用于快速初筛
+- 方块类别直方图：非空气方块中各 block_type 的占比
+- 尺寸 (X, Y, Z)
+
+查询时先对全部样本的粗位图做按位异或 + popcount（汉明距离）扫描，取出约一千个候选，
+再用细位图、直方图和尺寸的综合距离排序，10 万个样本的查询只需几毫秒。粗筛是近似的：
+粗位图相同的样本超过候选数时，其中真正最近的样本可能被漏掉。查询结构的 8 个 D4 变换
+一起比较，取最近的一个，因此只保存了 'original' 变体的数据集也能找到旋转/镜像后的近似副本。
+
+签名保存在数据集目录的 similarity.npy 中（固定长度文件头的结构化数组），新样本直接追加，
+不需要重建。
+
+用法：
+    with SimilarityIndex("dataset/similarity.npy") as index:
+        index.update(DatasetStore("dataset"))        # 只计算尚未索引的样本
+        for sample, distance, transform in index.query(structure, k=5):
+            ...
+    python similarity_index.py query dataset output.schem -k 5
+"""
+import argparse
+import contextlib
+import io
+import os
+import struct
+
+import numpy as np
+
+from dataset_store import DatasetStore
+from main import BLOCK_TYPE_MAP, D4_TRANSFORMS, extract_features, load_schematic, transform_coordinates
+
+SIMILARITY_FILE = "similarity.npy"
+# 细位图和粗位图的边长
+FINE_SIZE = 16
+COARSE_SIZE = 4
+FINE_WORDS = FINE_SIZE**3 // 64
+# 直方图的桶：无法识别的方块（-1）+ 除空气外的各个类别
+HISTOGRAM_BINS = len(BLOCK_TYPE_MAP)
+AIR = BLOCK_TYPE_MAP["air"]
+# 粗筛保留的候选数为 k 的这么多倍（至少 CANDIDATES_MIN 个）
+CANDIDATE_FACTOR = 16
+CANDIDATES_MIN = 1024
+
+SIGNATURE_DTYPE = np.dtype([
+    ("sample", "<i8"),                        # 数据集中的样本下标
+    ("shape", "<i4", (3,)),                   # (X, Y, Z)
+    ("coarse", "<u8"),                        # 4³ 粗位图
+    ("fine", "<u8", (FINE_WORDS,)),           # 16³ 细位图
+    ("histogram", "<f4", (HISTOGRAM_BINS,)),  # 非空气方块中各类别的占比
+])
+
+# similarity.npy 使用固定长度的文件头，追加签名后只需原地改写其中的长度
+NPY_HEADER_BYTES = 512
+
+# NumPy 2.0 之前没有 bitwise_count，按字节查表计算
+_bitwise_count = getattr(np, "bitwise_count", None)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _npy_header(length):
+    """生成签名数组的 .npy 1.0 文件头，总长度固定为 NPY_HEADER_BYTES。"""
+    descr = np.lib.format.dtype_to_descr(SIGNATURE_DTYPE)
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (descr, length)
+    header = header.ljust(NPY_HEADER_BYTES - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+def popcount(words):
+    """返回 uint64 数组中每个字的 1 的个数。"""
+    if _bitwise_count is not None:
+        return _bitwise_count(words)
+    return _POPCOUNT[words[..., None].view(np.uint8)].sum(axis=-1, dtype=np.uint8)
+
+
+def hamming(a, b):
+    """按最后一维（uint64 字）计算汉明距离，支持广播。"""
+    return popcount(np.bitwise_xor(a, b)).sum(axis=-1, dtype=np.int32)
+
+
+def _pool_any(mask, size):
+    """把 (X, Y, Z) 布尔数组缩放到 size³：每格内有 True 即为 True，比 size 小的维度按最近邻放大。"""
+    for axis in range(3):
+        starts = np.arange(size) * mask.shape[axis] // size
+        mask = np.logical_or.reduceat(mask, starts, axis=axis)
+    return mask
+
+
+def _pack(bits):
+    return np.packbits(bits.ravel()).view("<u8")
+
+
+def occupancy_signatures(mask):
+    """返回 (粗位图, 细位图)：一个 uint64 和一个 uint64 数组。空结构的位图全为 0。"""
+    if not mask.size:
+        return np.uint64(0), np.zeros(FINE_WORDS, dtype="<u8")
+    fine = _pool_any(mask, FINE_SIZE)
+    scale = FINE_SIZE // COARSE_SIZE
+    coarse = fine.reshape(COARSE_SIZE, scale, COARSE_SIZE, scale, COARSE_SIZE, scale).any(axis=(1, 3, 5))
+    return _pack(coarse)[0], _pack(fine)
+
+
+def type_histogram(types):
+    """返回非空气方块中各 block_type 的占比（第 0 桶为无法识别的方块），全是空气时全为 0。"""
+    counts = np.bincount(types.ravel().astype(np.intp) + 1, minlength=len(BLOCK_TYPE_MAP) + 1)
+    counts = np.delete(counts, AIR + 1)
+    total = counts.sum()
+    return (counts / total if total else counts).astype(np.float32)
+
+
+def structure_signature(structure, sample=-1):
+    """返回一个 (X, Y, Z, 7) 结构的签名（SIGNATURE_DTYPE 的一行）。"""
+    types = np.asarray(structure)[..., 0]
+    row = np.zeros((), dtype=SIGNATURE_DTYPE)
+    row["sample"] = sample
+    row["shape"] = types.shape
+    row["coarse"], row["fine"] = occupancy_signatures(types != AIR)
+    row["histogram"] = type_histogram(types)
+    return row
+
+
+def query_signatures(structure, d4=True):
+    """返回查询结构（d4 为 True 时为全部 8 个 D4 变换）的签名数组和对应的变换名称。"""
+    types = np.asarray(structure)[..., 0]
+    transforms = list(D4_TRANSFORMS) if d4 else ["original"]
+    rows = np.zeros(len(transforms), dtype=SIGNATURE_DTYPE)
+    histogram = type_histogram(types)
+    mask = types != AIR
+    for i, name in enumerate(transforms):
+        moved = transform_coordinates(mask, name)
+        rows[i]["shape"] = moved.shape
+        rows[i]["coarse"], rows[i]["fine"] = occupancy_signatures(moved)
+        rows[i]["histogram"] = histogram
+    return rows, transforms
+
+
+class SimilarityIndex:
+    """
+    持久化的结构签名索引。用法：
+
+        with SimilarityIndex("dataset/similarity.npy") as index:
+            index.add(structure, sample)              # 或 index.update(store)
+            index.query(structure, k=5)               # [(样本下标, 距离, 变换名称)]
+
+    距离在 0~1 之间，为细位图汉明距离占比、直方图总变差距离和尺寸差异（对数比）三者的平均，
+    0 表示签名完全相同。reset 为 True 时丢弃文件中已有的签名；新签名在 close() 时追加到文件末尾。
+    """
+
+    def __init__(self, path, reset=False):
+        self.path = path
+        # 尚未写入文件的签名，以及尚未并入查询数组的签名
+        self.pending = []
+        self._unmerged = []
+        if reset and os.path.exists(path):
+            os.remove(path)
+        records = np.zeros(0, dtype=SIGNATURE_DTYPE)
+        if os.path.exists(path):
+            stored = np.load(path, mmap_mode="r")
+            if stored.dtype != SIGNATURE_DTYPE or stored.offset != NPY_HEADER_BYTES:
+                raise ValueError(f"{path} 不是由 SimilarityIndex 写入的文件，签名格式可能已变化，请重建索引")
+            records = np.array(stored)
+            del stored
+        # 查询时按列扫描，各字段分别保存为连续数组
+        self.columns = {name: np.ascontiguousarray(records[name]) for name in SIGNATURE_DTYPE.names}
+
+    def _merge(self):
+        """把新增的签名并入查询用的数组。"""
+        if not self._unmerged:
+            return
+        new = np.array(self._unmerged, dtype=SIGNATURE_DTYPE)
+        self.columns = {name: np.concatenate([column, new[name]]) for name, column in self.columns.items()}
+        self._unmerged = []
+
+    def __len__(self):
+        return len(self.columns["sample"]) + len(self._unmerged)
+
+    def next_sample(self):
+        """返回下一个未索引的样本下标（已索引样本的最大下标 + 1）。"""
+        self._merge()
+        samples = self.columns["sample"]
+        return int(samples.max()) + 1 if len(samples) else 0
+
+    def add(self, structure, sample):
+        """记录数据集中第 sample 个样本的签名。"""
+        self.add_signatures([structure_signature(structure, sample)])
+
+    def add_signatures(self, rows):
+        """直接记录预先算好的签名（如批量构建时工作进程返回的签名）。"""
+        rows = list(np.asarray(rows, dtype=SIGNATURE_DTYPE))
+        self.pending.extend(rows)
+        self._unmerged.extend(rows)
+
+    def update(self, store, stop=None):
+        """为 DatasetStore 中尚未索引的样本（到 stop 为止，默认全部）计算签名，返回新增的数量。"""
+        first = self.next_sample()
+        stop = len(store) if stop is None else stop
+        for sample in range(first, stop):
+            self.add(store[sample], sample)
+        return max(0, stop - first)
+
+    def query(self, structure, k=10, d4=True):
+        """
+        返回与 (X, Y, Z, 7) 结构最相近的 k 个样本：[(样本下标, 距离, 查询结构所用的变换名称)]，按距离从小到大排列。
+        d4 为 True 时查询结构的 8 个旋转/镜像变换都参与比较，取其中最近的一个。
+        """
+        self._merge()
+        if not len(self):
+            return []
+        columns = self.columns
+        queries, transforms = query_signatures(structure, d4)
+
+        # 粗筛：4³ 粗位图的汉明距离，(变换数, 样本数) 中每个样本取最近的变换
+        coarse = popcount(columns["coarse"][None] ^ queries["coarse"][:, None]).min(axis=0)
+        count = min(len(coarse), max(k * CANDIDATE_FACTOR, CANDIDATES_MIN))
+        candidates = np.argpartition(coarse, count - 1)[:count] if count < len(coarse) else np.arange(len(coarse))
+
+        # 精排：细位图 + 直方图 + 尺寸
+        occupancy = hamming(columns["fine"][candidates][None], queries["fine"][:, None]) / (FINE_WORDS * 64)
+        histogram = 0.5 * np.abs(columns["histogram"][candidates] - queries["histogram"][0]).sum(axis=-1)
+        ratio = np.log2(np.maximum(columns["shape"][candidates][None], 1) / np.maximum(queries["shape"][:, None], 1))
+        size = np.minimum(1.0, np.abs(ratio).mean(axis=-1))
+        distances = (occupancy + histogram[None] + size) / 3
+        best = distances.argmin(axis=0)
+        distances = distances[best, np.arange(len(candidates))]
+
+        order = np.argsort(distances, kind="stable")[:k]
+        return [(int(columns["sample"][candidates[i]]), float(distances[i]), transforms[best[i]]) for i in order]
+
+    def close(self):
+        """把本次新增的签名追加写入文件。"""
+        if not self.pending:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        new = np.array(self.pending, dtype=SIGNATURE_DTYPE)
+        if os.path.exists(self.path):
+            f = open(self.path, "r+b")
+            f.seek(0, os.SEEK_END)
+        else:
+            f = open(self.path, "wb")
+            f.write(_npy_header(0))
+        with f:
+            f.write(new.tobytes())
+            length = (f.tell() - NPY_HEADER_BYTES) // SIGNATURE_DTYPE.itemsize
+            f.seek(0)
+            f.write(_npy_header(length))
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="结构相似度索引")
+    commands = parser.add_subparsers(dest="command", required=True)
+    update = commands.add_parser("update", help="为数据集中尚未索引的样本计算签名")
+    update.add_argument("dataset")
+    update.add_argument("--rebuild", action="store_true", help="丢弃已有签名，重新计算全部样本")
+    query = commands.add_parser("query", help="查找与 .schem 文件最相近的训练样本")
+    query.add_argument("dataset")
+    query.add_argument("schem_files", nargs="+")
+    query.add_argument("-k", type=int, default=5, help="返回的样本数")
+    query.add_argument("--no-d4", action="store_true", help="不比较查询结构的旋转/镜像")
+    args = parser.parse_args(argv)
+
+    store = DatasetStore(args.dataset)
+    path = os.path.join(args.dataset, SIMILARITY_FILE)
+    with SimilarityIndex(path, reset=args.command == "update" and args.rebuild) as index:
+        if args.command == "update":
+            added = index.update(store)
+            print(f"✅ 新增 {added} 个样本的签名，索引共 {len(index)} 个样本")
+            return
+        if index.update(store):
+            print(f"已为 {len(index)} 个样本建立签名")
+        for schem_file in args.schem_files:
+            with contextlib.redirect_stdout(io.StringIO()):
+                features = extract_features(load_schematic(schem_file)).transpose(2, 0, 1, 3)
+            print(f"{schem_file}：")
+            for sample, distance, transform in index.query(features, args.k, d4=not args.no_d4):
+                info = store.info(sample)
+                print(f"  {distance:.4f}  #{sample} {info['source']}（{info['transform']}，"
+                      f"{'x'.join(map(str, info['shape']))}），查询结构 {transform}")
+
+
+if __name__ == "__main__":
+    main()
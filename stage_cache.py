@@ -0,0 +1,171 @@
+"""
+按内容寻址的阶段缓存：以 .schem 文件内容的 BLAKE2b 摘要为键，保存各阶段的中间结果
+（解码后的网格、增强后的变体等），文件未改动时直接读取，不再重新解析和增强。
+
+目录结构为 cache_dir/<摘要前两位>/<摘要>/<阶段>-<盐值>.npz，盐值由流程版本和方块注册表等
+决定结果的参数算出（见 main.cache_salt），参数变化后旧条目不再命中，之后按 LRU 清理。
+每次命中都会更新条目文件的修改时间，evict() 按修改时间从旧到新删除，直到总大小不超过上限。
+
+用法：python stage_cache.py {stats,clear,invalidate,evict} [--dir .schem_cache]
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import zipfile
+
+import numpy as np
+
+CACHE_DIR = ".schem_cache"
+DEFAULT_MAX_BYTES = 4 * 2**30
+KEY_SIZE = 16
+READ_CHUNK_BYTES = 1 << 20
+
+
+def content_digest(path):
+    """返回文件内容的 16 字节 BLAKE2b 摘要（十六进制字符串），按块读取，不把整个文件读入内存。"""
+    h = hashlib.blake2b(digest_size=KEY_SIZE)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class StageCache:
+    """
+    各阶段中间结果的磁盘缓存。用法：
+
+        cache = StageCache(salt=cache_salt())
+        key = cache.key("schem/house.schem")
+        arrays = cache.get(key, "grid")       # 未命中时返回 None
+        cache.put(key, "grid", {"blocks": ..., "palette": ...})
+        cache.evict()                          # 超过 max_bytes 时删除最久未使用的条目
+
+    每个阶段保存为一个 .npz 文件（数组名称 → 数组，保持写入顺序）。写入先写临时文件再改名，
+    多个进程同时读写同一个缓存目录是安全的。
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, salt=b""):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.salt = hashlib.blake2b(salt, digest_size=8).hexdigest()
+        self.hits = 0
+        self.misses = 0
+        # (绝对路径, 大小, 修改时间) → 摘要，同一次运行中不重复读取未改动的文件
+        self._keys = {}
+
+    def key(self, path):
+        """返回文件的缓存键（内容摘要）。"""
+        stat = os.stat(path)
+        memo = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if memo not in self._keys:
+            self._keys[memo] = content_digest(path)
+        return self._keys[memo]
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _path(self, key, stage):
+        return os.path.join(self._entry_dir(key), f"{stage}-{self.salt}.npz")
+
+    def get(self, key, stage):
+        """返回缓存的 {名称: 数组} 字典，未命中时返回 None。损坏的条目会被删除并视为未命中。"""
+        path = self._path(key, stage)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, zipfile.BadZipFile):
+            self._remove(path)
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)  # 记录最近一次使用时间，供 LRU 清理
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return arrays
+
+    def put(self, key, stage, arrays):
+        """保存一个阶段的结果（{名称: 数组}），不压缩，读取时不需要解压。"""
+        path = self._path(key, stage)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    def invalidate(self, key=None):
+        """删除一个文件（缓存键）的全部条目，key 为 None 时清空整个缓存。"""
+        path = self.cache_dir if key is None else self._entry_dir(key)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def entries(self):
+        """返回全部条目文件的 (修改时间, 字节数, 路径) 列表。"""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for file_name in filenames:
+                if file_name.endswith(".npz"):
+                    path = os.path.join(dirpath, file_name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self, max_bytes=None):
+        """按最近使用时间从旧到新删除条目，直到总大小不超过 max_bytes，返回删除的条目数。"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            removed += 1
+        return removed
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            # 条目目录和前缀目录空了就一并删除
+            entry_dir = os.path.dirname(path)
+            os.rmdir(entry_dir)
+            os.rmdir(os.path.dirname(entry_dir))
+        except OSError:
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="管理 .schem 处理流程的阶段缓存")
+    parser.add_argument("--dir", default=CACHE_DIR, help=f"缓存目录，默认 {CACHE_DIR}")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="显示条目数和总大小")
+    commands.add_parser("clear", help="清空整个缓存")
+    invalidate = commands.add_parser("invalidate", help="删除指定 .schem 文件的缓存条目")
+    invalidate.add_argument("schem_files", nargs="+")
+    evict = commands.add_parser("evict", help="删除最久未使用的条目，直到总大小不超过上限")
+    evict.add_argument("--max-mb", type=float, default=DEFAULT_MAX_BYTES / 2**20, help="大小上限（MiB）")
+    args = parser.parse_args(argv)
+
+    cache = StageCache(args.dir)
+    if args.command == "stats":
+        entries = cache.entries()
+        total = sum(size for _, size, _ in entries)
+        print(f"{args.dir}/：{len(entries)} 个条目，共 {total / 2**20:.1f} MiB")
+    elif args.command == "clear":
+        cache.invalidate()
+        print(f"✅ 已清空 {args.dir}/")
+    elif args.command == "invalidate":
+        for path in args.schem_files:
+            cache.invalidate(cache.key(path))
+            print(f"✅ 已删除 {path} 的缓存条目")
+    elif args.command == "evict":
+        removed = cache.evict(int(args.max_mb * 2**20))
+        print(f"✅ 删除了 {removed} 个条目")
+
+
+if __name__ == "__main__":
+    main()
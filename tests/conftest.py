@@ -0,0 +1,21 @@
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEM_DIR = os.path.join(ROOT, "schem")
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def load():
+    """按文件名加载 schem 目录中的结构，丢弃加载时的提示信息。"""
+    import main as pipeline
+
+    def _load(file_name):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return pipeline.load_schematic(os.path.join(SCHEM_DIR, file_name))
+    return _load
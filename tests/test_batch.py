@@ -0,0 +1,33 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+
+from batch import MANIFEST_FILE, build_dataset
+from conftest import SCHEM_DIR
+from dataset_store import DatasetStore
+
+
+def build(root, output_dir, **options):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return build_dataset(str(root), str(output_dir), workers=1, cache_dir=None, **options)
+
+
+def test_append_merges_manifest(tmp_path):
+    """追加运行后 manifest 保留之前的样本和重复文件，新样本的 index 接在已有样本之后。"""
+    root, output_dir = tmp_path / "schem", tmp_path / "dataset"
+    root.mkdir()
+    for file_name in ("WoodHouse_1.schem", "WoodHouse_2.schem"):
+        shutil.copy(os.path.join(SCHEM_DIR, file_name), root)
+    first = build(root, output_dir)
+    shutil.copy(os.path.join(SCHEM_DIR, "WoodHouse_3.schem"), root)
+    second = build(root, output_dir, append=True, dedup=True)
+
+    with open(output_dir / MANIFEST_FILE, encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert manifest["samples"] == first["samples"] + second["samples"]
+    assert [sample["index"] for sample in manifest["samples"]] == list(range(len(DatasetStore(str(output_dir)))))
+    assert sorted(manifest["duplicates"]) == ["WoodHouse_1.schem", "WoodHouse_2.schem"]
+    assert manifest["files"] == 5
+    assert not [name for name in os.listdir(output_dir) if name.endswith(".tmp")]
@@ -0,0 +1,27 @@
+import contextlib
+import io
+
+from block_registry import BlockRegistry
+
+
+def test_every_stair_material_has_a_subtype():
+    """楼梯家族中的每种材质都有各不相同的 subtype，原有木材的编号不变。"""
+    registry = BlockRegistry.load()
+    stairs = registry.types["stairs"]
+    subtypes = registry.subtypes[stairs]
+    assert {name: subtypes[name] for name in ("oak_stairs", "dark_oak_stairs", "birch_stairs", "spruce_stairs")} == {
+        "oak_stairs": 0, "dark_oak_stairs": 1, "birch_stairs": 2, "spruce_stairs": 3}
+    assert sorted(subtypes.values()) == list(range(len(subtypes)))
+    names = [name for name, (block_type, _) in registry.blocks.items() if block_type == stairs]
+    assert all(registry.blocks[name][1] == subtypes[name] for name in names)
+
+
+def test_fallback_reports_each_name_once():
+    """没有列出的方块按子串匹配，同一个名称只提示一次。"""
+    registry = BlockRegistry.load()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        for _ in range(3):
+            assert registry.parse("minecraft:future_fence[east=true]")[0] == registry.types["fence"]
+            assert registry.classify("future_fence") == (registry.types["fence"], -1)
+    assert output.getvalue().count("future_fence") == 1
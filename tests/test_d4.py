@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+import main as pipeline
+from block_states import recompute_block_states
+
+WOOD_HOUSES = ["WoodHouse_1.schem", "WoodHouse_2.schem", "WoodHouse_3.schem", "WoodHouse_4.schem"]
+
+
+def features_of(grid):
+    """(X, Y, Z, 7) 特征张量，与 npy 中的布局一致。"""
+    return pipeline.extract_features(pipeline.apply_block_fixups(grid)).transpose(2, 0, 1, 3)
+
+
+@pytest.fixture(scope="module")
+def church(load):
+    return features_of(load("Church.schem"))
+
+
+@pytest.mark.parametrize("transform", list(pipeline.D4_TRANSFORMS))
+def test_transformed_states_match_neighbours(church, transform):
+    """原结构的方块状态与相邻方块一致，变换后也应一致：重算不改变任何体素。"""
+    assert np.array_equal(recompute_block_states(church), church)
+    transformed = pipeline.transform_features(church, transform)
+    assert np.array_equal(recompute_block_states(transformed), transformed)
+
+
+@pytest.mark.parametrize("file_name", WOOD_HOUSES)
+def test_recompute_commutes_with_transforms(load, file_name):
+    """对每个 D4 变换：先变换再重算与先重算再变换的结果相同。"""
+    features = features_of(load(file_name))
+    recomputed = recompute_block_states(features)
+    for transform in pipeline.D4_TRANSFORMS:
+        transformed = pipeline.transform_features(features, transform)
+        assert np.array_equal(recompute_block_states(transformed),
+                              pipeline.transform_features(recomputed, transform)), transform
+
+
+def test_rotation_and_mirror_compose(church):
+    """转 4 次回到原结构，镜像两次回到原结构。"""
+    rotated = church
+    for _ in range(4):
+        rotated = pipeline.transform_features(rotated, "rotate_90")
+    assert np.array_equal(rotated, church)
+    mirrored = pipeline.transform_features(pipeline.transform_features(church, "mirror_north_south"),
+                                           "mirror_north_south")
+    assert np.array_equal(mirrored, church)
+
+
+def test_fence_gates_keep_their_state():
+    """栅栏门不参与连接方向的重算（特征中的值保持不变），旁边的栅栏仍然连接栅栏门。"""
+    row = ["minecraft:oak_fence[east=false,north=false,south=false,waterlogged=false,west=false]",
+           "minecraft:spruce_fence_gate[facing=north,in_wall=false,open=false,powered=false]",
+           "minecraft:air"]
+    features = pipeline.REGISTRY.feature_table(row)[:, None, None]  # (X=3, Y=1, Z=1, 7)，x 从西向东
+    gate = features[1, 0, 0]
+    assert gate[0] == pipeline.BLOCK_TYPE_MAP["fence"] and gate[1] == pipeline.FENCE_GATE_SUBTYPE
+    recomputed = recompute_block_states(features)
+    assert np.array_equal(recomputed[1], features[1])
+    # 栅栏的 east 连接到东侧的栅栏门
+    assert recomputed[0, 0, 0, 2] == 1
+    assert pipeline.decode_feature(gate) == "minecraft:oak_fence_gate"
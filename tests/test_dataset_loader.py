@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import main as pipeline
+from block_states import recompute_block_states
+from dataset_loader import AugmentedDataset, DataLoader
+from dataset_store import DatasetWriter
+
+SCHEMATICS = ["Church.schem", "WoodHouse_1.schem", "WoodHouse_2.schem", "WoodHouse_3.schem", "WoodHouse_4.schem"]
+
+
+@pytest.fixture(scope="module")
+def dataset(load, tmp_path_factory):
+    """只保存 'original' 变体的数据集（与 batch.py --originals-only 相同），返回 (目录, 各样本的特征)。"""
+    path = str(tmp_path_factory.mktemp("dataset"))
+    originals = []
+    with DatasetWriter(path, append=False) as writer:
+        for file_name in SCHEMATICS:
+            grid = pipeline.apply_block_fixups(load(file_name))
+            features = pipeline.extract_features(grid).transpose(2, 0, 1, 3)
+            writer.add(features, file_name, "original")
+            originals.append(features)
+    return path, originals
+
+
+@pytest.mark.parametrize("transform", list(pipeline.D4_TRANSFORMS))
+def test_augmented_samples_are_equivariant(dataset, transform):
+    """取样时增强的结构与直接变换原结构相同，且重算方块状态与变换可交换。"""
+    path, originals = dataset
+    augmented = AugmentedDataset(path, transforms=[transform])
+    assert len(augmented) == len(originals)
+    for i, original in enumerate(originals):
+        sample, name = augmented.load(i)
+        assert name == transform
+        assert np.array_equal(sample, pipeline.transform_features(original, transform)), augmented.source(i)
+        expected = pipeline.transform_features(recompute_block_states(original), transform)
+        assert np.array_equal(recompute_block_states(sample), expected), augmented.source(i)
+
+
+def test_batches_hold_augmented_samples(dataset):
+    """DataLoader 的批次中，每个样本左下角的区域就是该样本增强后的特征，且方块状态与相邻方块一致。"""
+    path, _ = dataset
+    augmented = AugmentedDataset(path)
+    for batch in DataLoader(augmented, batch_size=2, shuffle=True, workers=2):
+        for n, i in enumerate(batch["indices"]):
+            x, y, z = batch["shapes"][n]
+            sample = batch["features"][n, :x, :y, :z]
+            assert np.array_equal(sample, augmented.load(i)[0])
+            if augmented.source(i) == "Church.schem":
+                assert np.array_equal(recompute_block_states(sample), sample), batch["transforms"][n]
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+import main as pipeline
+from dedup_index import DedupIndex, canonical_digest
+
+SCHEMATICS = ["WoodHouse_1.schem", "WoodHouse_2.schem", "WoodHouse_3.schem", "WoodHouse_4.schem"]
+
+
+# 方块状态字符串的变换，与 D4 属性表相互独立，用来构造“游戏中真实旋转/镜像后”的建筑副本。
+# 坐标旋转 (x, y, z) → (z, y, X-1-x) 使 east → north → west → south → east；镜像为 x 取反
+ROTATE_DIRECTIONS = {"north": "west", "east": "north", "south": "east", "west": "south"}
+MIRROR_DIRECTIONS = {"north": "north", "east": "west", "south": "south", "west": "east"}
+MIRROR_VALUES = {"left": "right", "right": "left", "inner_left": "inner_right", "inner_right": "inner_left",
+                 "outer_left": "outer_right", "outer_right": "outer_left"}
+
+
+def transform_state(block_state, mirrored):
+    """旋转 90 度（mirrored 为 False）或沿 x 镜像一个方块状态字符串。"""
+    name, _, properties = block_state.partition("[")
+    if not properties:
+        return block_state
+    directions = MIRROR_DIRECTIONS if mirrored else ROTATE_DIRECTIONS
+    result = {}
+    for prop in properties.rstrip("]").split(","):
+        key, value = prop.split("=", 1)
+        if key == "facing":
+            value = directions.get(value, value)
+        elif key in directions:
+            key = directions[key]
+        elif key == "axis" and not mirrored:
+            value = {"x": "z", "z": "x"}.get(value, value)
+        elif key in ("hinge", "shape") and mirrored:
+            value = MIRROR_VALUES.get(value, value)
+        result[key] = value
+    return f"{name}[{','.join(f'{key}={result[key]}' for key in sorted(result))}]"
+
+
+def transformed_copy(grid, transform):
+    """按方块状态字符串变换 palette、按 transform_coordinates 移动方块，得到建筑的旋转/镜像副本。"""
+    turns, mirrored = pipeline.D4_TRANSFORMS[transform][:2]
+    palette = list(grid.palette)
+    if mirrored:
+        palette = [transform_state(block, True) for block in palette]
+    for _ in range(turns):
+        palette = [transform_state(block, False) for block in palette]
+    blocks = pipeline.transform_coordinates(grid.blocks.transpose(2, 0, 1), transform).transpose(1, 2, 0)
+    return pipeline.VoxelGrid(np.ascontiguousarray(blocks), palette, air_block=grid.air_block)
+
+
+@pytest.mark.parametrize("file_name", SCHEMATICS)
+@pytest.mark.parametrize("recompute_states", [False, True])
+def test_rotated_and_mirrored_copies_share_canonical_digest(load, file_name, recompute_states):
+    """建筑旋转/镜像后的副本与原建筑的规范摘要相同。"""
+    grid = pipeline.apply_block_fixups(load(file_name))
+    expected = canonical_digest(pipeline.augment_grid(grid, recompute_states=recompute_states))
+    for transform in pipeline.D4_TRANSFORMS:
+        copy = transformed_copy(grid, transform)
+        assert canonical_digest(pipeline.augment_grid(copy, recompute_states=recompute_states)) == expected, \
+            transform
+
+
+def test_different_structures_have_different_digests(load):
+    digests = {canonical_digest(pipeline.augment_grid(pipeline.apply_block_fixups(load(name))))
+               for name in SCHEMATICS}
+    assert len(digests) == len(SCHEMATICS)
+
+
+def test_index_persists_digests(tmp_path):
+    path = str(tmp_path / "dedup.bin")
+    digest = canonical_digest([np.zeros((2, 2, 2, 7), dtype=np.int8)])
+    with DedupIndex(path) as index:
+        assert index.add(digest)
+        assert not index.add(digest)
+    with DedupIndex(path) as index:
+        assert digest in index
+    with DedupIndex(path, reset=True) as index:
+        assert digest not in index
@@ -0,0 +1,16 @@
+import numpy as np
+
+import main as pipeline
+from patches import iter_patches
+
+
+def test_padding_without_air_in_palette():
+    """palette 中没有空气的小建筑补齐尺寸后，传入的 lut 同样覆盖补上的空气。"""
+    grid = pipeline.VoxelGrid(np.zeros((3, 3, 3), dtype=np.uint16), ["minecraft:oak_planks"])
+    lut = pipeline.build_feature_lut(grid.palette)
+    patches = list(iter_patches(grid, size=10, lut=lut, min_occupancy=0.01))
+    assert len(patches) == 1
+    origin, patch = patches[0]
+    assert origin == (0, 0, 0) and patch.shape == (10, 10, 10, pipeline.FEATURE_SIZE)
+    assert (patch[:3, :3, :3] == lut[0]).all()
+    assert (patch[3:] == pipeline.AIR_FEATURE).all() and (patch[:, 3:] == pipeline.AIR_FEATURE).all()
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+pv = pytest.importorskip("pyvista")
+Image = pytest.importorskip("PIL.Image")
+
+import thumbnails
+
+
+def read_png(path):
+    return np.asarray(Image.open(path))
+
+
+def test_reused_plotter_renders_each_structure(load, tmp_path):
+    """同一个 Plotter 连续渲染两个不同的结构，得到两张不同的图，且与新 Plotter 渲染的结果相同。"""
+    items = [(name, str(tmp_path / f"{name}.png")) for name in ("WoodHouse_1.schem", "WoodHouse_2.schem")]
+    plotter = thumbnails.create_plotter(64)
+    try:
+        for name, path in items:
+            assert thumbnails.render_thumbnail(plotter, load(name), path)
+    finally:
+        plotter.close()
+    first, second = (read_png(path) for _, path in items)
+    assert not np.array_equal(first, second)
+
+    fresh = thumbnails.create_plotter(64)
+    try:
+        thumbnails.render_thumbnail(fresh, load("WoodHouse_2.schem"), str(tmp_path / "fresh.png"))
+    finally:
+        fresh.close()
+    assert np.array_equal(second, read_png(tmp_path / "fresh.png"))
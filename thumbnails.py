@@ -0,0 +1,179 @@
+"""
+批量离屏渲染缩略图：把目录中的每个 .schem（或数据集中的每个样本）渲染成 PNG，不打开窗口，
+在没有显示器的服务器上也可以生成数据集图库。
+
+每个工作进程只创建一个离屏 Plotter，在所有结构之间复用；每个结构合并为一个外露面网格
+（见 build_block_mesh），颜色来自固定的方块颜色表（见 block_color），不同进程、不同次运行的颜色一致。
+方块数超过 point_budget 时使用 LOD。已有且比来源新的缩略图直接跳过。
+
+用法：python thumbnails.py schem --output thumbnails --workers 8 --size 256
+      python thumbnails.py dataset --output thumbnails    # 数据集目录（含 meta.json）中的每个样本
+"""
+import argparse
+import contextlib
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pyvista as pv
+
+from batch import find_schematics
+from dataset_store import META_FILE, VOXELS_FILE, DatasetStore
+from main import DEFAULT_POINT_BUDGET, budget_block_mesh, decode_features, load_schematic
+
+THUMBNAIL_DIR = "thumbnails"
+DEFAULT_SIZE = 256
+BACKGROUND = "white"
+# 每个任务渲染的结构数
+ITEMS_PER_TASK = 32
+
+# 工作进程中复用的离屏 Plotter（见 _init_worker）和打开过的数据集
+_plotter = None
+_stores = {}
+
+
+def create_plotter(size=DEFAULT_SIZE, background=BACKGROUND):
+    """创建 size×size 的离屏 Plotter（平行投影，等轴测视角）。"""
+    plotter = pv.Plotter(off_screen=True, window_size=[size, size])
+    plotter.set_background(background)
+    plotter.enable_parallel_projection()
+    return plotter
+
+
+def render_thumbnail(plotter, grid, path, point_budget=DEFAULT_POINT_BUDGET):
+    """
+    把 VoxelGrid 渲染到 path（PNG）。plotter 中上一个结构的网格被替换，不重新创建窗口。
+    没有非空气方块时不写文件，返回 False。
+    """
+    mesh, _ = budget_block_mesh(grid, point_budget)
+    if not mesh.n_cells:
+        return False
+    # add_mesh、view_isometric 默认各自触发一次渲染，这里都关掉，换好网格、按新网格重置相机后只渲染一次。
+    # screenshot 在窗口已经渲染过之后不会重新渲染，必须显式调用 render，否则得到的是上一个结构的画面
+    plotter.add_mesh(mesh, scalars='colors', rgb=True, show_edges=False, name='structure',
+                     reset_camera=False, render=False)
+    plotter.view_isometric(render=False)
+    plotter.reset_camera(render=False, bounds=mesh.bounds)
+    plotter.render()
+    plotter.screenshot(path)
+    return True
+
+
+def _init_worker(size, background):
+    global _plotter
+    _plotter = create_plotter(size, background)
+
+
+def _load(source, item):
+    """按任务项加载 VoxelGrid：.schem 路径，或数据集中的样本下标。"""
+    if isinstance(item, int):
+        if source not in _stores:
+            _stores[source] = DatasetStore(source)
+        return decode_features(_stores[source][item])
+    return load_schematic(item)
+
+
+def render_items(source, items, size=DEFAULT_SIZE, point_budget=DEFAULT_POINT_BUDGET, background=BACKGROUND):
+    """
+    在当前进程中依次渲染一组 (任务项, 输出路径)，返回 {"rendered", "empty", "failures", "seconds"}。
+    工作进程中复用 _init_worker 创建的 Plotter，否则临时创建一个。
+    """
+    start = time.perf_counter()
+    plotter = _plotter or create_plotter(size, background)
+    rendered = 0
+    empty = []
+    failures = []
+    for item, path in items:
+        try:
+            # 加载时的提示信息在批量模式下没有意义，直接丢弃
+            with contextlib.redirect_stdout(io.StringIO()):
+                grid = _load(source, item)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            if render_thumbnail(plotter, grid, path, point_budget):
+                rendered += 1
+            else:
+                empty.append(str(item))
+        except Exception as e:
+            failures.append({"source": str(item), "error": f"{type(e).__name__}: {e}"})
+    if plotter is not _plotter:
+        plotter.close()
+    return {"rendered": rendered, "empty": empty, "failures": failures, "seconds": time.perf_counter() - start}
+
+
+def thumbnail_items(source, output_dir):
+    """
+    列出 (任务项, 输出路径, 来源修改时间)：source 为数据集目录时每个样本一项（输出 NNNNNN.png），
+    否则为其中每个 .schem 文件（输出路径与相对路径一致）。
+    """
+    if os.path.exists(os.path.join(source, META_FILE)):
+        mtime = os.path.getmtime(os.path.join(source, VOXELS_FILE))
+        return [(i, os.path.join(output_dir, f"{i:06d}.png"), mtime) for i in range(len(DatasetStore(source)))]
+    return [(path, os.path.join(output_dir, os.path.splitext(os.path.relpath(path, source))[0] + ".png"),
+             os.path.getmtime(path)) for path in find_schematics(source)]
+
+
+def render_directory(source, output_dir=THUMBNAIL_DIR, workers=None, size=DEFAULT_SIZE,
+                     point_budget=DEFAULT_POINT_BUDGET, background=BACKGROUND, overwrite=False,
+                     items_per_task=ITEMS_PER_TASK):
+    """
+    用进程池把 source（.schem 目录或数据集目录）中的每个结构渲染为 output_dir 中的 PNG，返回汇总字典。
+
+    workers: 工作进程数，默认使用全部 CPU 核心；为 1 时在当前进程中顺序渲染
+    """
+    start = time.perf_counter()
+    listed = thumbnail_items(source, output_dir)
+    # 已有且比来源新的缩略图不再渲染
+    items = [(item, path) for item, path, mtime in listed
+             if overwrite or not os.path.exists(path) or os.path.getmtime(path) < mtime]
+    chunks = [items[i:i + items_per_task] for i in range(0, len(items), items_per_task)]
+    workers = workers or os.cpu_count() or 1
+    options = (size, point_budget, background)
+
+    results = []
+    if workers == 1 or len(chunks) <= 1:
+        results = [render_items(source, chunk, *options) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(size, background)) as pool:
+            futures = [pool.submit(render_items, source, chunk, *options) for chunk in chunks]
+            for future in as_completed(futures):
+                results.append(future.result())
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        "rendered": sum(result["rendered"] for result in results),
+        "skipped": len(listed) - len(items),
+        "empty": [name for result in results for name in result["empty"]],
+        "failures": [failure for result in results for failure in result["failures"]],
+        "seconds": elapsed,
+    }
+    rate = summary["rendered"] / elapsed * 60 if elapsed > 0 else 0.0
+    print(f"✅ 渲染 {summary['rendered']} 张缩略图到 {output_dir}/，耗时 {elapsed:.1f} s（每分钟约 {rate:.0f} 张）")
+    if summary["skipped"]:
+        print(f"{summary['skipped']} 张缩略图已是最新，已跳过")
+    if summary["empty"]:
+        print(f"{len(summary['empty'])} 个结构没有非空气方块，未生成缩略图")
+    for failure in summary["failures"]:
+        print(f"❌ {failure['source']}: {failure['error']}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量离屏渲染 .schem 或数据集样本的缩略图")
+    parser.add_argument("source", help="包含结构文件（.schem/.schematic/.litematic）的目录（递归查找），或数据集目录")
+    parser.add_argument("--output", default=THUMBNAIL_DIR, help=f"输出目录，默认 {THUMBNAIL_DIR}")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数，默认使用全部 CPU 核心")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="缩略图边长（像素）")
+    parser.add_argument("--background", default=BACKGROUND, help="背景颜色")
+    parser.add_argument("--point-budget", type=int, default=DEFAULT_POINT_BUDGET,
+                        help="方块数超过该值时使用 LOD，0 表示总是渲染全部方块")
+    parser.add_argument("--overwrite", action="store_true", help="重新渲染已有的缩略图")
+    args = parser.parse_args(argv)
+    summary = render_directory(args.source, args.output, args.workers, args.size, args.point_budget or None,
+                               args.background, args.overwrite)
+    return 1 if summary["failures"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())